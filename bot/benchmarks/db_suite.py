@@ -0,0 +1,326 @@
+"""
+Бенчмарк слоя данных: все публичные методы DB на нескольких объемах данных
+и уровнях конкурентности. Каждый вызов выполняется в своем unit_of_work,
+как при обработке обновления (DBSessionMiddleware).
+
+Для каждого метода, объема и конкурентности: p50/p95/p99/среднее (мс),
+вызовов в секунду, запросов к БД на вызов и пик памяти на вызов (КиБ,
+tracemalloc, отдельный проход без конкурентности). Результаты сохраняются
+в JSON, --compare сравнивает p95 с предыдущим прогоном.
+
+Запуск из каталога bot (локальная БД, DB_URL как у бота):
+    python -m benchmarks.db_suite                          # на текущих данных
+    python -m benchmarks.db_suite --scales small,medium --truncate
+    python -m benchmarks.db_suite --compare benchmarks/results/db-old.json
+
+--scales перед каждым объемом очищает таблицы и заполняет их seed.py,
+поэтому требует --truncate.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import delete, func, select
+
+from benchmarks.load import percentile
+from models import (Cart, CartItem, Category, Order, Product,
+                    SubCategory, User)
+from seed import build_parser, seed
+from settings import db
+
+# параметры seed.py для объемов данных
+SCALES = {
+    'small': {'products': 10_000, 'users': 10_000, 'carts': 5_000,
+              'orders': 50_000},
+    'medium': {'products': 100_000, 'users': 100_000, 'carts': 50_000,
+               'orders': 500_000},
+    'large': {'products': 1_000_000, 'users': 1_000_000, 'carts': 500_000,
+              'orders': 5_000_000},
+}
+# tg_id пользователей, созданных бенчмарком add_user (удаляются в конце)
+BENCH_TG_ID = 8_000_000_000_000
+_bench_tg_ids = itertools.count(BENCH_TG_ID)
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+@dataclass
+class Sample:
+    """Пользователь с непустой корзиной и его заказ"""
+    tg_id: int
+    category_id: int
+    subcategory_id: int
+    items: list  # (message_id, product_id, quantity) как в messages_cache
+    order_id: int
+    status: str
+    payment_id: Optional[str]
+
+
+@dataclass
+class Case:
+    name: str
+    # call(sample, номер вызова, результат prepare) -> результат для cleanup
+    call: Callable[[Sample, int, Any], Awaitable]
+    prepare: Optional[Callable[[Sample], Awaitable]] = None
+    cleanup: Optional[Callable[[Sample, Any], Awaitable]] = None
+    calls: Optional[int] = None  # для тяжелых методов меньше вызовов
+
+
+async def load_samples(count: int) -> list[Sample]:
+    async with db.get_session() as session:
+        rows = (await session.execute(
+            select(User.id, User.tg_id, Cart.id)
+            .join(Cart, Cart.user_id == User.id)
+            .where(select(CartItem.id).where(CartItem.cart_id == Cart.id).exists())
+            .where(select(Order.id).where(Order.user_id == User.id).exists())
+            .order_by(User.id)
+            .limit(count)
+        )).all()
+        samples = []
+        for user_id, tg_id, cart_id in rows:
+            items = (await session.execute(
+                select(CartItem.product_id, CartItem.quantity,
+                       Product.category_id, Product.subcategory_id)
+                .join(Product, Product.id == CartItem.product_id)
+                .where(CartItem.cart_id == cart_id)
+            )).all()
+            order = (await session.execute(
+                select(Order.id, Order.status, Order.payment_id)
+                .where(Order.user_id == user_id)
+                .order_by(Order.id.desc())
+                .limit(1)
+            )).first()
+            samples.append(Sample(tg_id=tg_id,
+                                  category_id=items[0][2],
+                                  subcategory_id=items[0][3],
+                                  items=[(0, product_id, quantity)
+                                         for product_id, quantity, _, _ in items],
+                                  order_id=order[0],
+                                  status=order[1],
+                                  payment_id=order[2]))
+    if not samples:
+        raise SystemExit('Нет данных: нужны пользователи с корзиной и заказами '
+                         '(python -m seed)')
+    return samples
+
+
+async def restore_cart(sample: Sample, order_id: Optional[int] = None) -> None:
+    if order_id is not None:
+        await db.delete_order(order_id)
+    await db.save_current_quantity_in_cart(sample.tg_id, sample.items)
+
+
+async def warm_user_cache() -> int:
+    db.users.clear()
+    return await db.warm_user_cache()
+
+
+def build_cases() -> list[Case]:
+    return [
+        Case('get_user_by_tg_id', lambda s, i, _: db.get_user_by_tg_id(s.tg_id)),
+        Case('resolve_user', lambda s, i, _: db.resolve_user(s.tg_id)),
+        Case('add_user', lambda s, i, _: db.add_user(
+            User(tg_id=next(_bench_tg_ids), first_name='bench')
+        )),
+        Case('get_categories', lambda s, i, _: db.get_categories(Category)),
+        Case('get_subcategories',
+             lambda s, i, _: db.get_categories(SubCategory, s.category_id)),
+        Case('get_cart_item_qty',
+             lambda s, i, _: db.get_cart_item_qty(s.subcategory_id, s.tg_id)),
+        Case('get_cart_items_with_quantities',
+             lambda s, i, _: db.get_cart_items_with_quantities(s.tg_id)),
+        Case('save_current_quantity_in_cart',
+             lambda s, i, _: db.save_current_quantity_in_cart(s.tg_id, s.items)),
+        Case('create_order_db',
+             lambda s, i, _: db.create_order_db(s.tg_id, 'Самовывоз'),
+             cleanup=restore_cart),
+        Case('delete_order',
+             lambda s, i, order_id: db.delete_order(order_id),
+             prepare=lambda s: db.create_order_db(s.tg_id, 'Самовывоз'),
+             cleanup=lambda s, _: restore_cart(s)),
+        Case('get_orders_by_user', lambda s, i, _: db.get_orders_by_user(s.tg_id)),
+        Case('get_order_by_id', lambda s, i, _: db.get_order_by_id(s.order_id)),
+        Case('get_order_sum', lambda s, i, _: db.get_order_sum(s.order_id)),
+        Case('set_order_status',
+             lambda s, i, _: db.set_order_status(s.order_id, s.status)),
+        Case('set_order_payment_id',
+             lambda s, i, _: db.set_order_payment_id(s.order_id, s.payment_id)),
+        # платеж без заказа: поиск по частичному индексу payment_id без изменений
+        Case('settle_payment',
+             lambda s, i, _: db.settle_payment('bench-missing-payment', True)),
+        Case('get_due_payments', lambda s, i, _: db.get_due_payments(25)),
+        Case('get_all_tg_ids', lambda s, i, _: db.get_all_tg_ids(), calls=5),
+        Case('warm_user_cache', lambda s, i, _: warm_user_cache(), calls=3),
+    ]
+
+
+async def timed_call(case: Case, sample: Sample, index: int) -> tuple[float, int]:
+    """Один вызов: (мс, запросов к БД). prepare и cleanup не измеряются"""
+    state = await case.prepare(sample) if case.prepare else None
+    start = time.perf_counter()
+    async with db.unit_of_work() as session:
+        result = await case.call(sample, index, state)
+    elapsed = (time.perf_counter() - start) * 1000
+    statements = session.info['stats']['statements']
+    if case.cleanup:
+        await case.cleanup(sample, result)
+    return elapsed, statements
+
+
+async def run_case(case: Case, samples: list[Sample],
+                   concurrency: int, calls: int) -> dict:
+    calls = case.calls or calls
+    per_worker = max(calls // concurrency, 1)
+    latencies, statements = [], []
+
+    async def worker(index: int) -> None:
+        sample = samples[index % len(samples)]
+        for i in range(per_worker):
+            elapsed, count = await timed_call(case, sample, i)
+            latencies.append(elapsed)
+            statements.append(count)
+
+    await timed_call(case, samples[0], -1)  # прогрев
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    duration = time.perf_counter() - start
+    return {'calls': len(latencies),
+            'p50': round(percentile(latencies, 0.5), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'mean': round(statistics.fmean(latencies), 3),
+            'calls_per_s': round(len(latencies) / duration, 1),
+            'queries_per_call': round(statistics.fmean(statements), 2)}
+
+
+async def measure_alloc(case: Case, sample: Sample, calls: int) -> float:
+    """Средний пик памяти на вызов, КиБ"""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(min(case.calls or calls, 50)):
+            state = await case.prepare(sample) if case.prepare else None
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            async with db.unit_of_work():
+                result = await case.call(sample, 10_000 + i, state)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            if case.cleanup:
+                await case.cleanup(sample, result)
+    finally:
+        tracemalloc.stop()
+    return round(statistics.fmean(peaks) / 1024, 1)
+
+
+async def dataset_size() -> dict:
+    async with db.get_session() as session:
+        return {model.__tablename__: (await session.execute(
+                    select(func.count()).select_from(model))).scalar()
+                for model in (Product, User, CartItem, Order)}
+
+
+async def run_scale(scale: str, args: argparse.Namespace,
+                    cases: list[Case]) -> list[dict]:
+    if scale != 'current':
+        seed_args = build_parser().parse_args([])
+        vars(seed_args).update(SCALES[scale], truncate=True)
+        await seed(seed_args)
+        db.users.clear()  # идентификаторы прежнего набора данных
+    size = await dataset_size()
+    samples = await load_samples(max(args.concurrency))
+    print(f'\n{scale}: {size}')
+    print(f'{"method":32} {"conc":>5} {"p50":>8} {"p95":>8} {"p99":>8} '
+          f'{"calls/s":>9} {"q/call":>7} {"KiB":>8}')
+    results = []
+    for case in cases:
+        if args.only and case.name not in args.only:
+            continue
+        alloc_kib = await measure_alloc(case, samples[0], args.calls)
+        for concurrency in args.concurrency:
+            r = await run_case(case, samples, concurrency, args.calls)
+            r.update(method=case.name, scale=scale, dataset=size,
+                     concurrency=concurrency, alloc_kib=alloc_kib)
+            results.append(r)
+            print(f'{case.name:32} {concurrency:5} {r["p50"]:8.2f} {r["p95"]:8.2f} '
+                  f'{r["p99"]:8.2f} {r["calls_per_s"]:9.1f} '
+                  f'{r["queries_per_call"]:7.2f} {alloc_kib:8.1f}')
+    return results
+
+
+def compare(results: list[dict], path: str, threshold: float) -> None:
+    with open(path, encoding='utf-8') as f:
+        baseline = {(r['scale'], r['method'], r['concurrency']): r
+                    for r in json.load(f)['results']}
+    print(f'\nСравнение p95 с {path} (порог {threshold:.0%}):')
+    for r in results:
+        old = baseline.get((r['scale'], r['method'], r['concurrency']))
+        if not old or not old['p95']:
+            continue
+        change = r['p95'] / old['p95'] - 1
+        mark = ' <- регрессия' if change > threshold else ''
+        print(f'{r["scale"]:8} {r["method"]:32} {r["concurrency"]:5} '
+              f'{old["p95"]:8.2f} -> {r["p95"]:8.2f} ({change:+.0%}){mark}')
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+async def main(args: argparse.Namespace) -> None:
+    scales = args.scales.split(',')
+    if any(scale != 'current' for scale in scales) and not args.truncate:
+        raise SystemExit('--scales очищает таблицы, подтвердите флагом --truncate')
+    db.users.path = None  # не загружать и не сохранять кеш пользователей на диск
+    cases = build_cases()
+    results = []
+    try:
+        for scale in scales:
+            results += await run_scale(scale, args, cases)
+    finally:
+        async with db.get_session() as session:
+            await session.execute(delete(User).where(User.tg_id >= BENCH_TG_ID))
+        await db.engine.dispose()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = args.out or os.path.join(
+        RESULTS_DIR, f'db-{time.strftime("%Y%m%d-%H%M%S")}.json'
+    )
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'revision': git_revision(),
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'fast_reads': db.fast_reads is not None,
+                   'results': results}, f, indent=2, ensure_ascii=False)
+    print(f'\nРезультаты сохранены в {path}')
+    if args.compare:
+        compare(results, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='current',
+                        help=f'current или через запятую: {", ".join(SCALES)}')
+    parser.add_argument('--truncate', action='store_true',
+                        help='разрешить очистку таблиц для --scales')
+    parser.add_argument('--concurrency', type=lambda v: [int(x) for x in v.split(',')],
+                        default=[1, 10, 50], help='уровни конкурентности')
+    parser.add_argument('--calls', type=int, default=200,
+                        help='вызовов на метод и уровень конкурентности')
+    parser.add_argument('--only', type=lambda v: v.split(','),
+                        help='только перечисленные методы')
+    parser.add_argument('--out', help='файл результатов (JSON)')
+    parser.add_argument('--compare', help='предыдущие результаты для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='рост p95, считающийся регрессией')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,166 @@
+"""
+Проверка планов запросов слоя данных на объеме продакшена: каждый метод DB
+(сценарии benchmarks.db_suite) вызывается один раз, все выполненные им
+SQL-запросы перехватываются и проверяются через EXPLAIN вместе с запросами
+быстрого пути (fast_reads). Код выхода 1, если какой-либо запрос читает
+последовательным сканированием таблицу больше --min-rows строк.
+
+Запуск из каталога bot (локальная БД, DB_URL как у бота):
+    python -m seed --truncate --products 1000000 --users 1000000 --orders 5000000
+    python -m benchmarks.explain
+    python -m benchmarks.explain --scale medium --truncate  # заполнить seed.py
+"""
+import argparse
+import asyncio
+import json
+import sys
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import delete, event
+
+from benchmarks.db_suite import (BENCH_TG_ID, SCALES, Sample, build_cases,
+                                 dataset_size, load_samples)
+from fast_reads import (CART_ITEM_QTY_SQL, CART_ITEMS_SQL, ORDER_BY_ID_SQL,
+                        ORDERS_BY_USER_SQL)
+from models import User
+from seed import build_parser, seed
+from settings import db
+
+# методы, которые по назначению читают таблицу целиком
+FULL_SCANS = {'get_all_tg_ids'}
+
+# сценарий, запросы которого сейчас перехватываются
+_capturing: ContextVar[Optional[str]] = ContextVar('explain_capturing', default=None)
+
+
+def seq_scans(plan: dict) -> list[str]:
+    """Таблицы, которые план читает последовательным сканированием"""
+    tables = []
+    if plan['Node Type'] == 'Seq Scan':
+        tables.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        tables.extend(seq_scans(child))
+    return tables
+
+
+async def capture(sample: Sample) -> dict[str, list[tuple[str, tuple]]]:
+    """Запросы каждого сценария: имя -> [(SQL, параметры)]"""
+    statements: dict[str, list[tuple[str, tuple]]] = {}
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        name = _capturing.get()
+        # SAVEPOINT/RELEASE вложенных транзакций (DB.get_session) не объясняются
+        if name is None or executemany or not statement.lstrip().upper().startswith(
+                ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')):
+            return
+        queries = statements.setdefault(name, [])
+        if not any(sql == statement for sql, _ in queries):
+            queries.append((statement, tuple(parameters or ())))
+
+    engines = [db.engine] + (db.replicas.engines if db.replicas else [])
+    for engine in engines:
+        event.listen(engine.sync_engine, 'before_cursor_execute', listener)
+    fast_reads, db.fast_reads = db.fast_reads, None  # запросы ORM
+    try:
+        for case in build_cases():
+            db.users.clear()  # resolve_user тоже обращается к БД
+            state = await case.prepare(sample) if case.prepare else None
+            token = _capturing.set(case.name)
+            try:
+                async with db.unit_of_work():
+                    result = await case.call(sample, 0, state)
+            finally:
+                _capturing.reset(token)
+            if case.cleanup:
+                await case.cleanup(sample, result)
+    finally:
+        db.fast_reads = fast_reads
+        for engine in engines:
+            event.remove(engine.sync_engine, 'before_cursor_execute', listener)
+
+    user_id, cart_id = await db.resolve_user(sample.tg_id)
+    statements['fast_reads'] = [
+        (CART_ITEM_QTY_SQL, (sample.subcategory_id, cart_id)),
+        (CART_ITEMS_SQL, (cart_id,)),
+        (ORDERS_BY_USER_SQL, (user_id,)),
+        (ORDER_BY_ID_SQL, (sample.order_id,)),
+    ]
+    return statements
+
+
+async def explain(statements: dict[str, list[tuple[str, tuple]]],
+                  min_rows: int) -> list[dict]:
+    """Планы запросов, в транзакции с откатом (EXPLAIN без ANALYZE не изменяет данные)"""
+    results = []
+    async with db.engine.connect() as connection:
+        driver = (await connection.get_raw_connection()).driver_connection
+        sizes = dict(await driver.fetch(
+            "SELECT relname, reltuples::bigint FROM pg_class WHERE relkind = 'r'"
+        ))
+        transaction = driver.transaction()
+        await transaction.start()
+        try:
+            for name, queries in statements.items():
+                for sql, parameters in queries:
+                    plan = await driver.fetchval(f'EXPLAIN (FORMAT JSON) {sql}',
+                                                 *parameters)
+                    if isinstance(plan, str):  # диалект asyncpg SQLAlchemy декодирует json сам
+                        plan = json.loads(plan)
+                    plan = plan[0]['Plan']
+                    scans = [table for table in seq_scans(plan)
+                             if sizes.get(table, 0) >= min_rows]
+                    results.append({'method': name,
+                                    'sql': ' '.join(sql.split()),
+                                    'cost': plan['Total Cost'],
+                                    'seq_scans': scans,
+                                    'allowed': name in FULL_SCANS})
+        finally:
+            await transaction.rollback()
+    return results
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.scale and not args.truncate:
+        raise SystemExit('--scale очищает таблицы, подтвердите флагом --truncate')
+    db.users.path = None  # не загружать и не сохранять кеш пользователей на диск
+    try:
+        if args.scale:
+            seed_args = build_parser().parse_args([])
+            vars(seed_args).update(SCALES[args.scale], truncate=True)
+            await seed(seed_args)
+            db.users.clear()
+        print(f'Данные: {await dataset_size()}')
+        sample = (await load_samples(1))[0]
+        results = await explain(await capture(sample), args.min_rows)
+    finally:
+        async with db.get_session() as session:
+            await session.execute(delete(User).where(User.tg_id >= BENCH_TG_ID))
+        await db.engine.dispose()
+
+    failed = 0
+    for r in results:
+        if r['seq_scans'] and not r['allowed']:
+            failed += 1
+            mark = 'SEQ SCAN'
+        else:
+            mark = 'ok'
+        print(f'{mark:9} {r["method"]:32} cost={r["cost"]:<12} '
+              f'{",".join(r["seq_scans"])}')
+        if args.verbose or mark != 'ok':
+            print(f'          {r["sql"][:300]}')
+    print(f'\nЗапросов: {len(results)}, с последовательным сканированием: {failed}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES,
+                        help='очистить таблицы и заполнить объемом из db_suite')
+    parser.add_argument('--truncate', action='store_true',
+                        help='разрешить очистку таблиц для --scale')
+    parser.add_argument('--min-rows', type=int, default=10_000,
+                        help='таблицы меньше этого размера можно читать целиком')
+    parser.add_argument('--verbose', action='store_true', help='печатать SQL всех запросов')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+"""
+Сравнение быстрого пути чтения (asyncpg, dto) с ORM-путем.
+
+Запуск из каталога bot (нужна БД с данными, DB_URL как у бота):
+    python -m benchmarks.fast_reads -n 500
+
+Для каждого запроса выводится задержка (p50/p95/среднее, мс) и пик памяти,
+выделенной за один вызов (КиБ, tracemalloc).
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import select, func
+
+# settings первым: он создает DB, а модули db импортируют из settings logger
+from settings import db
+from db import DB
+from fast_reads import FastReads
+from models import CartItem, Cart, Order, Product, User
+
+
+async def pick_params(db: DB) -> dict:
+    """Пользователь с наибольшей корзиной, его подкатегория и последний заказ"""
+    async with db.get_session() as session:
+        row = (await session.execute(
+            select(User.tg_id, func.min(Product.subcategory_id))
+            .join(Cart, Cart.user_id == User.id)
+            .join(CartItem, CartItem.cart_id == Cart.id)
+            .join(Product, Product.id == CartItem.product_id)
+            .group_by(User.tg_id)
+            .order_by(func.count(CartItem.id).desc())
+            .limit(1)
+        )).first()
+        order_id = (await session.execute(select(func.max(Order.id)))).scalar()
+    if row is None or order_id is None:
+        raise SystemExit('Нет данных: нужна хотя бы одна корзина и один заказ')
+    return {'tg_id': row[0], 'subcategory_id': row[1], 'order_id': order_id}
+
+
+async def measure(call, n: int) -> dict:
+    await call()  # прогрев: подготовка statement, кеш пользователя
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(n, 100)):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        await call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    timings.sort()
+    return {'p50': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+            'mean': statistics.fmean(timings),
+            'alloc_kib': statistics.fmean(peaks) / 1024}
+
+
+async def main(n: int) -> None:
+    db.engine.sync_engine.echo = False
+    params = await pick_params(db)
+    queries = {
+        'get_cart_item_qty': lambda: db.get_cart_item_qty(
+            params['subcategory_id'], params['tg_id']),
+        'get_cart_items_with_quantities': lambda: db.get_cart_items_with_quantities(
+            params['tg_id']),
+        'get_orders_by_user': lambda: db.get_orders_by_user(params['tg_id']),
+        'get_order_by_id': lambda: db.get_order_by_id(params['order_id']),
+    }
+    print(f'{"query":32} {"path":5} {"p50":>8} {"p95":>8} {"mean":>8} {"KiB":>8}')
+    for name, call in queries.items():
+        for path, fast_reads in (('orm', None), ('fast', FastReads(db))):
+            db.fast_reads = fast_reads
+            r = await measure(call, n)
+            print(f'{name:32} {path:5} {r["p50"]:8.3f} {r["p95"]:8.3f} '
+                  f'{r["mean"]:8.3f} {r["alloc_kib"]:8.1f}')
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=500, help='вызовов на запрос')
+    asyncio.run(main(parser.parse_args().n))
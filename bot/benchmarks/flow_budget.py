@@ -0,0 +1,118 @@
+"""
+Бюджет на шаг пользовательского сценария: вызовы Bot API, запросы к БД
+и обращения к хранилищу FSM.
+
+Сценарий (/start -> каталог -> страница 2 -> +/- -> подтвердить -> доставка ->
+заказ -> оплата -> заказы -> удаление заказа) прогоняется через настоящие
+роутеры и middleware (main.setup_dispatcher). Вместо Telegram - записывающая
+сессия Bot, вместо ЮKassa - платежи в памяти (см. harness).
+
+Нужна БД с каталогом (DB_URL как у бота), в подкатегории хотя бы 6 товаров.
+Запуск из каталога bot:
+    python -m benchmarks.flow_budget            # проверка, код 1 при превышении
+    python -m benchmarks.flow_budget --record   # записать текущие значения в бюджет
+
+Бюджет - максимум на шаг, хранится в benchmarks/flow_budget.json.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from aiogram import Bot
+
+from bot_worker import payments
+from harness import (CountingStorage, FakeTelegramAPI, FakeYooKassa,
+                     RecordingSession, UpdateFactory, pick_subcategory,
+                     shop_flow)
+from main import setup_bot, setup_dispatcher
+from settings import db
+
+BUDGET_PATH = os.path.join(os.path.dirname(__file__), 'flow_budget.json')
+METRICS = ('api', 'db', 'fsm')
+
+
+class FlowRunner:
+    """Прогон шагов сценария со счетчиками на каждый шаг"""
+
+    def __init__(self, tg_id: int):
+        self.api = FakeTelegramAPI()
+        self.session = RecordingSession(self.api)
+        self.bot = setup_bot(Bot(token='42:TEST', session=self.session))
+        self.storage = CountingStorage()
+        self.dp = setup_dispatcher(storage=self.storage)
+        self.updates = UpdateFactory(tg_id, bot_user=self.api.me)
+        self.results: dict[str, dict] = {}
+
+    async def step(self, name: str, update: dict) -> list:
+        """Обработка одного обновления. Возвращает ответы Bot API за шаг"""
+        calls_before = len(self.session.calls)
+        statements_before = db.stats['statements']
+        fsm_before = sum(self.storage.ops.values())
+        await self.dp.feed_raw_update(self.bot, update)
+        calls = self.session.calls[calls_before:]
+        self.results[name] = {
+            'api': len(calls),
+            'db': db.stats['statements'] - statements_before,
+            'fsm': sum(self.storage.ops.values()) - fsm_before,
+        }
+        return [result for _, _, result in calls]
+
+
+async def run_flow(tg_id: int) -> dict[str, dict]:
+    category_id, subcategory_id = await pick_subcategory()
+    runner = FlowRunner(tg_id)
+    await shop_flow(runner.step, runner.updates, category_id, subcategory_id)
+    return runner.results
+
+
+def check(results: dict[str, dict], budget: dict[str, dict]) -> bool:
+    ok = True
+    print(f'{"step":16}' + ''.join(f'{m:>12}' for m in METRICS))
+    for name, counts in results.items():
+        limits = budget.get(name, {})
+        cells = []
+        for metric in METRICS:
+            limit = limits.get(metric)
+            over = limit is not None and counts[metric] > limit
+            ok &= not over
+            mark = '!' if over else ' '
+            cells.append(f'{counts[metric]:>5}/{limit if limit is not None else "-":<5}{mark}')
+        print(f'{name:16}' + ''.join(f'{cell:>12}' for cell in cells))
+    return ok
+
+
+async def main(tg_id: int, record: bool) -> int:
+    yookassa = await FakeYooKassa().install(payments.client)
+    try:
+        results = await run_flow(tg_id)
+    finally:
+        await yookassa.uninstall()
+        await db.engine.dispose()
+
+    if record:
+        with open(BUDGET_PATH, 'w', encoding='utf-8') as f:
+            # шаг на строку: изменение бюджета видно в diff
+            f.write('{\n' + ',\n'.join(f'  {json.dumps(name)}: {json.dumps(counts)}'
+                                       for name, counts in results.items()) + '\n}\n')
+        print(f'Бюджет записан в {BUDGET_PATH}')
+        return 0
+
+    with open(BUDGET_PATH, encoding='utf-8') as f:
+        budget = json.load(f)
+    if check(results, budget):
+        return 0
+    print('Превышен бюджет (!) - если рост ожидаем, обновите бюджет через --record')
+    return 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tg-id', type=int, default=900_000_001,
+                        help='tg_id тестового пользователя')
+    parser.add_argument('--record', action='store_true',
+                        help='записать текущие значения как бюджет')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.tg_id, args.record)))
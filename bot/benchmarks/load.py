@@ -0,0 +1,263 @@
+"""
+Нагрузочный тест: виртуальные пользователи проходят сценарий покупки
+(см. harness.shop_flow) через настоящий диспетчер (main.setup_dispatcher)
+и локальную БД, Telegram заменен локальным сервером Bot API
+(harness.FakeBotAPIServer) с задержкой ответов и ошибками 429.
+
+Запуск из каталога bot (нужна БД с каталогом, DB_URL как у бота):
+    python -m benchmarks.load --users 2000 --ramp 30
+    python -m benchmarks.load --mode webhook --api-latency 80 --rate-limit 300
+
+Отчет: пропускная способность (обновлений/с) и задержка шагов сценария
+от отправки обновления до окончания его обработки (p50/p95/p99/max, мс).
+Задержка включает доставку обновления (getUpdates или webhook).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import TelegramObject, Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from bot_worker import payments
+from harness import (FakeBotAPIServer, FakeTelegramAPI, FakeYooKassa,
+                     UpdateFactory, pick_subcategory, shop_flow)
+from main import setup_bot, setup_dispatcher
+from settings import db
+
+
+class FlowAborted(Exception):
+    """Шаг завершился ошибкой или не дождался ответа - сценарий прерван"""
+
+
+class Completion(BaseMiddleware):
+    """Окончание обработки обновлений: update_id -> future с именем ошибки"""
+
+    def __init__(self):
+        self.waiters: dict[int, asyncio.Future] = {}
+
+    def wait(self, update_id: int) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[update_id] = waiter
+        return waiter
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if isinstance(event, Update):
+                waiter = self.waiters.pop(event.update_id, None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(error)
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[tuple[str, str]] = Counter()
+        self.flows = Counter()
+
+    def record(self, step: str, elapsed: Optional[float], error: Optional[str]):
+        if elapsed is not None:
+            self.latencies[step].append(elapsed * 1000)
+        if error:
+            self.errors[step, error] += 1
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+async def virtual_user(tg_id: int,
+                       delay: float,
+                       args: argparse.Namespace,
+                       server: FakeBotAPIServer,
+                       completion: Completion,
+                       stats: LoadStats,
+                       update_ids,
+                       catalog: tuple[int, int]) -> None:
+    updates = UpdateFactory(tg_id, bot_user=server.api.me, update_ids=update_ids)
+
+    async def send(step: str, update: dict) -> list:
+        results = server.results_by_chat[tg_id]
+        start_index = len(results)
+        waiter = completion.wait(update['update_id'])
+        started = time.perf_counter()
+        await server.push(update)
+        try:
+            error = await asyncio.wait_for(waiter, args.step_timeout)
+        except asyncio.TimeoutError:
+            completion.waiters.pop(update['update_id'], None)
+            stats.record(step, None, 'timeout')
+            raise FlowAborted(step)
+        stats.record(step, time.perf_counter() - started, error)
+        if error:
+            raise FlowAborted(step)
+        # пауза пользователя между нажатиями
+        await asyncio.sleep(args.think * random.uniform(0.5, 1.5) / 1000)
+        return results[start_index:]
+
+    await asyncio.sleep(delay)
+    for _ in range(args.iterations):
+        try:
+            await shop_flow(send, updates, *catalog)
+            stats.flows['completed'] += 1
+        except FlowAborted:
+            stats.flows['aborted'] += 1
+        except Exception as e:  # например, нет кнопки из-за 429 на sendPhoto
+            stats.record('flow', None, type(e).__name__)
+            stats.flows['aborted'] += 1
+
+
+def report(stats: LoadStats, server: FakeBotAPIServer,
+           duration: float, args: argparse.Namespace) -> dict:
+    steps = {}
+    for step, values in stats.latencies.items():
+        steps[step] = {'count': len(values),
+                       'p50': round(percentile(values, 0.5), 1),
+                       'p95': round(percentile(values, 0.95), 1),
+                       'p99': round(percentile(values, 0.99), 1),
+                       'max': round(max(values), 1),
+                       'errors': sum(count for (name, _), count
+                                     in stats.errors.items() if name == step)}
+    handled = sum(item['count'] for item in steps.values())
+    api_calls = sum(count for method, count in server.calls.items()
+                    if method != 'getUpdates')
+    return {'mode': args.mode,
+            'users': args.users,
+            'duration_s': round(duration, 2),
+            'updates': handled,
+            'updates_per_s': round(handled / duration, 1),
+            'api_calls': api_calls,
+            'api_calls_per_s': round(api_calls / duration, 1),
+            'rate_limited': sum(server.rate_limited.values()),
+            'flows': dict(stats.flows),
+            'errors': {f'{step}:{error}': count
+                       for (step, error), count in stats.errors.items()},
+            'steps': steps}
+
+
+def print_report(result: dict) -> None:
+    print(f'{result["users"]} пользователей, {result["mode"]}, '
+          f'{result["duration_s"]} с, сценарии: {result["flows"]}')
+    print(f'обновлений: {result["updates"]} ({result["updates_per_s"]}/с), '
+          f'вызовов Bot API: {result["api_calls"]} ({result["api_calls_per_s"]}/с), '
+          f'429: {result["rate_limited"]}')
+    print(f'{"step":16} {"count":>7} {"p50":>8} {"p95":>8} {"p99":>8} '
+          f'{"max":>8} {"errors":>7}')
+    for step, r in result['steps'].items():
+        print(f'{step:16} {r["count"]:7} {r["p50"]:8.1f} {r["p95"]:8.1f} '
+              f'{r["p99"]:8.1f} {r["max"]:8.1f} {r["errors"]:7}')
+    if result['errors']:
+        print(f'ошибки: {result["errors"]}')
+
+
+async def main(args: argparse.Namespace) -> None:
+    yookassa = await FakeYooKassa().install(payments.client,
+                                            port=args.yookassa_port)
+    webhook_url = (f'http://127.0.0.1:{args.webhook_port}/webhook'
+                   if args.mode == 'webhook' else None)
+    server = FakeBotAPIServer(FakeTelegramAPI(),
+                              latency=args.api_latency / 1000,
+                              error_rate=args.error_rate,
+                              rate_limit=args.rate_limit,
+                              webhook_url=webhook_url)
+    base_url = await server.start(port=args.port)
+    bot = setup_bot(Bot(token='42:LOAD',
+                        session=AiohttpSession(api=TelegramAPIServer.from_base(base_url))))
+    dp = setup_dispatcher()
+    completion = Completion()
+    dp.update.outer_middleware(completion)
+
+    webhook_runner = None
+    polling_task = None
+    if webhook_url:
+        app = web.Application()
+        SimpleRequestHandler(dispatcher=dp, bot=bot,
+                             handle_in_background=True).register(app, path='/webhook')
+        setup_application(app, dp, bot=bot)
+        webhook_runner = web.AppRunner(app, access_log=None)
+        await webhook_runner.setup()
+        await web.TCPSite(webhook_runner, '127.0.0.1', args.webhook_port).start()
+    else:
+        polling_task = asyncio.create_task(dp.start_polling(
+            bot, handle_signals=False,
+            allowed_updates=dp.resolve_used_update_types()
+        ))
+
+    stats = LoadStats()
+    catalog = await pick_subcategory()
+    update_ids = itertools.count(1)
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            virtual_user(args.first_tg_id + i, args.ramp * i / args.users,
+                         args, server, completion, stats, update_ids, catalog)
+            for i in range(args.users)
+        ))
+        duration = time.perf_counter() - started
+    finally:
+        if polling_task:
+            await dp.stop_polling()
+            await polling_task
+        if webhook_runner:
+            await webhook_runner.cleanup()
+        await bot.session.close()
+        await server.stop()
+        await yookassa.uninstall()
+        await db.engine.dispose()
+
+    result = report(stats, server, duration, args)
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000,
+                        help='виртуальных пользователей')
+    parser.add_argument('--ramp', type=float, default=10,
+                        help='время подключения всех пользователей, с')
+    parser.add_argument('--iterations', type=int, default=1,
+                        help='сценариев на пользователя')
+    parser.add_argument('--think', type=float, default=500,
+                        help='пауза между нажатиями, мс (+-50%%)')
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default='polling')
+    parser.add_argument('--api-latency', type=float, default=50,
+                        help='задержка ответа Bot API, мс (+-50%%)')
+    parser.add_argument('--error-rate', type=float, default=0.001,
+                        help='доля ответов 429')
+    parser.add_argument('--rate-limit', type=int, default=0,
+                        help='вызовов Bot API в секунду до 429 (0 - без ограничения)')
+    parser.add_argument('--step-timeout', type=float, default=30,
+                        help='ожидание обработки шага, с')
+    parser.add_argument('--first-tg-id', type=int, default=910_000_000)
+    parser.add_argument('--port', type=int, default=8081,
+                        help='порт локального Bot API')
+    parser.add_argument('--yookassa-port', type=int, default=8083,
+                        help='порт локального API YooKassa')
+    parser.add_argument('--webhook-port', type=int, default=8082)
+    parser.add_argument('--json', help='сохранить отчет в JSON')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""
+Память на результаты чтения: ORM-сущности против dto.
+
+Запуск из каталога bot (нужна БД с данными, DB_URL как у бота):
+    python -m benchmarks.read_memory
+
+Берутся самая большая подкатегория и пользователь с наибольшим числом
+заказов. Для каждого варианта выводится память, удерживаемая результатом,
+и пик памяти во время запроса (КиБ, tracemalloc).
+"""
+import asyncio
+import gc
+import tracemalloc
+
+from sqlalchemy import select, func
+
+# settings первым: он создает DB, а модули db импортируют из settings logger
+from settings import db
+from db import DB
+from models import Order, Product, User
+
+
+async def pick_params(db: DB) -> dict:
+    async with db.get_session() as session:
+        subcategory_id = (await session.execute(
+            select(Product.subcategory_id)
+            .group_by(Product.subcategory_id)
+            .order_by(func.count(Product.id).desc())
+            .limit(1)
+        )).scalar()
+        tg_id = (await session.execute(
+            select(User.tg_id)
+            .join(Order, Order.user_id == User.id)
+            .group_by(User.tg_id)
+            .order_by(func.count(Order.id).desc())
+            .limit(1)
+        )).scalar()
+    if subcategory_id is None or tg_id is None:
+        raise SystemExit('Нет данных: нужны товары и заказы')
+    return {'subcategory_id': subcategory_id, 'tg_id': tg_id}
+
+
+async def measure(call) -> tuple[int, float, float]:
+    await call()  # прогрев
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    result = await call()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(result), (retained - base) / 1024, (peak - base) / 1024
+
+
+async def main() -> None:
+    db.engine.sync_engine.echo = False
+    params = await pick_params(db)
+    user_id = (await db.resolve_user(params['tg_id']))[0]
+
+    async def orm_products():
+        async with db.get_session() as session:
+            result = await session.execute(
+                select(Product)
+                .where(Product.subcategory_id == params['subcategory_id'])
+            )
+            return list(result.scalars().all())
+
+    async def orm_orders():
+        async with db.get_session() as session:
+            result = await session.execute(
+                select(Order).where(Order.user_id == user_id)
+            )
+            return list(result.scalars().all())
+
+    cases = {
+        'subcategory products / orm': orm_products,
+        'subcategory products / dto': lambda: db.get_cart_item_qty(
+            params['subcategory_id'], params['tg_id']),
+        'order history / orm': orm_orders,
+        'order history / dto': lambda: db.get_orders_by_user(params['tg_id']),
+    }
+    print(f'{"case":30} {"rows":>7} {"retained KiB":>13} {"peak KiB":>10}')
+    for name, call in cases.items():
+        rows, retained, peak = await measure(call)
+        print(f'{name:30} {rows:7} {retained:13.1f} {peak:10.1f}')
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,181 @@
+"""
+Воспроизведение записанных обновлений (см. recorder.UpdateRecorder)
+через настоящий диспетчер (main.setup_dispatcher) и локальную БД,
+Telegram заменен локальным сервером Bot API (harness.FakeBotAPIServer).
+
+Обновления подаются с исходными интервалами, ускоренными в --speed раз
+(0 - без пауз, с ограничением --concurrency одновременных обновлений).
+Обновления одного чата обрабатываются по очереди, в порядке записи,
+как при polling: иначе шаги сценариев FSM выполнились бы не по порядку.
+Задержки и 429 фейкового Bot API детерминированы через --seed.
+
+Запуск из каталога bot:
+    python -m benchmarks.replay recordings/            # 1x
+    python -m benchmarks.replay recordings/ --speed 10
+    python -m benchmarks.replay recordings/ --speed 0 --json replay.json
+
+Отчет: пропускная способность и задержка обработки по типам обновлений
+(update_label, например callback_query:subcategory_id_).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+from benchmarks.load import percentile
+from bot_worker import payments
+from bot_worker.util.helpers import update_label
+from harness import FakeBotAPIServer, FakeTelegramAPI, FakeYooKassa
+from main import setup_bot, setup_dispatcher
+from recorder import read_segments
+from settings import db
+
+
+def chat_key(update: Update) -> Optional[int]:
+    """Чат (или пользователь) обновления - ключ очереди обработки"""
+    event = update.event
+    chat = getattr(event, 'chat', None) \
+        or getattr(getattr(event, 'message', None), 'chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, 'from_user', None)
+    return user.id if user is not None else None
+
+
+async def replay(args: argparse.Namespace, bot: Bot) -> dict:
+    dp = setup_dispatcher()
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: Counter[str] = Counter()
+    tasks = set()
+    # чат -> задача его последнего обновления
+    chains: dict[int, asyncio.Task] = {}
+    max_lag = 0.0
+
+    async def handle(update: Update, previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        label = update_label(update)
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            errors[label] += 1
+        finally:
+            latencies[label].append((time.perf_counter() - started) * 1000)
+            semaphore.release()
+
+    started = loop.time()
+    first_t = last_t = None
+    count = 0
+    for t, raw in read_segments(args.path):
+        if args.limit and count >= args.limit:
+            break
+        count += 1
+        if first_t is None:
+            first_t = t
+        last_t = t
+        if args.speed:
+            scheduled = started + (t - first_t) / args.speed
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await semaphore.acquire()
+        if args.speed:
+            max_lag = max(max_lag, loop.time() - scheduled)
+        update = Update.model_validate(raw, context={'bot': bot})
+        key = chat_key(update)
+        task = asyncio.create_task(handle(update, chains.get(key)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        if key is not None:
+            chains[key] = task
+            task.add_done_callback(
+                lambda done, key=key: chains.get(key) is done and chains.pop(key)
+            )
+    await asyncio.gather(*tasks)
+    duration = loop.time() - started
+
+    return {'updates': count,
+            'speed': args.speed,
+            'recorded_s': round(last_t - first_t, 2) if count else 0,
+            'duration_s': round(duration, 2),
+            'updates_per_s': round(count / duration, 1) if duration else 0,
+            # насколько подача отставала от расписания (очередь --concurrency)
+            'max_schedule_lag_ms': round(max_lag * 1000, 1),
+            'labels': {label: {'count': len(values),
+                               'p50': round(percentile(values, 0.5), 1),
+                               'p95': round(percentile(values, 0.95), 1),
+                               'p99': round(percentile(values, 0.99), 1),
+                               'max': round(max(values), 1),
+                               'errors': errors[label]}
+                       for label, values in sorted(latencies.items())}}
+
+
+async def main(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    yookassa = await FakeYooKassa().install(payments.client,
+                                            port=args.yookassa_port)
+    server = FakeBotAPIServer(FakeTelegramAPI(),
+                              latency=args.api_latency / 1000,
+                              error_rate=args.error_rate,
+                              rate_limit=args.rate_limit)
+    base_url = await server.start(port=args.port)
+    bot = setup_bot(Bot(token='42:REPLAY',
+                        session=AiohttpSession(api=TelegramAPIServer.from_base(base_url))))
+    try:
+        result = await replay(args, bot)
+    finally:
+        await bot.session.close()
+        await server.stop()
+        await yookassa.uninstall()
+        await db.engine.dispose()
+    result['api_calls'] = sum(server.calls.values())
+    result['rate_limited'] = sum(server.rate_limited.values())
+
+    print(f'{result["updates"]} обновлений ({result["recorded_s"]} с записи) '
+          f'за {result["duration_s"]} с: {result["updates_per_s"]}/с, '
+          f'вызовов Bot API: {result["api_calls"]}, 429: {result["rate_limited"]}, '
+          f'отставание подачи: {result["max_schedule_lag_ms"]} мс')
+    print(f'{"label":40} {"count":>7} {"p50":>8} {"p95":>8} {"p99":>8} '
+          f'{"max":>8} {"errors":>7}')
+    for label, r in result['labels'].items():
+        print(f'{label:40} {r["count"]:7} {r["p50"]:8.1f} {r["p95"]:8.1f} '
+              f'{r["p99"]:8.1f} {r["max"]:8.1f} {r["errors"]:7}')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='каталог с сегментами (UPDATE_RECORD_DIR)')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='ускорение относительно записи, 0 - максимальная скорость')
+    parser.add_argument('--concurrency', type=int, default=1000,
+                        help='одновременно обрабатываемых обновлений')
+    parser.add_argument('--limit', type=int, default=0,
+                        help='воспроизвести только первые N обновлений')
+    parser.add_argument('--api-latency', type=float, default=50,
+                        help='задержка ответа Bot API, мс (+-50%%)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='доля ответов 429')
+    parser.add_argument('--rate-limit', type=int, default=0,
+                        help='вызовов Bot API в секунду до 429 (0 - без ограничения)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8081,
+                        help='порт локального Bot API')
+    parser.add_argument('--yookassa-port', type=int, default=8083,
+                        help='порт локального API YooKassa')
+    parser.add_argument('--json', help='сохранить отчет в JSON')
+    asyncio.run(main(parser.parse_args()))
@@ -3,6 +3,7 @@ from typing import Tuple
 
 from pydantic import BaseModel
 
+from metrics import BROADCAST
 from settings import db, bot, logger
 
 
@@ -14,17 +15,22 @@ async def broadcast_message(message_text: str) -> Tuple[str, list]:
     tg_ids = await db.get_all_tg_ids()
     count = 0
     errors = []
+    BROADCAST.set('total', value=len(tg_ids))
+    BROADCAST.set('sent', value=0)
+    BROADCAST.set('errors', value=0)
     for tg_id in tg_ids:
         try:
             await bot.send_message(tg_id, message_text)
             # 30 сообщений в секунду для ботов — частота запросов к API
             # 1 сообщение в секунду - частота отправки сообщений одному пользователю
             count += 1
+            BROADCAST.inc('sent')
             await asyncio.sleep(0.1)
         except Exception as e:
             err_msg = f"Ошибка отправки пользователю {tg_id}: {e}"
             logger.error(err_msg)
             errors.append(err_msg)
+            BROADCAST.inc('errors')
     return ((f'Рассылка выполнена.\n'
              f'Отправлено сообщений: {count}\n'
              f'Ошибок отправки: {len(errors)}'),
@@ -0,0 +1 @@
+from .handlers import enabled, router, loop_monitor, sampling_profiler
\ No newline at end of file
@@ -0,0 +1,78 @@
+import os
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from loop_monitor import LoopMonitor
+from sampler import SamplingProfiler
+from settings import db
+
+# отчеты раскрывают SQL и стеки, а настройки меняют работу бота:
+# роутер подключается к публичному порту API только с DEBUG_API=1
+enabled = os.getenv('DEBUG_API', '0') == '1'
+# с DEBUG_API_TOKEN запросы без заголовка X-Debug-Token отклоняются
+token = os.getenv('DEBUG_API_TOKEN') or ''
+
+
+async def check_token(x_debug_token: str = Header(default='')) -> None:
+    if token and not secrets.compare_digest(x_debug_token, token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(prefix="/api/debug", dependencies=[Depends(check_token)])
+loop_monitor = LoopMonitor()
+sampling_profiler = SamplingProfiler()
+
+
+class SamplingSettings(BaseModel):
+    enabled: Optional[bool] = None
+    threshold: Optional[float] = Field(default=None, gt=0)
+    # 0 - только профили дольше threshold (значение по умолчанию)
+    sample_rate: Optional[float] = Field(default=None, ge=0, le=1)
+    # 0 - поток сэмплера крутился бы без пауз
+    interval: Optional[float] = Field(default=None, gt=0)
+
+
+@router.get(path="/sql/")
+async def sql_report(top: int = 20):
+    """Отчет профилировщика SQL: самые затратные запросы, N+1, запросов на обновление"""
+    return db.profiler.report(top)
+
+
+@router.post(path="/sql/reset/")
+async def sql_reset():
+    db.profiler.reset()
+    return {"status": "ok"}
+
+
+@router.get(path="/loop/")
+async def loop_report():
+    """Максимальная задержка цикла событий и стеки последних блокировок"""
+    return {"max_lag": round(loop_monitor.max_lag, 4),
+            "stall_threshold": loop_monitor.stall_threshold,
+            "stalls": list(loop_monitor.stalls)}
+
+
+@router.get(path="/sampling/")
+async def sampling_status():
+    """Настройки сэмплирующего профилировщика и сохраненные профили"""
+    return sampling_profiler.status()
+
+
+@router.post(path="/sampling/")
+async def sampling_configure(request: SamplingSettings):
+    """Включение/выключение и настройка профилировщика без перезапуска"""
+    sampling_profiler.configure(**request.model_dump())
+    return sampling_profiler.status()
+
+
+@router.get(path="/sampling/{name}", response_class=PlainTextResponse)
+async def sampling_profile(name: str):
+    """Профиль в формате collapsed stacks (flamegraph.pl, speedscope)"""
+    if name not in {item["file"] for item in sampling_profiler.saved}:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    with open(os.path.join(sampling_profiler.path, name), encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from metrics import REGISTRY, DB_POOL, DB_PER_UPDATE, CATALOG_FLIGHT
+from settings import db
+
+router = APIRouter()
+
+
+def collect_db_metrics() -> None:
+    """Снимок счетчиков DB на момент выгрузки метрик"""
+    for pool, stats in db.pool_stats().items():
+        for stat, value in stats.items():
+            DB_POOL.set(pool, stat, value=value)
+    for stat, value in db.stats_per_update().items():
+        DB_PER_UPDATE.set(stat, value=value)
+    for stat, value in db.catalog_flight.stats.items():
+        CATALOG_FLIGHT.set(stat, value=value)
+
+
+REGISTRY.collectors.append(collect_db_metrics)
+
+
+@router.get(path="/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(),
+                             media_type="text/plain; version=0.0.4")
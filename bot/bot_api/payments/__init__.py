@@ -0,0 +1 @@
+from .handlers import router
\ No newline at end of file
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Request
+
+from bot_api.payments.services import (PaymentNotification, client_ip,
+                                       handle_notification, is_trusted)
+from settings import logger
+
+router = APIRouter(prefix="/api/payments")
+
+
+@router.post(path="/yookassa/")
+async def yookassa_notification(notification: PaymentNotification,
+                                request: Request):
+    """
+    HTTP-уведомления YooKassa (payment.succeeded, payment.canceled).
+    Ответ не 200 - YooKassa повторит уведомление позже.
+    """
+    ip = client_ip(request)
+    if not is_trusted(ip):
+        logger.warning(f'yookassa_notification: untrusted address {ip}')
+        raise HTTPException(status_code=403, detail="Forbidden")
+    try:
+        result = await handle_notification(notification)
+    except Exception as e:
+        logger.error(f'yookassa_notification: {e}')
+        raise HTTPException(status_code=502, detail="Payment check failed")
+    return {"status": "ok", "result": result}
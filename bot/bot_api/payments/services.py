@@ -0,0 +1,94 @@
+import ipaddress
+import os
+from typing import Optional
+
+from fastapi import Request
+from pydantic import BaseModel
+from yookassa.domain.common.security_helper import SecurityHelper
+from yookassa.domain.exceptions import NotFoundError
+
+from bot_worker.payments.handlers import worker as payment_worker
+from bot_worker.payments.services import TERMINAL_STATUSES
+from metrics import PAYMENT_NOTIFICATIONS
+from settings import db
+
+# события, которые меняют заказ
+EVENTS = ('payment.succeeded', 'payment.canceled')
+# адреса, принимаемые помимо сетей YooKassa (например, локальный мок),
+# через запятую: 127.0.0.1,10.0.0.0/8
+EXTRA_TRUSTED = [ipaddress.ip_network(value.strip()) for value
+                 in os.getenv('YOOKASSA_WEBHOOK_TRUSTED', '').split(',')
+                 if value.strip()]
+# бот за обратным прокси: адрес клиента берется из X-Forwarded-For
+BEHIND_PROXY = os.getenv('YOOKASSA_WEBHOOK_PROXY', '0') == '1'
+
+
+class PaymentNotification(BaseModel):
+    type: str
+    event: str
+    object: dict
+
+
+def client_ip(request: Request) -> Optional[str]:
+    if BEHIND_PROXY:
+        forwarded = request.headers.get('x-forwarded-for', '')
+        if forwarded:
+            # последний адрес добавлен нашим прокси, остальные - клиентом
+            return forwarded.split(',')[-1].strip()
+    return request.client.host if request.client else None
+
+
+def is_trusted(ip: Optional[str]) -> bool:
+    """Уведомление пришло из сетей YooKassa"""
+    if not ip:
+        return False
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    if any(address in network for network in EXTRA_TRUSTED):
+        return True
+    return SecurityHelper().is_ip_trusted(ip)
+
+
+def metadata_order_id(metadata: Optional[dict]) -> Optional[int]:
+    try:
+        return int((metadata or {})['order_id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+async def handle_notification(notification: PaymentNotification) -> str:
+    """
+    Обработка уведомления о платеже. Тело уведомления не используется:
+    платеж запрашивается у YooKassa повторно. Успешный платеж применяется
+    к заказу из его metadata с проверкой суммы (PaymentWorker.settle_succeeded).
+    Результат: paid, canceled, pending, duplicate, unknown, ignored,
+    mismatch, double_charge, orphan.
+    """
+    payment_id = notification.object.get('id')
+    if notification.event not in EVENTS or not payment_id:
+        result = 'ignored'
+    else:
+        try:
+            payment = await payment_worker.fetch_payment(payment_id)
+        except NotFoundError:
+            payment = None
+        if payment is None:
+            result = 'unknown'
+        elif payment.status not in TERMINAL_STATUSES:
+            result = 'pending'
+        elif payment.status == 'succeeded':
+            result = await payment_worker.settle_succeeded(
+                payment, metadata_order_id(payment.metadata)
+            )
+            await db.drop_payments([payment_id])
+        else:
+            settled = await db.settle_payment(payment_id, False)
+            if settled is None:
+                result = 'duplicate'
+            else:
+                result = 'canceled'
+                await payment_worker.notify_user(*settled, False)
+    PAYMENT_NOTIFICATIONS.inc(notification.event, result)
+    return result
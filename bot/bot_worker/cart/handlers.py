@@ -6,7 +6,7 @@ from .services import CartWorker
 from settings import db
 
 
-router = Router()
+router = Router(name='cart')
 worker = CartWorker(db)
 
 
@@ -5,7 +5,7 @@ from aiogram.fsm.context import FSMContext
 from .services import faq, inline_faq_handler
 
 
-router = Router()
+router = Router(name='faq')
 
 @router.callback_query(F.data == "faq")
 async def faq_handler(callback: CallbackQuery) -> None:
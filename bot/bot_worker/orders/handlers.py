@@ -6,7 +6,7 @@ from .services import OrderWorker
 from bot_worker.orders.services import Form
 from settings import db
 
-router = Router()
+router = Router(name='orders')
 worker = OrderWorker(db)
 
 
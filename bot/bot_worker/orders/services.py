@@ -3,7 +3,6 @@ from aiogram.fsm.context import FSMContext
 from aiogram import Bot
 from aiogram.fsm.state import State, StatesGroup
 
-from bot_worker.payments.handlers import worker as payment_worker
 from bot_worker.start_menu.handlers import worker as start_menu_worker
 from bot_worker.util.helpers import cache_handling, kb_builder
 from db import DB
@@ -87,16 +86,10 @@ class OrderWorker:
 
         message_text = "Ваши заказы:\n"
         kb_values = []
+        # статусы платежей обновляют уведомления YooKassa и фоновая сверка
         for order in orders:
-            if order.payment_id:
-                # проверка оплаты при входе в раздел Заказы
-                # проверка выполняется тут так как после перехода на страницу оплаты
-                # колбек не выполняется и далее проще поймать пользователя
-                # в разделе Заказы
-                status = await payment_worker.check_pay(order.payment_id, order.id)
-            else:
-                status = order.status
-            kb_values.append([{"text": f"Заказ #{order.id} - {status}",
+            kb_values.append([{"text": f"Заказ #{order.id} - {order.total} руб. - "
+                                       f"{order.status}",
                                "callback_data": f"order_{order.id}"}])
 
         kb_values.append(
@@ -132,6 +125,7 @@ class OrderWorker:
 
         kb = await kb_builder(kb_values=kb_values)
         await callback.message.edit_text(
-            f"Заказ #{order_id}. Выберите действие:",
+            f"Заказ #{order_id}: товаров {order.items_count}, "
+            f"сумма {order.total} руб.\nВыберите действие:",
             reply_markup=kb
         )
@@ -1 +1 @@
-from .handlers import router
+from .handlers import router, reconciler, client
\ No newline at end of file
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import random
+import uuid
+from typing import Optional
+
+from aiohttp import BasicAuth, ClientError, ClientSession, ClientTimeout, TCPConnector
+from yookassa.domain.exceptions import (ApiError, BadRequestError, ForbiddenError,
+                                        NotFoundError, ResponseProcessingError,
+                                        TooManyRequestsError, UnauthorizedError)
+from yookassa.domain.response import PaymentResponse
+
+from metrics import YOOKASSA_SECONDS
+from settings import logger
+
+# ответы, после которых запрос можно повторить с тем же ключом идемпотентности
+RETRY_STATUSES = {202, 429, 500, 502, 503, 504}
+ERRORS = {202: ResponseProcessingError, 400: BadRequestError,
+          401: UnauthorizedError, 403: ForbiddenError, 404: NotFoundError,
+          429: TooManyRequestsError}
+
+
+def parse_body(text: str) -> dict:
+    # ответ прокси при 5xx бывает не JSON
+    try:
+        return json.loads(text) if text else {}
+    except ValueError:
+        return {'description': text[:200]}
+
+
+class YooKassaClient:
+    """
+    Асинхронный клиент API платежей YooKassa (create, find, cancel) вместо
+    синхронного SDK в потоках: общий пул keep-alive соединений, таймауты
+    и повторы. POST-запросы отправляются с Idempotence-Key, одинаковым
+    для всех повторов, поэтому повтор не создает второй платеж.
+    Ответы - PaymentResponse SDK, ошибки API - исключения SDK (NotFoundError...).
+    """
+
+    def __init__(self):
+        self.base_url = os.getenv('YOOKASSA_API_URL', 'https://api.yookassa.ru/v3')
+        self.shop_id = os.getenv('YOOKASSA_SHOP_ID') or ''
+        self.secret_key = os.getenv('YOOKASSA_API_KEY') or ''
+        self.timeout = ClientTimeout(
+            total=float(os.getenv('YOOKASSA_TIMEOUT', 10)),
+            connect=float(os.getenv('YOOKASSA_CONNECT_TIMEOUT', 3))
+        )
+        self.retries = int(os.getenv('YOOKASSA_RETRIES', 3))
+        self.pool_size = int(os.getenv('YOOKASSA_POOL_SIZE', 20))
+        self._session: Optional[ClientSession] = None
+
+    def session(self) -> ClientSession:
+        # сессия создается в работающем цикле событий, при первом запросе
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=self.timeout,
+                auth=BasicAuth(self.shop_id, self.secret_key),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def request(self,
+                      method: str,
+                      path: str,
+                      payload: Optional[dict] = None,
+                      idempotence_key: Optional[str] = None) -> dict:
+        headers = {'Idempotence-Key': idempotence_key} if idempotence_key else {}
+        attempt = 0
+        while True:
+            delay = 0.5 * 2 ** attempt * random.uniform(0.8, 1.2)
+            try:
+                async with self.session().request(method, self.base_url + path,
+                                                  json=payload,
+                                                  headers=headers) as response:
+                    body = parse_body(await response.text())
+                    if response.status == 200:
+                        return body
+                    if response.status not in RETRY_STATUSES \
+                            or attempt >= self.retries:
+                        raise ERRORS.get(response.status, ApiError)(body)
+                    if response.status == 202:
+                        # запрос еще обрабатывается, ответ советует время повтора (мс)
+                        delay = int(body.get('retry_after', 1000)) / 1000
+            except (ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise
+                logger.warning(f'YooKassa {method} {path}: {e!r}, повтор')
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def create_payment(self,
+                             params: dict,
+                             idempotence_key: Optional[str] = None) -> PaymentResponse:
+        with YOOKASSA_SECONDS.time('create'):
+            return PaymentResponse(await self.request(
+                'POST', '/payments', params,
+                idempotence_key or str(uuid.uuid4())
+            ))
+
+    async def find_payment(self, payment_id: str) -> PaymentResponse:
+        with YOOKASSA_SECONDS.time('find'):
+            return PaymentResponse(await self.request('GET', f'/payments/{payment_id}'))
+
+    async def cancel_payment(self,
+                             payment_id: str,
+                             idempotence_key: Optional[str] = None) -> PaymentResponse:
+        with YOOKASSA_SECONDS.time('cancel'):
+            return PaymentResponse(await self.request(
+                'POST', f'/payments/{payment_id}/cancel', {},
+                idempotence_key or str(uuid.uuid4())
+            ))
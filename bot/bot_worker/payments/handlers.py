@@ -1,11 +1,15 @@
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 
+from .client import YooKassaClient
+from .reconciler import PaymentReconciler
 from .services import PaymentWorker
 from settings import db
 
-router = Router()
-worker = PaymentWorker(db)
+router = Router(name='payments')
+client = YooKassaClient()
+worker = PaymentWorker(db, client)
+reconciler = PaymentReconciler(db, worker)
 
 
 @router.callback_query(F.data.startswith('pay_order_'))
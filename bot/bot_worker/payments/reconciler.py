@@ -0,0 +1,98 @@
+import asyncio
+import os
+
+from yookassa.domain.exceptions import NotFoundError
+
+from metrics import PAYMENT_PENDING, PAYMENT_RECONCILE
+from settings import logger
+from db import DB
+from .services import PaymentWorker, TERMINAL_STATUSES
+
+
+class PaymentReconciler:
+    """
+    Фоновая сверка незавершенных платежей с YooKassa вместо проверки
+    в хендлерах. Платежи и расписание их проверок хранятся в orders_payment
+    (DB.set_order_payment_id), поэтому переживают перезапуск и общие для всех
+    процессов. Каждые interval секунд из БД выбираются только платежи,
+    которым подошло время проверки, не более rate * interval за проход,
+    сначала новые. Интервал растет экспоненциально с числом проверок
+    (от min_delay до max_delay), поэтому старые платежи проверяются редко.
+    Успешные платежи применяются к заказам с той же проверкой суммы,
+    что и уведомления (PaymentWorker.settle_succeeded). По отмененным,
+    просроченным (созданным раньше expire секунд назад) и неизвестным
+    YooKassa (404) платежам payment_id заказа очищается одним UPDATE.
+    Платеж, замененный новым платежом того же заказа, проверяется
+    до итога: его могли оплатить.
+    """
+
+    def __init__(self, db: DB, worker: PaymentWorker):
+        self.db = db
+        self.worker = worker
+        worker.reconciler = self
+        self.interval = float(os.getenv('PAYMENT_RECONCILE_INTERVAL', 5))
+        # с уведомлениями YooKassa сверка - страховка, первая проверка позже
+        self.min_delay = float(os.getenv('PAYMENT_RECONCILE_MIN_DELAY',
+                                         60 if worker.webhook else 10))
+        self.max_delay = float(os.getenv('PAYMENT_RECONCILE_MAX_DELAY', 600))
+        self.rate = float(os.getenv('PAYMENT_RECONCILE_RATE', 5))
+        self.expire = float(os.getenv('PAYMENT_EXPIRE', 24 * 3600))
+
+    async def reconcile(self) -> dict:
+        """Один проход сверки, результат - число платежей по итогам"""
+        budget = max(int(self.rate * self.interval), 1)
+        due = await self.db.get_due_payments(budget)
+        payments = await asyncio.gather(
+            *(self.worker.fetch_payment(payment_id) for payment_id, *_ in due),
+            return_exceptions=True
+        )
+        paid, canceled, expired, missing, pending = [], [], [], [], []
+        for (payment_id, order_id, _, age), payment in zip(due, payments):
+            if isinstance(payment, NotFoundError):
+                missing.append(payment_id)  # платежа нет и не будет
+                continue
+            status = None
+            if isinstance(payment, Exception):
+                logger.warning(f'reconcile: {payment_id}: {payment}')
+            else:
+                status = payment.status
+            if status == 'succeeded':
+                paid.append((payment, order_id))
+            elif status in TERMINAL_STATUSES:
+                canceled.append(payment_id)
+            elif age >= self.expire:
+                expired.append(payment_id)
+            else:
+                pending.append(payment_id)
+
+        settled = []
+        if paid:
+            # та же проверка заказа и суммы, что и для уведомлений; по id
+            # заказа из orders_payment: у заказа мог появиться следующий платеж
+            for payment, order_id in paid:
+                settled.append(await self.worker.settle_succeeded(payment, order_id))
+            await self.db.drop_payments([payment.id for payment, _ in paid])
+        if canceled:
+            for order_id, tg_id in await self.db.settle_payments(canceled, False):
+                await self.worker.notify_user(order_id, tg_id, False)
+        if expired or missing:
+            # ссылка на оплату устарела, пользователь создаст новый платеж
+            await self.db.settle_payments(expired + missing, False)
+        await self.db.postpone_payments(pending, self.min_delay, self.max_delay)
+
+        result = {'checked': len(due), 'paid': settled.count('paid'),
+                  'canceled': len(canceled), 'expired': len(expired),
+                  'missing': len(missing)}
+        for stat, value in result.items():
+            PAYMENT_RECONCILE.inc(stat, value=value)
+        PAYMENT_PENDING.set(value=await self.db.count_pending_payments())
+        return result
+
+    async def run(self) -> None:
+        """Фоновая задача, запускается в main"""
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f'reconcile: {e}')
+            await asyncio.sleep(self.interval)
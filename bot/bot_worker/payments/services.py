@@ -1,35 +1,114 @@
 import asyncio
 import os
+import time
 import uuid
-from typing import Optional
+from decimal import Decimal
+from typing import Optional, Tuple, TYPE_CHECKING
 
 from aiogram.types import CallbackQuery
-from yookassa import Payment, Configuration
 from yookassa.domain.response import PaymentResponse
 
+from cache import TTLCache
+from metrics import PAYMENT_ANOMALIES
 from models import OrderStatus
-from settings import CHANNEL_USERNAME, logger
+from settings import CHANNEL_USERNAME, bot, logger
 from bot_worker.util.helpers import kb_builder
 from db import DB
+from .client import YooKassaClient
+
+if TYPE_CHECKING:
+    from .reconciler import PaymentReconciler
+
+# статусы платежа, которые больше не меняются
+TERMINAL_STATUSES = ('succeeded', 'canceled')
+
 
 class PaymentWorker:
-    def __init__(self, db: DB):
+    def __init__(self, db: DB, client: YooKassaClient):
         self.db = db
-        Configuration.account_id = os.getenv('YOOKASSA_SHOP_ID')
-        Configuration.secret_key = os.getenv('YOOKASSA_API_KEY')
-
-    async def check_pay(self,
-                        payment_id: str,
-                        order_id: int) -> Optional[OrderStatus]:
-        payment_data = await asyncio.to_thread(Payment.find_one, *[payment_id])
-        status = payment_data.status
-        if status == 'succeeded':
-            await self.db.set_order_status(order_id, OrderStatus.PAID)
-            # удаление payment_id
-            await self.db.set_order_payment_id(order_id, '')
-            return OrderStatus.PAID
-        else:
-            return None
+        self.client = client
+        # статусы платежей приходят уведомлениями (bot_api.payments),
+        # фоновая сверка только страхует
+        self.webhook = os.getenv('YOOKASSA_WEBHOOK', '0') == '1'
+        # статусы платежей проверяет фоновая сверка, а не хендлеры
+        self.reconciler: Optional['PaymentReconciler'] = None
+        # одновременных запросов к YooKassa на процесс
+        self.checks = asyncio.Semaphore(int(os.getenv('YOOKASSA_CONCURRENCY', 8)))
+        # завершенные платежи (succeeded, canceled): payment_id -> PaymentResponse
+        self.terminal_payments = TTLCache(maxsize=10_000, ttl=3600)
+        # (order_id, сумма) -> (payment_id, ссылка на оплату) незавершенного платежа
+        self.links = TTLCache(maxsize=10_000,
+                              ttl=float(os.getenv('PAYMENT_LINK_TTL', 3600)))
+
+    async def fetch_payment(self, payment_id: str) -> PaymentResponse:
+        """
+        Платеж в YooKassa. Завершенные платежи (succeeded, canceled)
+        больше не меняются и кешируются по payment_id.
+        """
+        payment = self.terminal_payments.get(payment_id)
+        if payment is not None:
+            return payment
+        async with self.checks:
+            payment = await self.client.find_payment(payment_id)
+        if payment.status in TERMINAL_STATUSES:
+            self.terminal_payments.set(payment_id, payment)
+        return payment
+
+    async def settle_succeeded(self,
+                               payment: PaymentResponse,
+                               order_id: Optional[int]) -> str:
+        """
+        Применение успешного платежа к заказу order_id - одна проверка
+        для уведомлений, сверки и повторного создания платежа. Заказ
+        оплачивается, только если платеж создан для него (metadata.order_id)
+        на сумму заказа в рублях, пользователь получает сообщение.
+        Результат: paid, duplicate (заказ уже оплачен этим платежом),
+        double_charge (заказ оплачен другим платежом), mismatch или orphan
+        (заказа нет); последние три пишутся в лог и PAYMENT_ANOMALIES.
+        """
+        order = await self.db.get_order_by_id(order_id) if order_id is not None else None
+        if order is None:
+            return self.anomaly('orphan', payment, order_id, 'заказ не найден')
+        metadata = payment.metadata or {}
+        if str(metadata.get('order_id')) != str(order_id) \
+                or payment.amount.currency != 'RUB' \
+                or Decimal(payment.amount.value) != order.total:
+            return self.anomaly('mismatch', payment, order_id,
+                                f'сумма заказа {order.total} RUB')
+        if order.status == OrderStatus.NOT_PAID:
+            settled = await self.db.mark_orders_paid({order_id: payment.id})
+            if settled:
+                await self.notify_user(*settled[0], True)
+                return 'paid'
+        paid_by = await self.db.get_paid_payment_id(order_id)
+        if paid_by == payment.id:
+            return 'duplicate'
+        return self.anomaly('double_charge', payment, order_id,
+                            f'заказ уже оплачен платежом {paid_by}')
+
+    @staticmethod
+    def anomaly(kind: str, payment: PaymentResponse,
+                order_id: Optional[int], detail: str) -> str:
+        PAYMENT_ANOMALIES.inc(kind)
+        logger.error(f'Платеж {payment.id} ({payment.amount.value} '
+                     f'{payment.amount.currency}) не применен к заказу № {order_id}: '
+                     f'{kind}, {detail}')
+        return kind
+
+    @staticmethod
+    async def notify_user(order_id: int, tg_id: int, paid: bool) -> None:
+        """Сообщение пользователю об итоге платежа"""
+        text = (f'Заказ #{order_id} оплачен. Спасибо!' if paid
+                else f'Платеж по заказу #{order_id} отменен. '
+                     f'Заказ можно оплатить повторно.')
+        kb = await kb_builder(kb_values=[
+            [{"text": "Заказы", "callback_data": "show_orders"}]
+        ])
+        try:
+            await bot.send_message(tg_id, text, reply_markup=kb)
+        except Exception as e:
+            # заказ уже обновлен, повторная проверка ничего не изменит
+            logger.error(f'notify_user: {tg_id}: {e}')
 
     async def payment(self, callback: CallbackQuery) -> None:
         """Вывод ссылки для оплаты."""
@@ -45,22 +124,25 @@ class PaymentWorker:
                 await callback.answer('Заказ уже оплачен.')
                 return
 
-            if order.payment_id:
-                if await self.check_pay(order.payment_id, order.id):
-                    await callback.answer('Заказ уже оплачен.')
-                    return
+            terminal = self.terminal_payments.get(order.payment_id) \
+                if order.payment_id else None
+            if terminal is not None and terminal.status == 'succeeded':
+                # оплата известна, но сверка еще не записала ее в заказ
+                await callback.answer('Заказ уже оплачен.')
+                return
 
             if value == 0:
                 await callback.answer('При формировании заказа произошла ошибка.')
                 logger.error(f"payment: sum order № {order_id} == 0")
                 return
 
-            yookassa: PaymentResponse = await asyncio.to_thread(
-                self.yookassa_payment, *[value]
-            )
-            await self.db.set_order_payment_id(order_id, yookassa.id)
-            payment_url = yookassa.confirmation.confirmation_url
-
+            link = await self.payment_link(order_id, value, order.payment_id,
+                                           order.canceled_payment_id)
+            if link is None:
+                # платеж с тем же ключом уже оплачен, заказ отмечен оплаченным
+                await callback.answer('Заказ уже оплачен.')
+                return
+            _, payment_url = link
             kb = await kb_builder(kb_values=[
                 [{"text": "YooKassa", "url": payment_url}],
                 [{"text": "В заказы", "callback_data": "show_orders"}],
@@ -72,10 +154,74 @@ class PaymentWorker:
             await callback.answer("Ошибка при создании платежа.", show_alert=True)
             logger.error(f'payment: {e}')
 
+    async def payment_link(self,
+                           order_id: int,
+                           value: Decimal,
+                           current_payment_id: Optional[str],
+                           canceled_payment_id: Optional[str] = None
+                           ) -> Optional[Tuple[str, str]]:
+        """
+        (payment_id, ссылка на оплату) или None, если заказ уже оплачен.
+        Незавершенный платеж заказа переиспользуется, пока сумма
+        не изменилась и ссылка не устарела, без обращения к YooKassa.
+        """
+        key = (order_id, value)
+        cached = self.links.get(key)
+        if cached and cached[0] == current_payment_id \
+                and cached[0] not in self.terminal_payments:
+            return cached
+        yookassa = await self.create_payment(order_id, value, canceled_payment_id)
+        if yookassa.status == 'succeeded':
+            return None
+        if yookassa.id != current_payment_id:
+            await self.db.set_order_payment_id(
+                order_id, yookassa.id,
+                self.reconciler.min_delay if self.reconciler else 0
+            )
+        link = yookassa.id, yookassa.confirmation.confirmation_url
+        self.links.set(key, link)
+        return link
+
+    async def create_payment(self, order_id: int, value: Decimal,
+                             canceled_payment_id: Optional[str] = None) -> PaymentResponse:
+        """
+        Платеж YooKassa для заказа. Ключ идемпотентности выводится из заказа,
+        суммы, окна времени жизни ссылки и последнего отмененного платежа
+        заказа (orders_order.canceled_payment_id): повторное создание (промах
+        кеша, другой процесс) возвращает тот же платеж. Если он уже оплачен,
+        заказ отмечается оплаченным и возвращается этот платеж (status
+        succeeded). Если отменен, он запоминается в заказе и создается
+        следующий платеж с ключом из его id - число отмен не ограничено.
+        """
+        window = int(time.time() // self.links.ttl)
+        params = self.payment_params(value, order_id)
+
+        async def create(canceled: Optional[str]) -> PaymentResponse:
+            key = f'order:{order_id}:{value}:{window}'
+            if canceled:
+                key = f'{key}:{canceled}'
+            return await self.client.create_payment(
+                params, str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+            )
+
+        yookassa = await create(canceled_payment_id)
+        if yookassa.status == 'canceled':
+            # отмена еще не записана сверкой или уведомлением
+            await self.db.set_canceled_payment_id(order_id, yookassa.id)
+            yookassa = await create(yookassa.id)
+        if yookassa.status == 'succeeded':
+            # платеж по ключу этого заказа уже оплачен: новый не нужен
+            self.terminal_payments.set(yookassa.id, yookassa)
+            await self.settle_succeeded(yookassa, order_id)
+        elif yookassa.status == 'canceled':
+            # отмена уже записана: следующая попытка создаст новый платеж
+            raise RuntimeError(f'payment for order № {order_id} is {yookassa.status}')
+        return yookassa
+
     @staticmethod
-    def yookassa_payment(value: float):
-        """Функция создания платежа, запускаемая в отдельном потоке"""
-        return Payment.create({
+    def payment_params(value: float, order_id: int) -> dict:
+        """Параметры создания платежа"""
+        return {
             "amount": {
                 "value": f"{value}",
                 "currency": "RUB"
@@ -86,5 +232,6 @@ class PaymentWorker:
                 "return_url": f'https://t.me/{CHANNEL_USERNAME.lstrip("@")}'
             },
             "capture": True,
-            "description": "Оплата заказа в тестовом режиме"
-        }, uuid.uuid4())
+            "description": "Оплата заказа в тестовом режиме",
+            "metadata": {"order_id": order_id}
+        }
@@ -6,7 +6,7 @@ from .services import ProductWorker
 from settings import db
 
 
-router = Router()
+router = Router(name='products')
 worker = ProductWorker(db)
 
 
@@ -6,7 +6,8 @@ from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import (InlineKeyboardMarkup,
                            CallbackQuery)
 
-from models import Category, SubCategory, Product
+from dto import ProductRow
+from models import Category, SubCategory
 from settings import logger
 from bot_worker.util.helpers import (cache_handling,
                                      kb_builder,
@@ -113,7 +114,7 @@ class ProductWorker:
         ])
 
     async def send_product_menu(self,
-                                products_with_qty: List[Tuple[Product, int]],
+                                products_with_qty: List[Tuple[ProductRow, int]],
                                 tg_id: int,
                                 state: FSMContext,
                                 bot: Bot) -> None:
@@ -1,13 +1,13 @@
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 
 from .services import Form, StartMenu
-from settings import db
+from settings import db, CHANNEL_USERNAME
 
 
-router = Router()
+router = Router(name='start_menu')
 worker = StartMenu(db)
 
 
@@ -40,3 +40,9 @@ async def main_menu_handler(
 ) -> None:
     """Обработчик перехода в главное меню"""
     await worker.main_menu(target, state, bot)
+
+
+@router.chat_member(F.chat.username == CHANNEL_USERNAME.lstrip('@'))
+async def channel_member_handler(event: ChatMemberUpdated) -> None:
+    """Обработчик изменения подписки на канал (бот - администратор канала)"""
+    worker.update_member_cache(event)
@@ -1,13 +1,19 @@
 from aiogram import Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.types import (Message,
-                           CallbackQuery)
+                           CallbackQuery,
+                           ChatMemberUpdated)
 from aiogram.exceptions import TelegramAPIError
 from aiogram.fsm.state import State, StatesGroup
 
 from bot_worker.util.helpers import cache_handling, kb_builder
+from cache import TTLCache, RateLimiter
 from models import User
-from settings import CHANNEL_USERNAME, logger
+from settings import (CHANNEL_USERNAME, logger,
+                      SUBSCRIPTION_CACHE_TTL,
+                      SUBSCRIPTION_NEGATIVE_TTL,
+                      SUBSCRIPTION_CACHE_SIZE,
+                      SUBSCRIPTION_CHECK_RATE)
 from db import DB
 
 
@@ -18,21 +24,49 @@ class Form(StatesGroup):
 class StartMenu:
     def __init__(self, db: DB):
         self.db = db
+        # tg_id -> подписан ли на канал; обновляется событиями chat_member
+        self.member_cache = TTLCache(maxsize=SUBSCRIPTION_CACHE_SIZE,
+                                     ttl=SUBSCRIPTION_CACHE_TTL)
+        self.member_limiter = RateLimiter(rate=SUBSCRIPTION_CHECK_RATE)
 
     async def check_user_in_db(self, message: Message) -> None:
-        if not await self.db.get_user_by_tg_id(message.from_user.id):
+        if not await self.db.resolve_user(message.from_user.id):
             user = User(tg_id=message.from_user.id,
                         username=message.from_user.username,
                         first_name=message.from_user.first_name,
                         last_name=message.from_user.last_name)
             await self.db.add_user(user)
 
-    async def check_chat_member(self, bot: Bot, tg_id: int) -> bool:
+    def cache_member_status(self, tg_id: int, status: str) -> bool:
+        is_member = status not in ['left', 'kicked']
+        ttl = SUBSCRIPTION_CACHE_TTL if is_member else SUBSCRIPTION_NEGATIVE_TTL
+        self.member_cache.set(tg_id, is_member, ttl=ttl)
+        return is_member
+
+    def update_member_cache(self, event: ChatMemberUpdated) -> None:
+        """
+        Обновление кеша по событию chat_member канала.
+        Событие приходит, только если бот является администратором канала.
+        """
+        self.cache_member_status(event.new_chat_member.user.id,
+                                 event.new_chat_member.status)
+
+    async def check_chat_member(self,
+                                bot: Bot,
+                                tg_id: int,
+                                force: bool = False) -> bool:
+        """
+        Проверка подписки на канал: сначала кеш, при промахе (или force)
+        запрос getChatMember с ограничением частоты.
+        """
+        if not force:
+            is_member = self.member_cache.get(tg_id)
+            if is_member is not None:
+                return is_member
         try:
-            member = await bot.get_chat_member(CHANNEL_USERNAME, tg_id)
-            if member.status in ['left', 'kicked']:
-                return False
-            return True
+            async with self.member_limiter:
+                member = await bot.get_chat_member(CHANNEL_USERNAME, tg_id)
+            return self.cache_member_status(tg_id, member.status)
         except TelegramAPIError as e:
             logger.error(f'Ошибка при проверке подписки на канал: {e}')
             return False
@@ -64,8 +98,10 @@ class StartMenu:
                                  bot: Bot) -> None:
         """Вывод главного меню"""
         try:
-            member = await bot.get_chat_member(CHANNEL_USERNAME, callback.from_user.id)
-            if not await self.check_chat_member(bot, callback.from_user.id):
+            # пользователь сообщил о подписке - отрицательный кеш не учитываем
+            is_member = self.member_cache.get(callback.from_user.id)
+            if not await self.check_chat_member(bot, callback.from_user.id,
+                                                force=not is_member):
                 await callback.answer("Вы все еще не подписаны. "
                                       "Пожалуйста, подпишитесь на канал.")
             else:
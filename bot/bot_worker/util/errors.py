@@ -0,0 +1,20 @@
+from aiogram import Router
+from aiogram.filters import ExceptionTypeFilter
+from aiogram.types import ErrorEvent
+
+from settings import logger
+from timeouts import DBTimeout
+
+
+router = Router(name='errors')
+
+
+@router.errors(ExceptionTypeFilter(DBTimeout))
+async def db_timeout_handler(event: ErrorEvent) -> None:
+    """Ответ пользователю, если БД не уложилась в бюджет времени"""
+    logger.warning(f'{event.exception} (update {event.update.update_id})')
+    text = 'Сервис временно перегружен, попробуйте еще раз.'
+    if event.update.callback_query:
+        await event.update.callback_query.answer(text, show_alert=True)
+    elif event.update.message:
+        await event.update.message.answer(text)
@@ -1,13 +1,23 @@
-from typing import List
+import re
+from typing import List, Optional
 
 from aiogram import Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.types import (InlineKeyboardMarkup, 
-                           InlineKeyboardButton)
+                           InlineKeyboardButton,
+                           Update)
 
 from settings import logger
 from db import DB
 
+_digits = re.compile(r'\d+')
+
+# команды бота (фильтры Command в роутерах) - метки метрик. Текст
+# сообщения задает пользователь, поэтому остальные '/...' - одна метка
+COMMANDS = frozenset({'/start'})
+OTHER_COMMAND = 'command:other'
+
+
 async def save_message_cache(state: FSMContext, 
                              message_id: int,
                              product_id: int, 
@@ -68,4 +78,32 @@ async def kb_builder(kb_values: List[List[dict]]) -> InlineKeyboardMarkup:
         for value in values:
             line_buttons.append(InlineKeyboardButton(**value))
         inline_keyboard.append(line_buttons)
-    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+
+def callback_label(callback_data: str) -> str:
+    """Тип callback_data без идентификаторов: order_15 -> order_"""
+    return _digits.sub('', callback_data)
+
+
+def command_label(text: Optional[str]) -> str:
+    """Команда сообщения для статистики: /start или command:other, не команда - ''"""
+    if not text or not text.startswith('/'):
+        return ''
+    command = text.split(maxsplit=1)[0].split('@', 1)[0]  # /start@bot_name
+    return command if command in COMMANDS else OTHER_COMMAND
+
+
+def update_label(update: Update) -> str:
+    """
+    Метка обновления для статистики: тип обновления и команда
+    или callback_data без чисел, например callback_query:subcategory_id_
+    """
+    event_type = update.event_type
+    if update.callback_query and update.callback_query.data:
+        return f"{event_type}:{callback_label(update.callback_query.data)}"
+    if update.message:
+        command = command_label(update.message.text)
+        if command:
+            return f"{event_type}:{command}"
+    return event_type
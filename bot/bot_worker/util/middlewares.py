@@ -0,0 +1,204 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (BaseRequestMiddleware,
+                                                     NextRequestMiddlewareType)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from bot_worker.util.helpers import callback_label, command_label, update_label
+from settings import logger
+from db import DB
+from metrics import (UPDATES, UPDATES_IN_FLIGHT, HANDLER_SECONDS,
+                     TG_REQUESTS, TG_SECONDS)
+from profiler import SqlProfiler
+from recorder import UpdateRecorder
+from sampler import SamplingProfiler
+
+
+class DBSessionMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на обновление (unit of work).
+    Сессия передается в хендлеры как аргумент session, а методы DB
+    внутри обработки обновления используют ее автоматически.
+    Транзакция фиксируется перед вызовами Bot API (DBReleaseMiddleware).
+    """
+
+    def __init__(self, db: DB):
+        self.db = db
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        async with self.db.unit_of_work() as session:
+            data['session'] = session
+            try:
+                return await handler(event, data)
+            finally:
+                logger.debug(f'DB per update: {session.info["stats"]}')
+
+
+class DBReleaseMiddleware(BaseRequestMiddleware):
+    """
+    Фиксация транзакции обновления перед исходящим вызовом Bot API
+    (см. DB.release): соединение возвращается в пул на время запроса.
+    """
+
+    def __init__(self, db: DB):
+        self.db = db
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        await self.db.release()
+        return await make_request(bot, method)
+
+
+class SqlProfilerMiddleware(BaseMiddleware):
+    """Профилирование SQL для выборки обновлений (см. profiler.SqlProfiler)"""
+
+    def __init__(self, profiler: SqlProfiler):
+        self.profiler = profiler
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        label = update_label(event) if isinstance(event, Update) else 'update'
+        profile = self.profiler.start(label)
+        try:
+            return await handler(event, data)
+        finally:
+            self.profiler.finish(profile)
+
+
+class SamplingProfilerMiddleware(BaseMiddleware):
+    """
+    Сэмплирующее профилирование обновлений (см. sampler.SamplingProfiler).
+    Профиль передается дальше как sampled_update, имя хендлера в него
+    записывает HandlerMetricsMiddleware.
+    """
+
+    def __init__(self, profiler: SamplingProfiler):
+        self.profiler = profiler
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        label = update_label(event) if isinstance(event, Update) else 'update'
+        sampled = self.profiler.start(label)
+        data['sampled_update'] = sampled
+        try:
+            return await handler(event, data)
+        finally:
+            await self.profiler.finish(sampled)
+
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """Запись входящих обновлений для воспроизведения (см. recorder.UpdateRecorder)"""
+
+    def __init__(self, recorder: UpdateRecorder):
+        self.recorder = recorder
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update):
+            try:
+                self.recorder.record(event.model_dump(mode='json',
+                                                      exclude_none=True))
+            except Exception as e:
+                logger.error(f'Не удалось записать обновление: {e}')
+        return await handler(event, data)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Счетчик обновлений по типам и число обновлений в обработке"""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        UPDATES.inc(event.event_type if isinstance(event, Update) else 'update')
+        UPDATES_IN_FLIGHT.inc()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATES_IN_FLIGHT.dec()
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время работы хендлеров роутера router_name. Регистрируется на
+    наблюдателях событий роутера, поэтому видит только сработавшие хендлеры.
+    Заодно помечает именем хендлера профиль сэмплирующего профилировщика.
+    """
+
+    def __init__(self, router_name: str):
+        self.router_name = router_name
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, CallbackQuery):
+            event_type, callback = 'callback_query', callback_label(event.data or '')
+        elif isinstance(event, Message):
+            event_type, callback = 'message', command_label(event.text)
+        else:
+            event_type, callback = type(event).__name__, ''
+        sampled = data.get('sampled_update')
+        if sampled is not None:
+            sampled.handler = data['handler'].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start,
+                                    self.router_name, event_type, callback)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Количество, время и ответы 429 исходящих вызовов Bot API по методам"""
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        start = time.perf_counter()
+        result = 'ok'
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            result = '429'
+            raise
+        except Exception:
+            result = 'error'
+            raise
+        finally:
+            TG_SECONDS.observe(time.perf_counter() - start, api_method)
+            TG_REQUESTS.inc(api_method, result)
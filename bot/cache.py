@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Hashable, Optional
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру LRU-кеш с временем жизни записей.
+    При переполнении вытесняется запись, к которой дольше всего не обращались.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def keys(self) -> list:
+        """Ключи неистекших записей, без изменения порядка вытеснения"""
+        now = time.monotonic()
+        return [key for key, (expires_at, _) in self._data.items()
+                if expires_at >= now]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RateLimiter:
+    """
+    Ограничение частоты вызовов: не более rate вызовов за period секунд.
+    Лишние вызовы ждут освобождения окна, а не получают ошибку.
+    """
+
+    def __init__(self, rate: int, period: float = 1.0):
+        self.rate = rate
+        self.period = period
+        self._calls: deque[float] = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            while self._calls and now - self._calls[0] >= self.period:
+                self._calls.popleft()
+            if len(self._calls) >= self.rate:
+                await asyncio.sleep(self.period - (now - self._calls[0]))
+                self._calls.popleft()
+            self._calls.append(time.monotonic())
+
+    async def __aenter__(self) -> 'RateLimiter':
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+
+class KnownUserCache(TTLCache):
+    """
+    Кеш известных пользователей: tg_id -> (user_id, cart_id).
+    Позволяет не делать SELECT/JOIN по users_user на каждом обновлении.
+    Если задан path, содержимое можно сохранить на диск и загрузить при старте:
+    записи сохраняются с оставшимся временем жизни, а не получают новый TTL.
+    """
+
+    def __init__(self,
+                 maxsize: int = 100_000,
+                 ttl: float = 3600,
+                 path: Optional[str] = None):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.path = path
+
+    def get_ids(self, tg_id: int) -> Optional[tuple[int, Optional[int]]]:
+        return self.get(tg_id)
+
+    def set_ids(self, tg_id: int, user_id: int,
+                cart_id: Optional[int] = None) -> None:
+        self.set(tg_id, (user_id, cart_id))
+
+    def set_cart(self, tg_id: int, cart_id: Optional[int]) -> None:
+        ids = self.get_ids(tg_id)
+        if ids is not None:
+            self.set_ids(tg_id, ids[0], cart_id)
+
+    def load(self) -> int:
+        """
+        Загрузка кеша с диска. Возвращает количество загруженных записей.
+        Истекшие за время простоя записи и записи без срока не загружаются.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        now = time.time()
+        loaded = 0
+        for tg_id, item in data.items():
+            if len(item) != 3 or item[2] <= now:
+                continue
+            user_id, cart_id, expires_at = item
+            self.set(int(tg_id), (user_id, cart_id), ttl=expires_at - now)
+            loaded += 1
+        return loaded
+
+    def dump(self) -> None:
+        """Сохранение актуальных записей кеша на диск со сроком по часам системы"""
+        if not self.path:
+            return
+        now = time.monotonic()
+        # monotonic не переживает перезапуск: срок сохраняется как time.time()
+        offset = time.time() - now
+        data = {tg_id: [*value, expires_at + offset]
+                for tg_id, (expires_at, value) in self._data.items()
+                if expires_at >= now}
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
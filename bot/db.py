@@ -1,43 +1,430 @@
+import asyncio
+import functools
 import os
 from contextlib import asynccontextmanager
+from contextvars import ContextVar, copy_context
 import random
-from typing import AsyncIterator, List, Tuple, Union, Type, Optional
+from datetime import timedelta
+from decimal import Decimal
+from typing import (AsyncIterator, Awaitable, Callable, Dict, Hashable, List,
+                    Tuple, Union, Type, Optional)
 
-from sqlalchemy import select, literal, and_
+from sqlalchemy import select, update, delete, literal, and_, case, event, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import (DBAPIError, IntegrityError, InterfaceError,
+                            OperationalError)
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, selectinload  # pip install SQLAlchemy psycopg2-binary
 
+from cache import KnownUserCache, TTLCache
+from dto import CategoryRow, ProductRow, OrderRow
+from fast_reads import FastReads
+from metrics import DB_CALL_SECONDS, DB_TIMEOUTS
+from pool import SqlLog, engine_options
+from profiler import SqlProfiler
+from timeouts import (QUERY_CLASSES, BASELINE, TIMEOUT_SQLSTATES, DBTimeout,
+                      current_query_class, query_class_ctx)
+from replicas import ReplicaSet
 from settings import logger
 
 from models import (CartItem, Cart, Product, Category, SubCategory,
-                    Order, OrderItem, User, OrderStatus)
+                    Order, OrderItem, Payment, User, OrderStatus)
+
+
+# сессия текущего обновления (см. unit_of_work) и счетчики обращений к БД в нем
+_session_ctx: ContextVar[Optional[AsyncSession]] = ContextVar('db_session',
+                                                               default=None)
+_stats_ctx: ContextVar[Optional[dict]] = ContextVar('db_stats', default=None)
+
+STAT_KEYS = ('checkouts', 'transactions', 'statements')
+
+# колонки, из которых собираются dto для экранов бота
+PRODUCT_COLUMNS = (Product.id, Product.name, Product.description,
+                   Product.price, Product.image_url)
+ORDER_COLUMNS = (Order.id, Order.status, Order.payment_id,
+                 Order.total, Order.items_count, Order.canceled_payment_id)
+
+
+def query_class(name: str, on_timeout: Optional[Callable] = None):
+    """
+    Бюджет времени метода DB по классу запросов (см. timeouts.py):
+    дедлайн asyncio и statement_timeout/lock_timeout Postgres. При превышении
+    вызывается DBTimeout, счетчик - DB.timeout_counts[name].
+    on_timeout(self, *args, **kwargs) - ответ вместо DBTimeout (None - нет ответа).
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self: 'DB', *args, **kwargs):
+            with DB_CALL_SECONDS.time(method.__name__):
+                try:
+                    return await self.run_timed(name, method(self, *args, **kwargs))
+                except DBTimeout:
+                    result = on_timeout(self, *args, **kwargs) if on_timeout else None
+                    if result is None:
+                        raise
+                    return result
+        return wrapper
+    return decorator
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных запросов (single-flight): пока запрос
+    с ключом key выполняется, остальные вызовы с тем же ключом ждут его
+    результат, а не идут в БД. Если задан ttl, результат еще ttl секунд
+    отдается из кеша.
+    """
+
+    _missing = object()
+
+    def __init__(self, ttl: float = 0, maxsize: int = 1024):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._results = TTLCache(maxsize=maxsize, ttl=ttl) if ttl else None
+        # calls - всего вызовов, hits - из кеша результатов,
+        # coalesced - присоединились к выполняющемуся запросу, queries - в БД
+        self.stats = {'calls': 0, 'hits': 0, 'coalesced': 0, 'queries': 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        self.stats['calls'] += 1
+        if self._results is not None:
+            result = self._results.get(key, self._missing)
+            if result is not self._missing:
+                self.stats['hits'] += 1
+                return result
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats['queries'] += 1
+            # общий запрос выполняется в своей сессии, а не в сессии
+            # обновления, которое пришло первым
+            context = copy_context()
+            context.run(_session_ctx.set, None)
+            context.run(_stats_ctx.set, None)
+            task = asyncio.create_task(self._run(key, fn), context=context)
+            self._inflight[key] = task
+        else:
+            self.stats['coalesced'] += 1
+        # shield - отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable]):
+        try:
+            result = await fn()
+            if self._results is not None:
+                self._results.set(key, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
 
 
 class DB:
     def __init__(self):
-        self.engine = create_async_engine(os.getenv('DB_URL'),
-                                          echo=True, future=True)
+        # размер пула, pre-ping, recycle и режим журнала SQL - см. pool.py
+        options, self.pool_telemetry = engine_options()
+        self.engine = create_async_engine(os.getenv('DB_URL'), **options)
+        # реплики для чтения: DB_REPLICA_URLS=url1,url2
+        replica_urls = [url.strip() for url in
+                        os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+        replica_engines = []
+        self.replica_telemetry = []
+        for url in replica_urls:
+            options, telemetry = engine_options()
+            replica_engines.append(create_async_engine(url, **options))
+            self.replica_telemetry.append(telemetry)
+        self.replicas = ReplicaSet(replica_engines) if replica_engines else None
+        self.sql_log = SqlLog()
+        self.profiler = SqlProfiler()
+        # пользователи, недавно изменявшие данные, читают с primary,
+        # пока реплики не догонят (read-your-writes)
+        self.sticky_users = TTLCache(
+            maxsize=100_000,
+            ttl=float(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+        )
 
         self.SessionLocal = sessionmaker(bind=self.engine,  # type: ignore
                                          class_=AsyncSession,
                                          autoflush=False,
                                          future=True,
                                          expire_on_commit=False)
+        # tg_id -> (user_id, cart_id), чтобы не делать JOIN через users_user
+        self.users = KnownUserCache(
+            maxsize=int(os.getenv('USER_CACHE_SIZE', 100_000)),
+            ttl=int(os.getenv('USER_CACHE_TTL', 3600)),
+            path=os.getenv('USER_CACHE_FILE')
+        )
+        # быстрый путь чтения через asyncpg без ORM (DB_FAST_READS=1)
+        self.fast_reads = (FastReads(self)
+                           if os.getenv('DB_FAST_READS', '0') == '1' else None)
+        # объединение одинаковых запросов каталога при наплыве пользователей
+        self.catalog_flight = SingleFlight(
+            ttl=float(os.getenv('CATALOG_CACHE_TTL', 2))
+        )
+        # последний успешный результат каталога - ответ при таймауте БД
+        self.catalog_stale = TTLCache(maxsize=1024, ttl=24 * 3600)
+        self.timeout_counts = dict.fromkeys(QUERY_CLASSES, 0)
+        for name in QUERY_CLASSES:
+            # серии всех классов с нуля: rate() видит и первый таймаут
+            DB_TIMEOUTS.inc(name, value=0)
+        # общее число обновлений (unit_of_work) и обращений к БД
+        self.stats = dict.fromkeys(('updates',) + STAT_KEYS, 0)
+        for engine in [self.engine] + (self.replicas.engines
+                                       if self.replicas else []):
+            self._instrument(engine)
+
+    def _instrument(self, engine) -> None:
+        self.sql_log.attach(engine)
+        self.profiler.attach(engine)
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine.pool, 'checkout',
+                     lambda *args: self._count('checkouts'))
+        event.listen(sync_engine, 'begin',
+                     lambda *args: self._count('transactions'))
+        event.listen(sync_engine, 'before_cursor_execute',
+                     lambda *args: self._count('statements'))
+
+    def _count(self, key: str) -> None:
+        self.stats[key] += 1
+        update_stats = _stats_ctx.get()
+        if update_stats is not None:
+            update_stats[key] += 1
+
+    def pool_stats(self) -> dict:
+        """Телеметрия пулов соединений: primary и реплики"""
+        stats = {'primary': self.pool_telemetry.snapshot(
+            self.engine.sync_engine.pool
+        )}
+        if self.replicas:
+            for index, (engine, telemetry) in enumerate(
+                    zip(self.replicas.engines, self.replica_telemetry)):
+                stats[f'replica_{index}'] = telemetry.snapshot(
+                    engine.sync_engine.pool
+                )
+        return stats
+
+    def stats_per_update(self) -> dict:
+        """Среднее число подключений/транзакций/запросов на одно обновление"""
+        updates = self.stats['updates'] or 1
+        return {key: round(self.stats[key] / updates, 2) for key in STAT_KEYS}
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[AsyncSession]:
+        """
+        Одна сессия на всё обновление. Пока контекст открыт, все методы DB
+        работают в этой сессии (get_session возвращает ее же). Подключение
+        берется из пула только при первом запросе и возвращается перед
+        каждым вызовом Bot API (см. release), поэтому транзакция охватывает
+        только запросы между сетевыми вызовами.
+        Счетчики обращений к БД за обновление - в session.info['stats'].
+        """
+        async with self.SessionLocal() as session:
+            update_stats = dict.fromkeys(STAT_KEYS, 0)
+            session.info['stats'] = update_stats
+            session_token = _session_ctx.set(session)
+            stats_token = _stats_ctx.set(update_stats)
+            try:
+                yield session
+                await self._commit(session)
+            except Exception as e:
+                await session.rollback()
+                if isinstance(e, IntegrityError):
+                    # см. evict_user_on_conflict
+                    for tg_id in session.info.get('conflict_users', ()):
+                        self.users.pop(tg_id)
+                raise
+            finally:
+                _session_ctx.reset(session_token)
+                _stats_ctx.reset(stats_token)
+                self.stats['updates'] += 1
+
+    @staticmethod
+    async def _commit(session: AsyncSession) -> None:
+        lost = session.info.pop('writes_lost', None)
+        if lost is not None:
+            # записи до прерванного вызова не сохранились - обновление
+            # не должно завершиться так, будто они есть
+            raise DBTimeout(lost)
+        await session.commit()
+        # SET LOCAL действует до конца транзакции
+        session.info.pop('query_class', None)
+        session.info.pop('pending_writes', None)
+        for callback in session.info.pop('after_commit', []):
+            callback()
+
+    async def release(self) -> None:
+        """
+        Фиксация транзакции обновления и возврат соединения в пул перед
+        сетевым вызовом (DBReleaseMiddleware): соединение не простаивает
+        в транзакции и не держит блокировки строк, пока отвечает Telegram.
+        Следующий запрос обновления возьмет соединение заново.
+        """
+        session = _session_ctx.get()
+        if session is not None and session.in_transaction():
+            await self._commit(session)
 
     @asynccontextmanager  # для создания аснихронного контекстного менеджера
     async def get_session(self) -> AsyncIterator[AsyncSession]:
         """
         Асинхронный генератор сессий. Работает как контекстный менеджер
         благодаря @asynccontextmanager.
+        Внутри unit_of_work возвращает общую сессию обновления. Если
+        в транзакции уже есть незафиксированные записи, вызов выполняется
+        в точке сохранения (SAVEPOINT): ошибка откатывает только его,
+        а не предыдущие записи обновления.
         """
+        session = _session_ctx.get()
+        if session is not None:
+            callbacks = len(session.info.get('after_commit', []))
+            nested = (await session.begin_nested()
+                      if session.info.get('pending_writes') else None)
+            try:
+                await self._apply_timeouts(session)
+                yield session
+                # autoflush выключен: изменения метода должны быть видны
+                # следующим запросам этого же обновления
+                await session.flush()
+                if nested is not None:
+                    await nested.commit()
+            except (Exception, asyncio.CancelledError):
+                # в том числе прерывание дедлайном (run_timed) посреди запроса
+                await self._rollback_call(session, nested, callbacks)
+                raise
+            query_class = current_query_class()
+            if query_class is not None and query_class.name == 'write':
+                session.info['pending_writes'] = True
+            return
         async with self.SessionLocal() as session:  
             async with session.begin():
                 try:
+                    await self._apply_timeouts(session)
                     yield session
                 except Exception as e:
                     await session.rollback()
                     raise e
 
+    @staticmethod
+    async def _rollback_call(session: AsyncSession, nested, callbacks: int) -> None:
+        """
+        Откат неудачного вызова в общей сессии: до точки сохранения, если
+        она есть, иначе всей транзакции (в ней были только чтения).
+        SET LOCAL после отката мог быть отменен - будет выполнен заново.
+        """
+        session.info.pop('query_class', None)
+        if nested is not None:
+            del session.info.setdefault('after_commit', [])[callbacks:]
+            try:
+                # вызов, прерванный дедлайном посреди запроса, закрывает
+                # соединение - вместе с транзакцией и записями обновления
+                if not (await session.connection()).invalidated:
+                    await nested.rollback()
+                    return
+            except Exception as e:
+                logger.warning(f'Откат до точки сохранения: {e}')
+            query_class = current_query_class()
+            session.info['writes_lost'] = query_class.name if query_class else BASELINE
+            logger.error('Соединение потеряно, незафиксированные записи обновления отменены')
+        session.info.pop('after_commit', None)
+        session.info.pop('pending_writes', None)
+        try:
+            await session.rollback()
+        except Exception:
+            await session.close()
+
+    @staticmethod
+    async def _apply_timeouts(session: AsyncSession) -> None:
+        """
+        SET LOCAL statement_timeout/lock_timeout для класса текущего вызова.
+        Таймауты класса BASELINE уже заданы на соединении, а в общей сессии
+        обновления запрос повторяется только при смене класса.
+        """
+        query_class = current_query_class()
+        if query_class is None:
+            return
+        applied = session.info.get('query_class', BASELINE)
+        if applied == query_class.name:
+            return
+        await session.execute(
+            select(func.set_config('statement_timeout',
+                                   str(query_class.statement_ms), True),
+                   func.set_config('lock_timeout',
+                                   str(query_class.lock_ms), True))
+        )
+        session.info['query_class'] = query_class.name
+
+    async def run_timed(self, name: str, coro: Awaitable):
+        query_class = QUERY_CLASSES[name]
+        token = query_class_ctx.set(query_class)
+        try:
+            async with asyncio.timeout(query_class.deadline):
+                return await coro
+        except TimeoutError as e:
+            # прерванный запрос уже откатила его сессия (get_session)
+            self.timeout_counts[name] += 1
+            DB_TIMEOUTS.inc(name)
+            raise DBTimeout(name) from e
+        except DBAPIError as e:
+            if getattr(e.orig, 'sqlstate', None) not in TIMEOUT_SQLSTATES:
+                raise
+            self.timeout_counts[name] += 1
+            DB_TIMEOUTS.inc(name)
+            raise DBTimeout(name) from e
+        finally:
+            query_class_ctx.reset(token)
+
+    def mark_written(self, tg_id: Optional[int] = None) -> None:
+        """
+        Отметка записи: пользователь tg_id и текущее обновление
+        до конца окна читают с primary.
+        """
+        if tg_id is not None:
+            self.sticky_users.set(tg_id, True)
+        session = _session_ctx.get()
+        if session is not None:
+            session.info['wrote'] = True
+
+    def _needs_primary(self, tg_id: Optional[int]) -> bool:
+        if tg_id is not None and tg_id in self.sticky_users:
+            return True
+        session = _session_ctx.get()
+        return session is not None and session.info.get('wrote', False)
+
+    async def run_read(self,
+                       query: Callable[[AsyncSession], Awaitable],
+                       tg_id: Optional[int] = None):
+        """
+        Выполнение запроса только на чтение query(session) на реплике.
+        Запрос идет на primary, если реплик нет или нет здоровых, если
+        пользователь tg_id недавно изменял данные или текущее обновление уже
+        что-то записало. При ошибке соединения реплика исключается,
+        а запрос повторяется на primary.
+        """
+        index = None
+        if self.replicas is not None and not self._needs_primary(tg_id):
+            index = self.replicas.pick()
+        if index is not None:
+            try:
+                async with self.replicas.session(index) as session:
+                    # таймауты класса вызова, как в get_session
+                    await self._apply_timeouts(session)
+                    return await query(session)
+            except (OSError, OperationalError, InterfaceError,
+                    asyncio.TimeoutError) as e:
+                logger.warning(f'Реплика #{index}: {e}, чтение с primary')
+                self.replicas.mark_down(index)
+        async with self.get_session() as session:
+            return await query(session)
+
+    @staticmethod
+    def after_commit(session: AsyncSession, callback) -> None:
+        """
+        Выполнение callback после фиксации транзакции: в unit_of_work - в конце
+        обновления, иначе сразу (get_session уже вышел из транзакции).
+        Нужно, чтобы кеши не ссылались на записи из откаченной транзакции.
+        """
+        if _session_ctx.get() is session:
+            session.info.setdefault('after_commit', []).append(callback)
+        else:
+            callback()
+
+    @query_class('read')
     async def get_user_by_tg_id(self, tg_id: int) -> Optional[User]:
         async with self.get_session() as session:  
             result = await session.execute(
@@ -45,150 +432,323 @@ class DB:
             )
             return result.scalars().first()
         
+    @query_class('write')
     async def add_user(self, user: User) -> None:
+        self.mark_written(user.tg_id)
         async with self.get_session() as session:
             session.add(user)
+            await session.flush()  # чтобы получить user.id
+        self.after_commit(session,
+                          lambda: self.users.set_ids(user.tg_id, user.id))
+
+    @query_class('read')
+    async def resolve_user(
+            self, tg_id: int
+    ) -> Optional[Tuple[int, Optional[int]]]:
+        """
+        Получение (user_id, cart_id) по tg_id: из кеша, при промахе - из БД.
+        Незарегистрированные пользователи не кешируются.
+        """
+        ids = self.users.get_ids(tg_id)
+        if ids is not None:
+            return ids
+        async with self.get_session() as session:
+            result = await session.execute(
+                select(User.id, Cart.id)
+                .outerjoin(Cart, Cart.user_id == User.id)
+                .where(User.tg_id == literal(tg_id))
+            )
+            row = result.first()
+        if row is None:
+            return None
+        self.users.set_ids(tg_id, row[0], row[1])
+        return row[0], row[1]
+
+    @query_class('bulk')
+    async def warm_user_cache(self, batch_size: int = 5000) -> int:
+        """
+        Прогрев кеша пользователей при старте: сначала с диска, если есть
+        сохраненный кеш, затем из БД пачками по batch_size (keyset-пагинация
+        по id) до заполнения кеша. Записи с диска сверяются с БД тем же
+        проходом по tg_id: пользователь мог быть удален, корзина - пересоздана.
+        """
+        if self.users.load():
+            await self._check_loaded_users(batch_size)
+        last_id = 0
+        while len(self.users) < self.users.maxsize:
+            async with self.get_session() as session:
+                result = await session.execute(
+                    select(User.id, User.tg_id, Cart.id)
+                    .outerjoin(Cart, Cart.user_id == User.id)
+                    .where(User.id > literal(last_id))
+                    .order_by(User.id)
+                    .limit(batch_size)
+                )
+                rows = result.all()
+            if not rows:
+                break
+            for user_id, tg_id, cart_id in rows:
+                # загруженные с диска записи уже сверены
+                if tg_id in self.users:
+                    continue
+                if len(self.users) >= self.users.maxsize:
+                    break
+                self.users.set_ids(tg_id, user_id, cart_id)
+            last_id = rows[-1][0]
+        return len(self.users)
+
+    async def _check_loaded_users(self, batch_size: int) -> None:
+        """
+        Сверка загруженных с диска записей с users_user/users_cart:
+        удаленные пользователи вытесняются, измененные ids перечитываются.
+        Совпавшие записи сохраняют оставшееся время жизни из файла.
+        """
+        tg_ids = sorted(self.users.keys())
+        for start in range(0, len(tg_ids), batch_size):
+            batch = tg_ids[start:start + batch_size]
+            async with self.get_session() as session:
+                result = await session.execute(
+                    select(User.tg_id, User.id, Cart.id)
+                    .outerjoin(Cart, Cart.user_id == User.id)
+                    .where(User.tg_id.in_(batch))
+                )
+                actual = {tg_id: (user_id, cart_id)
+                          for tg_id, user_id, cart_id in result.all()}
+            for tg_id in batch:
+                ids = actual.get(tg_id)
+                if ids is None:
+                    self.users.pop(tg_id)
+                elif ids != self.users.get_ids(tg_id):
+                    self.users.set_ids(tg_id, *ids)
+
+    @asynccontextmanager
+    async def evict_user_on_conflict(self, tg_id: int) -> AsyncIterator[None]:
+        """
+        Запись по ids из кеша пользователей: если пользователь или корзина
+        удалены (IntegrityError по внешнему ключу), запись кеша вытесняется -
+        следующий вызов прочитает ids из БД.
+        """
+        session = _session_ctx.get()
+        if session is not None:
+            # внешние ключи Django отложенные (INITIALLY DEFERRED): в
+            # unit_of_work нарушение всплывет при COMMIT, вытеснит его обработчик
+            session.info.setdefault('conflict_users', set()).add(tg_id)
+        try:
+            yield
+        except IntegrityError:
+            self.users.pop(tg_id)
+            raise
 
+    def _stale_categories(
+            self,
+            current_category: Type[Union[SubCategory, Category]],
+            category_id: Optional[int] = None
+    ) -> Optional[List[CategoryRow]]:
+        # БД не отвечает - устаревший каталог лучше ошибки
+        key = (current_category.__tablename__, category_id)
+        categories = self.catalog_stale.get(key)
+        if categories is not None:
+            logger.warning(f'get_categories {key}: таймаут, отдан кеш')
+        return categories
+
+    @query_class('catalog', on_timeout=_stale_categories)
     async def get_categories(
             self,  # Type - чтобы передавать класс, а не объект
             current_category: Type[Union[SubCategory, Category]],
             category_id: Optional[int] = None
-    ) -> List[Union[Category, SubCategory]]:
-        async with self.get_session() as session:
-            query = select(current_category)
+    ) -> List[CategoryRow]:
+        async def query_categories(session: AsyncSession) -> List[CategoryRow]:
+            query = select(current_category.id, current_category.name)
             # Если передан category_id и ищем подкатегории, добавляем фильтр
             if category_id is not None and current_category == SubCategory:
                 query = query.where(SubCategory.category_id == literal(category_id))
             result = await session.execute(query)
-            return list(result.scalars().all())
+            return [CategoryRow(*row) for row in result.all()]
 
+        key = (current_category.__tablename__, category_id)
+        categories = await self.catalog_flight.do(
+            key, lambda: self.run_read(query_categories)
+        )
+        self.catalog_stale.set(key, categories)
+        return categories
+
+    @query_class('read')
     async def get_cart_item_qty(
             self, subcategory_id: int, tg_id: int
-    ) -> List[Tuple[Product, int]]:
-        async with self.get_session() as session:  
+    ) -> List[Tuple[ProductRow, int]]:
+        ids = await self.resolve_user(tg_id)
+        cart_id = ids[1] if ids else None
+        if self.fast_reads:
+            return await self.fast_reads.get_cart_item_qty(subcategory_id,
+                                                           cart_id, tg_id)
+
+        async def query(session: AsyncSession) -> list:
             result = await session.execute(
-                select(Product, CartItem.quantity)
+                select(*PRODUCT_COLUMNS, CartItem.quantity)
                 .outerjoin(
                     CartItem,
                     and_(
                         CartItem.product_id == Product.id,
-                        CartItem.cart.has(
-                            Cart.user.has(User.tg_id == literal(tg_id))
-                        )
+                        # нет корзины - id = 0 не совпадет ни с одной записью
+                        CartItem.cart_id == literal(cart_id or 0)
                     )
                 )
                 .where(Product.subcategory_id == literal(subcategory_id))
+                # порядок страниц стабилен, индекс (subcategory_id, id)
+                .order_by(Product.id)
             )
-            rows = result.all()
+            return result.all()
 
-        return [(product, quantity if quantity is not None else 0)
-                for product, quantity in rows]
+        rows = await self.run_read(query, tg_id)
+        return [(ProductRow(*row[:-1]), row[-1] if row[-1] is not None else 0)
+                for row in rows]
 
+    @query_class('read')
     async def get_cart_items_with_quantities(
             self, tg_id: int
-    ) -> List[Tuple[Product, int]]:
-        async with self.get_session() as session:
+    ) -> List[Tuple[ProductRow, int]]:
+        ids = await self.resolve_user(tg_id)
+        if not ids or ids[1] is None:
+            return []
+        if self.fast_reads:
+            return await self.fast_reads.get_cart_items_with_quantities(ids[1],
+                                                                        tg_id)
+
+        async def query(session: AsyncSession) -> List[Tuple[ProductRow, int]]:
             result = await session.execute(
-                select(Product, CartItem.quantity)
+                select(*PRODUCT_COLUMNS, CartItem.quantity)
                 .join(CartItem, Product.id == CartItem.product_id)
-                .join(Cart, Cart.id == CartItem.cart_id)
-                .join(User)
-                .where(User.tg_id == literal(tg_id))
+                .where(CartItem.cart_id == literal(ids[1]))
             )
-            return [(row[0], row[1]) for row in result.all()]
+            return [(ProductRow(*row[:-1]), row[-1]) for row in result.all()]
 
+        return await self.run_read(query, tg_id)
+
+    @query_class('write')
     async def save_current_quantity_in_cart(
             self, tg_id: int, items: List[Tuple[int, int, int]],  # (message_id, product_id, quantity)
     ):
-        async with self.get_session() as session:
-            user = await self.get_user_by_tg_id(tg_id)
-            # Получение корзины пользователя
-            result = await session.execute(
-                select(Cart).where(Cart.user_id == literal(user.id))
-            )
+        ids = await self.resolve_user(tg_id)
+        if ids is None:
+            raise Exception(f"Пользователь {tg_id} не найден")
+        user_id, cart_id = ids
+        self.mark_written(tg_id)
+        async with self.evict_user_on_conflict(tg_id), self.get_session() as session:
+            if cart_id is None:
+                # Получение корзины пользователя
+                result = await session.execute(
+                    select(Cart.id).where(Cart.user_id == literal(user_id))
+                )
+                cart_id = result.scalar()
             # Если корзины нет, создание корзины
-            cart = result.scalars().first()
-            if not cart:
-                cart = Cart(user_id=user.id)
+            if cart_id is None:
+                cart = Cart(user_id=user_id)
                 session.add(cart)
                 await session.flush()  # чтобы получить cart.id
-            # Поиск существующего CartItem для данного продукта в корзине
-            try:
-                for _, product_id, new_quantity in items:
-                    result = await session.execute(
-                        select(CartItem).where(
-                            CartItem.cart_id == literal(cart.id),
-                            CartItem.product_id == literal(product_id)
-                        )
-                    )
-                    cart_item = result.scalars().first()
-                    if new_quantity:
-                        if cart_item:
-                            cart_item.quantity = new_quantity
-                        else:  # Если элемента нет, создание нового
-                            cart_item = CartItem(cart_id=cart.id,
-                                                 product_id=product_id,
-                                                 quantity=new_quantity)
-                            session.add(cart_item)
-                    else:
-                        if cart_item:
-                            await session.delete(cart_item)
-            except Exception as e:
-                logger.error(f'Error save_current_quantity_in_cart (for): {e}')
+                cart_id = cart.id
+            # одно сообщение на товар: при повторе побеждает последнее количество
+            quantities = {product_id: quantity for _, product_id, quantity in items}
+            upserts = [{'cart_id': cart_id, 'product_id': product_id,
+                        'quantity': quantity}
+                       for product_id, quantity in quantities.items() if quantity]
+            removed = [product_id for product_id, quantity in quantities.items()
+                       if not quantity]
+            if upserts:
+                stmt = pg_insert(CartItem).values(upserts)
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=[CartItem.cart_id, CartItem.product_id],
+                    set_={'quantity': stmt.excluded.quantity},
+                ))
+            if removed:
+                await session.execute(
+                    delete(CartItem).where(CartItem.cart_id == literal(cart_id),
+                                           CartItem.product_id.in_(removed))
+                )
+        self.after_commit(session,
+                          lambda: self.users.set_cart(tg_id, cart_id))
 
+    @query_class('write')
     async def create_order_db(self, tg_id: int, delivery_info: str) -> int:
-        async with self.get_session() as session:
-            # Получение корзины пользователя с загрузкой связанных элементов (cartitems)
+        ids = await self.resolve_user(tg_id)
+        if not ids or ids[1] is None:
+            raise Exception("Корзина пуста")
+        user_id, cart_id = ids
+        self.mark_written(tg_id)
+        async with self.evict_user_on_conflict(tg_id), self.get_session() as session:
+            # товары корзины с текущими ценами
             result = await session.execute(
-                select(Cart)
-                .options(selectinload(Cart.cartitems),
-                         selectinload(Cart.user))
-                .join(User)
-                .where(User.tg_id == literal(tg_id))
+                select(CartItem.product_id, CartItem.quantity, Product.price)
+                .join(Product, Product.id == CartItem.product_id)
+                .where(CartItem.cart_id == literal(cart_id))
             )
-            cart = result.scalars().first()
-            if not cart:
-                raise Exception("Корзина пуста")
+            items = result.all()
 
-            # Создание нового заказа
-            order = Order(user_id=cart.user.id, status=OrderStatus.NOT_PAID,
-                          delivery=delivery_info)
+            # Создание нового заказа: сумма, число товаров и цены фиксируются
+            order = Order(user_id=user_id, status=OrderStatus.NOT_PAID,
+                          delivery=delivery_info,
+                          total=sum((price * quantity for _, quantity, price in items),
+                                    Decimal(0)),
+                          items_count=sum(quantity for _, quantity, _ in items))
             session.add(order)
             await session.flush()  # чтобы получить order.id до создания OrderItem
 
-            # Перебираем все элементы корзины и создаем для каждого заказанный товар
-            for cart_item in cart.cartitems:
-                order_item = OrderItem(order_id=order.id,
-                                       product_id=cart_item.product_id,
-                                       quantity=cart_item.quantity)
-                session.add(order_item)
-                await session.delete(cart_item)  # удаление из корзины
+            session.add_all(OrderItem(order_id=order.id,
+                                      product_id=product_id,
+                                      quantity=quantity,
+                                      price=price)
+                            for product_id, quantity, price in items)
+            # очистка корзины
+            await session.execute(
+                delete(CartItem).where(CartItem.cart_id == literal(cart_id))
+            )
             return order.id
 
-    async def get_orders_by_user(self, tg_id: int) -> list[Order]:
-        async with self.get_session() as session:
+    @query_class('read')
+    async def get_orders_by_user(
+            self, tg_id: int
+    ) -> list[OrderRow]:
+        ids = await self.resolve_user(tg_id)
+        if ids is None:
+            return []
+        if self.fast_reads:
+            return await self.fast_reads.get_orders_by_user(ids[0], tg_id)
+
+        async def query(session: AsyncSession) -> list[OrderRow]:
             result = await session.execute(
-                select(Order)
-                .join(User, Order.user_id == User.id)
-                .where(User.tg_id == literal(tg_id))
+                select(*ORDER_COLUMNS).where(Order.user_id == literal(ids[0]))
             )
-            orders = result.scalars().all()
-            return list(orders)
+            return [OrderRow(*row) for row in result.all()]
+
+        return await self.run_read(query, tg_id)
 
-    async def get_order_by_id(self, order_id: int) -> Optional[Order]:
+    @query_class('read')
+    async def get_order_by_id(
+            self, order_id: int
+    ) -> Optional[OrderRow]:
+        if self.fast_reads:
+            return await self.fast_reads.get_order_by_id(order_id)
         async with self.get_session() as session:
             result = await session.execute(
-                select(Order).where(Order.id == literal(order_id))
+                select(*ORDER_COLUMNS).where(Order.id == literal(order_id))
             )
-            return result.scalars().first()
+            row = result.first()
+            return OrderRow(*row) if row else None
 
+    @query_class('write')
     async def delete_order(self, order_id: int):
+        self.mark_written()
         async with self.get_session() as session:
             order = await session.get(Order, order_id, options=[selectinload(Order.orderitems)])
             if order:
+                # внешние ключи Джанго без ON DELETE CASCADE
+                await session.execute(
+                    delete(Payment).where(Payment.order_id == literal(order_id))
+                )
                 await session.delete(order)
 
+    @query_class('write')
     async def set_order_status(self, order_id: int, status: OrderStatus):
+        self.mark_written()
         async with self.get_session() as session:
             result = await session.execute(
                 select(Order).where(Order.id == literal(order_id))
@@ -197,7 +757,15 @@ class DB:
             if order:
                 order.status = status
 
-    async def set_order_payment_id(self, order_id: int, payment_id: str):
+    @query_class('write')
+    async def set_order_payment_id(self, order_id: int, payment_id: str,
+                                   check_after: float = 0):
+        """
+        Новый платеж заказа. Платеж записывается и в orders_payment: сверка
+        проверит его через check_after секунд и будет проверять до итога,
+        даже если заказ получит следующий платеж.
+        """
+        self.mark_written()
         async with self.get_session() as session:
             result = await session.execute(
                 select(Order).where(Order.id == literal(order_id))
@@ -205,26 +773,177 @@ class DB:
             order = result.scalars().first()
             if order:
                 order.payment_id = payment_id
+            if order and payment_id:
+                await session.execute(
+                    pg_insert(Payment).values(
+                        payment_id=payment_id, order_id=order_id,
+                        check_at=func.now() + timedelta(seconds=check_after)
+                    ).on_conflict_do_nothing()
+                )
 
-    async def get_order_sum(self, order_id: int) -> Tuple[int, Order]:
+    async def settle_payment(
+            self, payment_id: str, paid: bool
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Итог одного платежа (см. settle_payments): (order_id, tg_id)
+        или None, если заказ уже изменен - повторное уведомление.
+        """
+        settled = await self.settle_payments([payment_id], paid)
+        return settled[0] if settled else None
+
+    @query_class('write')
+    async def settle_payments(
+            self, payment_ids: List[str], paid: bool
+    ) -> List[Tuple[int, int]]:
+        """
+        Итог платежей: оплачен - статус PAID, отменен - заказ остается
+        неоплаченным, платеж запоминается в canceled_payment_id.
+        payment_id очищается одним UPDATE вместе со статусом.
+        Изменяются только неоплаченные заказы с этими payment_id, поэтому
+        повторный вызов ничего не меняет. Результат - [(order_id, tg_id)].
+        Платежи больше не проверяются сверкой.
+        """
+        settled = await self._settle_orders(Order.payment_id.in_(payment_ids), paid)
+        await self.drop_payments(payment_ids)
+        return settled
+
+    @query_class('write')
+    async def mark_orders_paid(
+            self, payments: Dict[int, str]
+    ) -> List[Tuple[int, int]]:
+        """
+        Оплата заказов {order_id: payment_id} по id заказа, независимо
+        от текущего payment_id (заказ мог получить новый платеж, пока
+        оплачивался прежний). Платеж запоминается в paid_payment_id.
+        Результат - [(order_id, tg_id)] заказов, которые были неоплачены.
+        """
+        if not payments:
+            return []
+        return await self._settle_orders(Order.id.in_(payments), True,
+                                         case(payments, value=Order.id))
+
+    @query_class('write')
+    async def set_canceled_payment_id(self, order_id: int, payment_id: str) -> None:
+        """Отмененный платеж заказа: из него выводится ключ следующего"""
+        self.mark_written()
+        async with self.get_session() as session:
+            await session.execute(
+                update(Order)
+                .where(Order.id == literal(order_id),
+                       Order.status == literal(OrderStatus.NOT_PAID))
+                .values(canceled_payment_id=payment_id)
+                .execution_options(synchronize_session=False)
+            )
+
+    @query_class('read')
+    async def get_paid_payment_id(self, order_id: int) -> Optional[str]:
+        """Платеж, которым оплачен заказ (None - неизвестен или не оплачен)"""
         async with self.get_session() as session:
             result = await session.execute(
-                select(Order)
-                .options(selectinload(Order.orderitems)
-                         .selectinload(OrderItem.products))
-                .where(Order.id == literal(order_id))
+                select(Order.paid_payment_id).where(Order.id == literal(order_id))
             )
-            order = result.scalars().first()
-        if not order:
-            return 0, order
-        total = sum(item.products.price * item.quantity for item in order.orderitems)
-        return total, order
+            return result.scalar()
 
-    async def get_all_tg_ids(self) -> list[int]:
+    async def _settle_orders(self, condition, paid: bool,
+                             paid_payment_id=Order.payment_id) -> List[Tuple[int, int]]:
+        self.mark_written()
+        # SET вычисляется по прежним значениям строки: payment_id еще не очищен
+        values = {'payment_id': ''}
+        if paid:
+            values.update(status=OrderStatus.PAID, paid_payment_id=paid_payment_id)
+        else:
+            values.update(canceled_payment_id=Order.payment_id)
         async with self.get_session() as session:
+            result = await session.execute(
+                update(Order)
+                .where(condition,
+                       Order.status == literal(OrderStatus.NOT_PAID),
+                       Order.user_id == User.id)
+                .values(**values)
+                .returning(Order.id, User.tg_id)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+        for _, tg_id in rows:
+            self.mark_written(tg_id)
+        return [(order_id, tg_id) for order_id, tg_id in rows]
+
+    @query_class('bulk')
+    async def get_due_payments(
+            self, limit: int
+    ) -> List[Tuple[str, int, int, float]]:
+        """
+        Платежи, которым подошло время проверки:
+        [(payment_id, order_id, число проверок, возраст в секундах)].
+        Сначала платежи с меньшим числом проверок - новые платежи
+        оплачивают прямо сейчас, старые ждут (индекс payment_due_idx).
+        """
+        async with self.get_session() as session:
+            result = await session.execute(
+                select(Payment.payment_id, Payment.order_id, Payment.checks,
+                       func.extract('epoch', func.now() - Payment.created_at))
+                .where(Payment.check_at <= func.now())
+                .order_by(Payment.checks, Payment.check_at)
+                .limit(limit)
+            )
+            return [(payment_id, order_id, checks, float(age))
+                    for payment_id, order_id, checks, age in result.all()]
+
+    @query_class('bulk')
+    async def count_pending_payments(self) -> int:
+        async with self.get_session() as session:
+            result = await session.execute(select(func.count()).select_from(Payment))
+            return result.scalar()
+
+    @query_class('write')
+    async def postpone_payments(
+            self, payment_ids: List[str], min_delay: float, max_delay: float
+    ) -> None:
+        """
+        Следующая проверка незавершенных платежей: интервал растет
+        экспоненциально с числом проверок, +-10%, чтобы проверки не шли пачками.
+        """
+        if not payment_ids:
+            return
+        delay = func.least(min_delay * func.power(2, Payment.checks + 1), max_delay)
+        async with self.get_session() as session:
+            await session.execute(
+                update(Payment)
+                .where(Payment.payment_id.in_(payment_ids))
+                .values(checks=Payment.checks + 1,
+                        check_at=func.now() + func.make_interval(
+                            0, 0, 0, 0, 0, 0, delay * (0.9 + func.random() * 0.2)
+                        ))
+                .execution_options(synchronize_session=False)
+            )
+
+    @query_class('write')
+    async def drop_payments(self, payment_ids: List[str]) -> None:
+        """Платежи с известным итогом больше не проверяются"""
+        if not payment_ids:
+            return
+        async with self.get_session() as session:
+            await session.execute(
+                delete(Payment).where(Payment.payment_id.in_(payment_ids))
+                .execution_options(synchronize_session=False)
+            )
+
+    @query_class('read')
+    async def get_order_sum(
+            self, order_id: int
+    ) -> Tuple[Decimal, Optional[OrderRow]]:
+        # сумма сохранена в заказе при создании
+        order = await self.get_order_by_id(order_id)
+        return (order.total if order else Decimal(0)), order
+
+    @query_class('bulk')
+    async def get_all_tg_ids(self) -> list[int]:
+        async def query(session: AsyncSession) -> list[int]:
             result = await session.execute(select(User.tg_id))
             return list(result.scalars().all())
 
+        return await self.run_read(query)
+
     async def seed_db(self):
         try:
             async with self.get_session() as session:
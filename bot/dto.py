@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional
+
+
+# Легковесные строки результатов запросов: без состояния ORM,
+# identity map и связей. Только поля, которые используют хендлеры.
+
+
+@dataclass(frozen=True, slots=True)
+class CategoryRow:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True, slots=True)
+class ProductRow:
+    id: int
+    name: str
+    description: Optional[str]
+    price: Decimal
+    image_url: Optional[str]
+
+
+@dataclass(frozen=True, slots=True)
+class OrderRow:
+    id: int
+    status: str
+    payment_id: Optional[str]
+    total: Decimal
+    items_count: int
+    canceled_payment_id: Optional[str] = None
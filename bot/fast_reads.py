@@ -0,0 +1,115 @@
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+from dto import ProductRow, OrderRow
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from db import DB
+
+
+# Запросы выполняются напрямую через соединение asyncpg из пула SQLAlchemy.
+# asyncpg подготавливает каждый запрос на сервере один раз на соединение
+# и переиспользует prepared statement из своего кеша (statement_cache_size).
+CART_ITEM_QTY_SQL = """
+    SELECT p.id, p.name, p.description, p.price, p.image_url,
+           COALESCE(ci.quantity, 0)
+    FROM products_product p
+    LEFT JOIN users_cartitem ci
+           ON ci.product_id = p.id AND ci.cart_id = $2
+    WHERE p.subcategory_id = $1
+    ORDER BY p.id
+"""
+
+CART_ITEMS_SQL = """
+    SELECT p.id, p.name, p.description, p.price, p.image_url, ci.quantity
+    FROM users_cartitem ci
+    JOIN products_product p ON p.id = ci.product_id
+    WHERE ci.cart_id = $1
+"""
+
+ORDERS_BY_USER_SQL = """
+    SELECT id, status, payment_id, total, items_count, canceled_payment_id
+    FROM orders_order
+    WHERE user_id = $1
+"""
+
+ORDER_BY_ID_SQL = """
+    SELECT id, status, payment_id, total, items_count, canceled_payment_id
+    FROM orders_order
+    WHERE id = $1
+"""
+
+
+class _FetchCursor:
+    """
+    Курсор для событий before/after_cursor_execute: запросы быстрого пути
+    учитываются теми же слушателями, что и запросы ORM (счетчики обращений
+    DB, SqlProfiler, журнал медленных запросов, бюджет сценариев).
+    """
+
+    __slots__ = ('rowcount',)
+
+    def __init__(self):
+        self.rowcount = -1
+
+
+class FastReads:
+    """
+    Быстрый путь для самых частых запросов на чтение: без материализации
+    ORM-объектов, результат - легковесные строки из dto.
+    Соединение берется из сессии DB (реплики или primary, см. DB.run_read),
+    поэтому внутри unit_of_work запросы видят незафиксированные изменения
+    этого же обновления.
+    """
+
+    def __init__(self, db: 'DB'):
+        self.db = db
+
+    async def _fetch(self, sql: str, *args,
+                     tg_id: Optional[int] = None,
+                     replica: bool = True) -> list:
+        async def query(session: 'AsyncSession') -> list:
+            connection = await session.connection()
+            raw_connection = await connection.get_raw_connection()
+            sync_connection = connection.sync_connection
+            cursor = _FetchCursor()
+            sync_connection.dispatch.before_cursor_execute(
+                sync_connection, cursor, sql, args, None, False
+            )
+            rows = await raw_connection.driver_connection.fetch(sql, *args)
+            cursor.rowcount = len(rows)
+            sync_connection.dispatch.after_cursor_execute(
+                sync_connection, cursor, sql, args, None, False
+            )
+            return rows
+
+        if replica:
+            return await self.db.run_read(query, tg_id)
+        async with self.db.get_session() as session:
+            return await query(session)
+
+    async def get_cart_item_qty(
+            self, subcategory_id: int, cart_id: Optional[int],
+            tg_id: Optional[int] = None
+    ) -> List[Tuple[ProductRow, int]]:
+        rows = await self._fetch(CART_ITEM_QTY_SQL, subcategory_id, cart_id or 0,
+                                 tg_id=tg_id)
+        return [(ProductRow(*row[:5]), row[5]) for row in rows]
+
+    async def get_cart_items_with_quantities(
+            self, cart_id: int, tg_id: Optional[int] = None
+    ) -> List[Tuple[ProductRow, int]]:
+        rows = await self._fetch(CART_ITEMS_SQL, cart_id, tg_id=tg_id)
+        return [(ProductRow(*row[:5]), row[5]) for row in rows]
+
+    async def get_orders_by_user(
+            self, user_id: int, tg_id: Optional[int] = None
+    ) -> List[OrderRow]:
+        rows = await self._fetch(ORDERS_BY_USER_SQL, user_id, tg_id=tg_id)
+        return [OrderRow(*row) for row in rows]
+
+    async def get_order_by_id(self, order_id: int) -> Optional[OrderRow]:
+        # заказ читается сразу после создания и при оплате - только primary
+        rows = await self._fetch(ORDER_BY_ID_SQL, order_id, replica=False)
+        return OrderRow(*rows[0]) if rows else None
@@ -0,0 +1,12 @@
+"""
+Окружение для прогона обновлений через настоящие роутеры без Telegram:
+фейковый Bot API, записывающая сессия Bot, хранилище FSM со счетчиком
+обращений, фабрика сырых обновлений, сценарии и локальный сервер Bot API.
+"""
+from .fake_api import FakeTelegramAPI
+from .flows import buttons, pick_subcategory, shop_flow
+from .server import FakeBotAPIServer
+from .session import RecordingSession
+from .storage import CountingStorage
+from .updates import UpdateFactory
+from .yookassa import FakeYooKassa
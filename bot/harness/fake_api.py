@@ -0,0 +1,62 @@
+import itertools
+import json
+import time
+from typing import Any
+
+# методы, которые возвращают отправленное/измененное сообщение
+MESSAGE_METHODS = {'sendMessage', 'sendPhoto', 'sendDocument', 'sendVideo',
+                   'editMessageText', 'editMessageCaption',
+                   'editMessageReplyMarkup', 'editMessageMedia'}
+
+
+class FakeTelegramAPI:
+    """
+    Ответы Bot API без Telegram. Параметры принимаются в том виде, в котором
+    их отправляет aiogram (строки, вложенные объекты - JSON), результат -
+    поле result ответа Bot API.
+    """
+
+    def __init__(self, bot_id: int = 42, member_status: str = 'member'):
+        self.me = {'id': bot_id, 'is_bot': True,
+                   'first_name': 'Test bot', 'username': 'test_bot'}
+        # статус любого пользователя в getChatMember (подписка на канал)
+        self.member_status = member_status
+        self._message_ids = itertools.count(1_000_000)
+
+    def result(self, api_method: str, params: dict[str, Any]) -> Any:
+        if api_method == 'getMe':
+            return self.me
+        if api_method == 'getChatMember':
+            return {'status': self.member_status,
+                    'user': {'id': int(params['user_id']), 'is_bot': False,
+                             'first_name': 'User'}}
+        if api_method == 'copyMessage':
+            return {'message_id': next(self._message_ids)}
+        if api_method in MESSAGE_METHODS:
+            if 'chat_id' not in params:
+                return True  # inline-сообщение
+            return self.message(params)
+        return True
+
+    def message(self, params: dict[str, Any]) -> dict:
+        chat_id = str(params['chat_id'])
+        if chat_id.lstrip('-').isdigit():
+            chat = {'id': int(chat_id), 'type': 'private'}
+        else:
+            chat = {'id': -1, 'type': 'channel', 'username': chat_id.lstrip('@')}
+        message = {'message_id': int(params.get('message_id')
+                                     or next(self._message_ids)),
+                   'date': int(time.time()),
+                   'chat': chat,
+                   'from': self.me}
+        for key in ('text', 'caption'):
+            if key in params:
+                message[key] = params[key]
+        if 'photo' in params:
+            message['photo'] = [{'file_id': 'photo', 'file_unique_id': 'photo',
+                                 'width': 1, 'height': 1}]
+        if 'reply_markup' in params:
+            markup = params['reply_markup']
+            message['reply_markup'] = (json.loads(markup)
+                                       if isinstance(markup, str) else markup)
+        return message
@@ -0,0 +1,70 @@
+from typing import Awaitable, Callable, Iterable
+
+from sqlalchemy import func, select
+
+from harness.updates import UpdateFactory
+from models import Product
+from settings import db
+
+# send(шаг, обновление) -> ответы Bot API (result), полученные за шаг
+Send = Callable[[str, dict], Awaitable[list]]
+
+
+def buttons(results: Iterable, prefix: str) -> list[tuple[int, str]]:
+    """(message_id, callback_data) кнопок с callback_data на prefix в ответах"""
+    found = []
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        markup = result.get('reply_markup') or {}
+        for row in markup.get('inline_keyboard', []):
+            for button in row:
+                data = button.get('callback_data') or ''
+                if data.startswith(prefix):
+                    found.append((result['message_id'], data))
+    return found
+
+
+async def pick_subcategory() -> tuple[int, int]:
+    """Категория и подкатегория с наибольшим числом товаров"""
+    async with db.get_session() as session:
+        row = (await session.execute(
+            select(Product.category_id, Product.subcategory_id)
+            .group_by(Product.category_id, Product.subcategory_id)
+            .order_by(func.count(Product.id).desc())
+            .limit(1)
+        )).first()
+    if row is None:
+        raise SystemExit('Нет данных: нужен каталог товаров')
+    return row[0], row[1]
+
+
+async def shop_flow(send: Send,
+                    updates: UpdateFactory,
+                    category_id: int,
+                    subcategory_id: int) -> None:
+    """
+    Сценарий покупки: /start -> каталог -> страница 2 -> +/- -> подтвердить ->
+    доставка -> заказ -> оплата -> заказы -> удаление заказа.
+    В подкатегории должно быть не меньше 6 товаров.
+    """
+    await send('start', updates.message('/start'))
+    await send('catalog', updates.callback('category_choice'))
+    await send('category', updates.callback(f'category_id_{category_id}'))
+    await send('subcategory', updates.callback(f'subcategory_id_{subcategory_id}'))
+    results = await send('page_2', updates.callback(
+        f'subcategory_id_{subcategory_id}_page_2'
+    ))
+    message_id, increase = buttons(results, 'increase_')[0]
+    decrease = increase.replace('increase_', 'decrease_')
+    await send('increase', updates.callback(increase, message_id))
+    await send('increase_again', updates.callback(increase, message_id))
+    await send('decrease', updates.callback(decrease, message_id))
+    await send('confirm', updates.callback('show_cart'))
+    await send('delivery', updates.callback('send_delivery_choice'))
+    results = await send('create_order', updates.callback('create_order'))
+    _, pay = buttons(results, 'pay_order_')[0]
+    order_id = pay.removeprefix('pay_order_')
+    await send('pay', updates.callback(pay))
+    await send('orders', updates.callback('show_orders'))
+    await send('delete_order', updates.callback(f'delete_order_{order_id}'))
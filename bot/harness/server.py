@@ -0,0 +1,119 @@
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Optional
+
+from aiohttp import ClientSession, web
+
+from harness.fake_api import FakeTelegramAPI
+
+
+class FakeBotAPIServer:
+    """
+    Локальный Bot API для нагрузочных тестов: /bot<token>/<method>.
+    Обновления отдаются через getUpdates (long polling) или отправляются
+    на webhook_url. Ответы формирует FakeTelegramAPI с задержкой
+    latency (секунды, +-50%) и ошибками 429: с вероятностью error_rate
+    и при превышении rate_limit вызовов в секунду (0 - без ограничения).
+    Ответы бота сохраняются по чатам в results_by_chat.
+    """
+
+    def __init__(self,
+                 api: Optional[FakeTelegramAPI] = None,
+                 latency: float = 0.05,
+                 error_rate: float = 0.0,
+                 rate_limit: int = 0,
+                 retry_after: int = 1,
+                 webhook_url: Optional[str] = None):
+        self.api = api or FakeTelegramAPI()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.webhook_url = webhook_url
+        self.updates: asyncio.Queue[dict] = asyncio.Queue()
+        self.results_by_chat: dict[int, list] = defaultdict(list)
+        self.calls: Counter[str] = Counter()
+        self.rate_limited: Counter[str] = Counter()
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._client: Optional[ClientSession] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8081) -> str:
+        """Запуск сервера, возвращает базовый URL для TelegramAPIServer.from_base"""
+        app = web.Application()
+        app.router.add_route('POST', '/bot{token}/{method}', self.handle)
+        app.router.add_route('GET', '/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        if self.webhook_url:
+            self._client = ClientSession()
+        return f'http://{host}:{port}'
+
+    async def stop(self) -> None:
+        if self._client:
+            await self._client.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def push(self, update: dict) -> None:
+        """Доставка обновления боту"""
+        if self._client:
+            async with self._client.post(self.webhook_url, json=update) as response:
+                response.raise_for_status()
+        else:
+            self.updates.put_nowait(update)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        api_method = request.match_info['method']
+        params = dict(await request.post())
+        params.update(request.query)
+        self.calls[api_method] += 1
+        if api_method == 'getUpdates':
+            return web.json_response({'ok': True,
+                                      'result': await self.get_updates(params)})
+
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self._limited():
+            self.rate_limited[api_method] += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after}
+            }, status=429)
+
+        result = self.api.result(api_method, params)
+        chat_id = str(params.get('chat_id', ''))
+        if chat_id.lstrip('-').isdigit():
+            self.results_by_chat[int(chat_id)].append(result)
+        return web.json_response({'ok': True, 'result': result})
+
+    async def get_updates(self, params: dict) -> list[dict]:
+        limit = int(params.get('limit', 100))
+        timeout = float(params.get('timeout', 0))
+        try:
+            if timeout:
+                first = await asyncio.wait_for(self.updates.get(), timeout)
+            else:
+                first = self.updates.get_nowait()
+        except (asyncio.TimeoutError, asyncio.QueueEmpty):
+            return []
+        updates = [first]
+        while len(updates) < limit and not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    def _limited(self) -> bool:
+        if self.error_rate and random.random() < self.error_rate:
+            return True
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 1:
+            self._window_start, self._window_calls = now, 0
+        self._window_calls += 1
+        return self._window_calls > self.rate_limit
@@ -0,0 +1,52 @@
+import json
+from typing import Any, AsyncGenerator, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from harness.fake_api import FakeTelegramAPI
+
+
+class RecordingSession(BaseSession):
+    """
+    Сессия Bot без сети: каждый вызов записывается в calls
+    как (метод, параметры, result), ответ формирует FakeTelegramAPI.
+    Middleware сессии (TelegramMetricsMiddleware и др.) работают как обычно.
+    """
+
+    def __init__(self, api: Optional[FakeTelegramAPI] = None):
+        super().__init__()
+        self.api = api or FakeTelegramAPI()
+        self.calls: list[tuple[str, dict, Any]] = []
+
+    async def make_request(self,
+                           bot: Bot,
+                           method: TelegramMethod[TelegramType],
+                           timeout: Optional[int] = None) -> TelegramType:
+        api_method = method.__api_method__
+        params = {}
+        for key, value in method.model_dump(warnings=False).items():
+            value = self.prepare_value(value, bot=bot, files={})
+            if value is not None:
+                params[key] = value
+        result = self.api.result(api_method, params)
+        self.calls.append((api_method, params, result))
+        response = self.check_response(
+            bot=bot, method=method, status_code=200,
+            content=json.dumps({'ok': True, 'result': result})
+        )
+        return response.result
+
+    async def stream_content(self,
+                             url: str,
+                             headers: Optional[dict[str, Any]] = None,
+                             timeout: int = 30,
+                             chunk_size: int = 65536,
+                             raise_for_status: bool = True
+                             ) -> AsyncGenerator[bytes, None]:
+        yield b''
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,33 @@
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.storage.base import StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+
+class CountingStorage(MemoryStorage):
+    """
+    MemoryStorage со счетчиком обращений к хранилищу FSM.
+    С Redis каждое обращение - сетевой запрос, поэтому их число
+    на шаг сценария так же важно, как число запросов к БД.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.ops: Counter[str] = Counter()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self.ops['set_state'] += 1
+        await super().set_state(key, state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        self.ops['get_state'] += 1
+        return await super().get_state(key)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self.ops['set_data'] += 1
+        await super().set_data(key, data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        self.ops['get_data'] += 1
+        return await super().get_data(key)
@@ -0,0 +1,42 @@
+import itertools
+import time
+from typing import Optional
+
+
+class UpdateFactory:
+    """Сырые обновления Telegram (dict) от имени одного пользователя"""
+
+    def __init__(self, tg_id: int, bot_user: dict, first_name: str = 'Test',
+                 username: Optional[str] = None, update_ids=None):
+        self.user = {'id': tg_id, 'is_bot': False, 'first_name': first_name}
+        if username:
+            self.user['username'] = username
+        self.bot_user = bot_user
+        self.chat = {'id': tg_id, 'type': 'private', 'first_name': first_name}
+        # общий счетчик update_id можно передать нескольким фабрикам
+        self._update_ids = update_ids or itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def message(self, text: str) -> dict:
+        """Сообщение пользователя"""
+        return {'update_id': next(self._update_ids),
+                'message': {'message_id': next(self._message_ids),
+                            'date': int(time.time()),
+                            'chat': self.chat,
+                            'from': self.user,
+                            'text': text}}
+
+    def callback(self, data: str, message_id: int = 1) -> dict:
+        """Нажатие инлайн-кнопки под сообщением бота message_id"""
+        update_id = next(self._update_ids)
+        return {'update_id': update_id,
+                'callback_query': {
+                    'id': str(update_id),
+                    'from': self.user,
+                    'chat_instance': str(self.user['id']),
+                    'data': data,
+                    'message': {'message_id': message_id,
+                                'date': int(time.time()),
+                                'chat': self.chat,
+                                'from': self.bot_user,
+                                'text': '...'}}}
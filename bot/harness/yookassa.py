@@ -0,0 +1,135 @@
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+from aiohttp import web
+
+from bot_worker.payments.client import YooKassaClient
+
+
+class FakeYooKassa:
+    """
+    Локальный API платежей YooKassa (/v3/payments) для YooKassaClient:
+    платежи живут в памяти, повтор POST с тем же Idempotence-Key возвращает
+    тот же платеж. Задержка ответа latency (секунды, +-50%), с вероятностью
+    error_rate - ответ 500 (проверка повторов клиента). Статус можно поменять
+    через set_status (например, на succeeded), тело уведомления
+    для /api/payments/yookassa/ - через notification.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payments: dict[str, dict] = {}
+        self.keys: dict[str, str] = {}  # Idempotence-Key -> id платежа
+        self.calls: Counter[str] = Counter()
+        self._runner: Optional[web.AppRunner] = None
+        self._client: Optional[YooKassaClient] = None
+        self._base_url = ''
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8083) -> str:
+        """Запуск сервера, возвращает базовый URL для YooKassaClient.base_url"""
+        app = web.Application()
+        app.router.add_post('/v3/payments', self.create)
+        app.router.add_get('/v3/payments/{payment_id}', self.find)
+        app.router.add_post('/v3/payments/{payment_id}/cancel', self.cancel)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f'http://{host}:{port}/v3'
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def install(self, client: YooKassaClient, port: int = 8083) -> 'FakeYooKassa':
+        """Запуск сервера и переключение клиента на него"""
+        self._client = client
+        self._base_url = client.base_url
+        client.base_url = await self.start(port=port)
+        return self
+
+    async def uninstall(self) -> None:
+        if self._client:
+            await self._client.close()
+            self._client.base_url = self._base_url
+            self._client = None
+        await self.stop()
+
+    async def _respond(self, operation: str) -> Optional[web.Response]:
+        self.calls[operation] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error(500, 'internal_server_error')
+        return None
+
+    @staticmethod
+    def error(status: int, code: str) -> web.Response:
+        return web.json_response({'type': 'error', 'code': code,
+                                  'description': code}, status=status)
+
+    async def create(self, request: web.Request) -> web.Response:
+        if (response := await self._respond('create')) is not None:
+            return response
+        key = request.headers.get('Idempotence-Key')
+        if not key:
+            return self.error(400, 'invalid_request')
+        if key in self.keys:
+            return web.json_response(self.payments[self.keys[key]])
+        params = await request.json()
+        payment_id = str(uuid.uuid4())
+        self.payments[payment_id] = {
+            'id': payment_id,
+            'status': 'pending',
+            'paid': False,
+            'amount': params['amount'],
+            'confirmation': {
+                'type': 'redirect',
+                'confirmation_url': f'https://yookassa.test/checkout/{payment_id}'
+            },
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+            'description': params.get('description', ''),
+            'metadata': params.get('metadata', {}),
+            'refundable': False,
+            'test': True,
+        }
+        self.keys[key] = payment_id
+        return web.json_response(self.payments[payment_id])
+
+    async def find(self, request: web.Request) -> web.Response:
+        if (response := await self._respond('find')) is not None:
+            return response
+        payment = self.payments.get(request.match_info['payment_id'])
+        if payment is None:
+            return self.error(404, 'not_found')
+        return web.json_response(payment)
+
+    async def cancel(self, request: web.Request) -> web.Response:
+        if (response := await self._respond('cancel')) is not None:
+            return response
+        payment = self.payments.get(request.match_info['payment_id'])
+        if payment is None:
+            return self.error(404, 'not_found')
+        # отменить можно только платеж, ожидающий подтверждения
+        if payment['status'] == 'waiting_for_capture':
+            payment['status'] = 'canceled'
+        elif payment['status'] != 'canceled':
+            return self.error(400, 'invalid_request')
+        return web.json_response(payment)
+
+    def set_status(self, payment_id: str, status: str) -> None:
+        payment = self.payments[payment_id]
+        payment['status'] = status
+        payment['paid'] = status in ('waiting_for_capture', 'succeeded')
+
+    def notification(self, payment_id: str) -> dict:
+        """Тело HTTP-уведомления о текущем статусе платежа"""
+        payment = self.payments[payment_id]
+        return {'type': 'notification',
+                'event': f'payment.{payment["status"]}',
+                'object': payment}
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from metrics import LOOP_LAG, LOOP_STALLS
+from settings import logger
+
+
+class LoopMonitor:
+    """
+    Монитор цикла событий. Корутина каждые interval секунд измеряет задержку
+    планирования (насколько позже запланированного она проснулась).
+    Сторожевой поток следит за последним пробуждением: если цикл не отвечает
+    дольше stall_threshold, он снимает стек потока цикла событий - то место,
+    где цикл заблокирован прямо сейчас.
+    """
+
+    def __init__(self):
+        self.interval = float(os.getenv('LOOP_MONITOR_INTERVAL', 0.1))
+        self.stall_threshold = float(os.getenv('LOOP_STALL_THRESHOLD', 0.5))
+        self.max_lag = 0.0
+        # (время, длительность на момент снимка, стек) последних блокировок
+        self.stalls: deque[dict] = deque(maxlen=20)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._stopped = threading.Event()
+
+    def start(self) -> asyncio.Task:
+        self._loop_thread_id = threading.get_ident()
+        threading.Thread(target=self._watchdog, name='loop-watchdog',
+                         daemon=True).start()
+        return asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - start - self.interval, 0.0)
+            self._heartbeat = time.monotonic()
+            LOOP_LAG.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.stall_threshold:
+                LOOP_STALLS.inc()
+                logger.warning(f'Цикл событий был заблокирован {lag:.3f} с')
+
+    def _watchdog(self) -> None:
+        reported_heartbeat = None
+        while not self._stopped.wait(self.stall_threshold / 2):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.interval
+            if stalled_for < self.stall_threshold or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat  # один снимок на блокировку
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = ''.join(traceback.format_stack(frame))
+            self.stalls.append({'time': time.time(),
+                                'stalled_for': round(stalled_for, 3),
+                                'stack': stack})
+            logger.warning(f'Цикл событий не отвечает {stalled_for:.3f} с, '
+                           f'стек:\n{stack}')
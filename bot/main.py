@@ -1,6 +1,8 @@
 import asyncio
+from typing import Optional
 
-from aiogram import Dispatcher  # pip install aiogram
+from aiogram import Bot, Dispatcher  # pip install aiogram
+from aiogram.fsm.storage.base import BaseStorage
 
 from bot_worker import (start_menu, 
                         products,
@@ -8,16 +10,66 @@ from bot_worker import (start_menu,
                         orders, 
                         payments, 
                         faq)
-from bot_api import broadcast
-from settings import bot  # , db
+from bot_api import broadcast, debug, metrics, payments as payment_api
+from bot_worker.util import errors
+from bot_worker.util.middlewares import (DBSessionMiddleware,
+                                         DBReleaseMiddleware,
+                                         SqlProfilerMiddleware,
+                                         SamplingProfilerMiddleware,
+                                         UpdateMetricsMiddleware,
+                                         UpdateRecorderMiddleware,
+                                         HandlerMetricsMiddleware,
+                                         TelegramMetricsMiddleware)
+from recorder import UpdateRecorder
+from settings import bot, db, logger
 
-dp = Dispatcher()
-dp.include_routers(start_menu.router,
-                   products.router,
-                   cart.router,
-                   payments.router,
-                   orders.router,
-                   faq.router)
+update_recorder = UpdateRecorder()
+
+
+def setup_dispatcher(storage: Optional[BaseStorage] = None) -> Dispatcher:
+    """
+    Диспетчер со всеми роутерами и middleware. Роутер можно подключить
+    только к одному диспетчеру, поэтому функция вызывается один раз на процесс.
+    storage - хранилище FSM (по умолчанию MemoryStorage).
+    """
+    dp = Dispatcher(storage=storage)
+    if update_recorder.enabled:
+        dp.update.outer_middleware(UpdateRecorderMiddleware(update_recorder))
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.update.middleware(SamplingProfilerMiddleware(debug.sampling_profiler))
+    dp.update.middleware(SqlProfilerMiddleware(db.profiler))
+    dp.update.middleware(DBSessionMiddleware(db))
+    routers = [start_menu.router,
+               products.router,
+               cart.router,
+               payments.router,
+               orders.router,
+               faq.router,
+               errors.router]
+    for router in routers:
+        for observer in (router.message, router.callback_query,
+                         router.inline_query, router.chat_member):
+            observer.middleware(HandlerMetricsMiddleware(router.name))
+    dp.include_routers(*routers)
+    return dp
+
+
+def setup_bot(tg_bot: Bot) -> Bot:
+    """
+    Middleware исходящих вызовов Bot API. Нужны и боту из settings,
+    и ботам окружений (harness, benchmarks), которым передаются обновления.
+    """
+    tg_bot.session.middleware(DBReleaseMiddleware(db))
+    tg_bot.session.middleware(TelegramMetricsMiddleware())
+    return tg_bot
+
+
+setup_bot(bot)
+
+if debug.enabled:
+    broadcast.app.include_router(debug.router)
+broadcast.app.include_router(metrics.router)
+broadcast.app.include_router(payment_api.router)
 
 
 async def run_uvicorn():
@@ -32,16 +84,39 @@ async def run_uvicorn():
     await server.serve()
 
 
-async def run_tg_dispatcher():
-    await dp.start_polling(bot, timeout=30)
+async def run_tg_dispatcher(dp: Dispatcher):
+    # chat_member не приходит по умолчанию - типы обновлений берутся из роутеров
+    await dp.start_polling(bot, timeout=30,
+                           allowed_updates=dp.resolve_used_update_types())
 
 
 async def main():
     # await db.seed_db()
+    logger.info(f'Кеш пользователей: {await db.warm_user_cache()} записей')
+
+    background_tasks = [debug.loop_monitor.start()]
+    if debug.sampling_profiler.autostart:
+        debug.sampling_profiler.configure(enabled=True)
+    background_tasks.append(asyncio.create_task(payments.reconciler.run()))
+    if db.replicas:
+        background_tasks.append(
+            asyncio.create_task(db.replicas.run_health_checks())
+        )
 
     uvi_task = asyncio.create_task(run_uvicorn())
-    dp_task = asyncio.create_task(run_tg_dispatcher())
-    await asyncio.gather(uvi_task, dp_task)
+    dp_task = asyncio.create_task(run_tg_dispatcher(setup_dispatcher()))
+    try:
+        await asyncio.gather(uvi_task, dp_task)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        debug.loop_monitor.stop()
+        debug.sampling_profiler.configure(enabled=False)
+        await payments.client.close()
+        db.users.dump()
+        update_recorder.close()
+        logger.info(f'Обращений к БД на обновление: {db.stats_per_update()}')
+        logger.info(f'Пул соединений: {db.pool_stats()}')
     # режим polling возвращает ответ при поступлении сообщения или через timeout
 
 
@@ -0,0 +1,174 @@
+"""
+Метрики в текстовом формате Prometheus без сторонних зависимостей.
+Все изменения происходят в потоке цикла событий, поэтому блокировки
+не нужны: инкремент - это операция со словарем.
+"""
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, value: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {value}'
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, *labels, value: float) -> None:
+        self._values[labels] = value
+
+    def dec(self, *labels, value: float = 1) -> None:
+        self.inc(*labels, value=-value)
+
+
+class Histogram:
+    type = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                       1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [счетчики по корзинам..., сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        item = self._values.get(labels)
+        if item is None:
+            item = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                item[index] += 1
+                break
+        item[-2] += value
+        item[-1] += 1
+
+    @contextmanager
+    def time(self, *labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> Iterator[str]:
+        for labels, item in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, item):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                yield f'{self.name}_bucket{le} {cumulative}'
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            yield f'{self.name}_bucket{le} {item[-1]}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {item[-2]}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {item[-1]}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+        # функции, обновляющие метрики непосредственно перед выгрузкой
+        self.collectors: list[Callable[[], None]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines: list[str] = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, tuple(labelnames)))
+
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, tuple(labelnames)))
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (),
+              buckets: tuple = Histogram.DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, tuple(labelnames),
+                                       buckets))
+
+
+# обработка обновлений
+UPDATES = counter('bot_updates_total', 'Обработано обновлений', ['type'])
+UPDATES_IN_FLIGHT = gauge('bot_updates_in_flight', 'Обновлений в обработке')
+HANDLER_SECONDS = histogram('bot_handler_seconds', 'Время работы хендлера',
+                            ['router', 'event', 'callback'])
+# исходящие вызовы Telegram Bot API
+TG_REQUESTS = counter('bot_telegram_requests_total', 'Вызовы Bot API',
+                      ['method', 'result'])
+TG_SECONDS = histogram('bot_telegram_request_seconds', 'Время вызова Bot API',
+                       ['method'])
+# БД
+DB_CALL_SECONDS = histogram('bot_db_call_seconds', 'Время вызова метода DB',
+                            ['method'])
+DB_TIMEOUTS = counter('bot_db_timeouts_total', 'Таймауты БД по классам запросов',
+                      ['query_class'])
+DB_POOL = gauge('bot_db_pool', 'Телеметрия пула соединений', ['pool', 'stat'])
+DB_PER_UPDATE = gauge('bot_db_per_update', 'Обращений к БД на обновление',
+                      ['stat'])
+CATALOG_FLIGHT = gauge('bot_catalog_singleflight', 'Объединение запросов каталога',
+                       ['stat'])
+# YooKassa
+YOOKASSA_SECONDS = histogram('bot_yookassa_request_seconds',
+                             'Время вызова YooKassa', ['operation'])
+PAYMENT_NOTIFICATIONS = counter('bot_payment_notifications_total',
+                                'Уведомления YooKassa', ['event', 'result'])
+PAYMENT_RECONCILE = counter('bot_payment_reconcile_total',
+                            'Сверка платежей с YooKassa', ['result'])
+# успешные платежи, которые не оплатили заказ: mismatch - сумма, валюта
+# или заказ не совпадают, double_charge - заказ уже оплачен другим платежом,
+# orphan - заказа нет. Требуют возврата или ручного разбора
+PAYMENT_ANOMALIES = counter('bot_payment_anomalies_total',
+                            'Успешные платежи, не примененные к заказу', ['kind'])
+PAYMENT_PENDING = gauge('bot_payments_pending', 'Незавершенных платежей в сверке')
+# рассылка
+BROADCAST = gauge('bot_broadcast', 'Прогресс текущей рассылки', ['stat'])
+# цикл событий
+LOOP_LAG = histogram('bot_event_loop_lag_seconds',
+                     'Задержка планирования в цикле событий',
+                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                              0.5, 1, 2.5, 5))
+LOOP_STALLS = counter('bot_event_loop_stalls_total',
+                      'Блокировки цикла событий дольше порога')
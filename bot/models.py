@@ -1,5 +1,6 @@
-from sqlalchemy import (Column, BigInteger, String, Integer,
-                        ForeignKey, Text, DECIMAL, text, CheckConstraint)
+from sqlalchemy import (Column, BigInteger, String, Integer, ForeignKey, Text,
+                        DECIMAL, DateTime, text, CheckConstraint, Index,
+                        UniqueConstraint, func)
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -54,6 +55,8 @@ class CartItem(Base):
         nullable=False
     )
     quantity = Column(Integer, default=1, nullable=False)
+    __table_args__ = (UniqueConstraint('cart_id', 'product_id',
+                                       name='cartitem_cart_product_uniq'),)
 
     cart = relationship("Cart", back_populates='cartitems')
     product = relationship("Product")
@@ -99,6 +102,8 @@ class Product(Base):
     description = Column(Text, nullable=True)
     price = Column(DECIMAL(10, 2), nullable=False)
     image_url = Column(String, nullable=True)
+    # индексы объявлены в миграциях Джанго, здесь - для справки и create_all
+    __table_args__ = (Index('product_subcat_id_idx', 'subcategory_id', 'id'),)
 
     category = relationship("Category", back_populates='products')
     cartitems = relationship('CartItem', back_populates='product')
@@ -112,6 +117,10 @@ class OrderStatus:
     COMPLETED: str = 'Выполнен'
 
 
+# незавершенный платеж: после оплаты или отмены payment_id очищается
+PENDING_PAYMENT = "payment_id IS NOT NULL AND payment_id <> ''"
+
+
 class Order(Base):
     __tablename__ = 'orders_order'
     id = Column(Integer, primary_key=True)
@@ -120,12 +129,22 @@ class Order(Base):
                      nullable=False)
     delivery = Column(String, server_default=text("'Самовывоз'"), nullable=False)
     payment_id = Column(String(length=255), nullable=True)
+    # платеж, которым оплачен заказ (payment_id после оплаты очищается)
+    paid_payment_id = Column(String(length=255), nullable=True)
+    # последний отмененный платеж: ключ идемпотентности следующего (create_payment)
+    canceled_payment_id = Column(String(length=255), nullable=True)
     status = Column(String(10), default='Не оплачен', nullable=False)
+    # сумма и число товаров фиксируются при создании заказа
+    total = Column(DECIMAL(12, 2), default=0, nullable=False)
+    items_count = Column(Integer, default=0, nullable=False)
     __table_args__ = (CheckConstraint("status IN ("
                                       f"'{OrderStatus.NOT_PAID}', "
                                       f"'{OrderStatus.PAID}', "
                                       f"'{OrderStatus.COMPLETED}')",
-                                      name='order_status_check'),)
+                                      name='order_status_check'),
+                      Index('order_user_status_idx', 'user_id', 'status'),
+                      Index('order_payment_id_idx', 'payment_id',
+                            postgresql_where=text(PENDING_PAYMENT)))
 
     user = relationship('User', back_populates='orders')
     orderitems = relationship('OrderItem', back_populates='order',
@@ -146,6 +165,25 @@ class OrderItem(Base):
         nullable=False
     )
     quantity = Column(Integer, default=1, nullable=False)
+    # цена товара на момент заказа
+    price = Column(DECIMAL(10, 2), nullable=False)
 
     order = relationship('Order', back_populates='orderitems')
     products = relationship('Product')
+
+
+class Payment(Base):
+    """
+    Платеж YooKassa с неизвестным итогом (см. PaymentReconciler): время
+    создания и расписание проверок хранятся в БД, а не в памяти процесса.
+    """
+    __tablename__ = 'orders_payment'
+    payment_id = Column(String(length=255), primary_key=True)
+    order_id = Column(Integer,
+                      ForeignKey('orders_order.id', ondelete='CASCADE'),
+                      nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), default=func.now(),
+                        nullable=False)
+    checks = Column(Integer, default=0, nullable=False)
+    check_at = Column(DateTime(timezone=True), nullable=False)
+    __table_args__ = (Index('payment_due_idx', 'checks', 'check_at'),)
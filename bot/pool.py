@@ -0,0 +1,115 @@
+import os
+import random
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from settings import logger
+from timeouts import server_settings
+
+
+class PoolTelemetry:
+    """
+    Телеметрия пула соединений: время ожидания соединения, переполнение
+    (соединения сверх pool_size) и таймауты ожидания.
+    """
+
+    def __init__(self):
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float) -> None:
+        self.waits += 1
+        self.wait_total += seconds
+        if seconds > self.wait_max:
+            self.wait_max = seconds
+
+    def snapshot(self, pool) -> dict:
+        return {'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'overflow': max(pool.overflow(), 0),
+                'acquired': self.waits,
+                'wait_avg_ms': round(self.wait_total / (self.waits or 1) * 1000, 3),
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts}
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, измеряющий время получения соединения (telemetry задается в подклассе)"""
+
+    telemetry: PoolTelemetry
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.telemetry.timeouts += 1
+            raise
+        self.telemetry.record_wait(time.perf_counter() - start)
+        if self.checkedout() > self.size():
+            self.telemetry.overflow_events += 1
+        return connection
+
+
+def engine_options() -> tuple[dict, PoolTelemetry]:
+    """
+    Параметры create_async_engine из окружения.
+    Сумма (DB_POOL_SIZE + DB_MAX_OVERFLOW) по всем процессам бота и веб-админки
+    должна оставаться ниже max_connections Postgres.
+    """
+    telemetry = PoolTelemetry()
+    pool_class = type('TimedQueuePool', (TimedQueuePool,),
+                      {'telemetry': telemetry})
+    options = {
+        'future': True,
+        'poolclass': pool_class,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+        # echo=True пишет каждый запрос синхронно в stdout - только DB_SQL_LOG=all
+        'echo': os.getenv('DB_SQL_LOG', 'sample') == 'all',
+        # statement_timeout/lock_timeout по умолчанию (см. timeouts.py)
+        'connect_args': {'server_settings': server_settings()},
+    }
+    return options, telemetry
+
+
+class SqlLog:
+    """
+    Журнал запросов: в режиме sample пишется доля DB_SQL_LOG_SAMPLE запросов,
+    медленные запросы (дольше DB_SLOW_QUERY_MS) пишутся всегда
+    и сохраняются в slow_queries.
+    """
+
+    def __init__(self):
+        self.mode = os.getenv('DB_SQL_LOG', 'sample')
+        self.sample_rate = float(os.getenv('DB_SQL_LOG_SAMPLE', 0.01))
+        self.slow_ms = float(os.getenv('DB_SLOW_QUERY_MS', 200))
+        self.slow_queries: deque[tuple[float, str]] = deque(maxlen=100)
+
+    def attach(self, engine) -> None:
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, 'before_cursor_execute', self._before)
+        event.listen(sync_engine, 'after_cursor_execute', self._after)
+
+    @staticmethod
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+        if elapsed_ms >= self.slow_ms:
+            self.slow_queries.append((round(elapsed_ms, 1), statement))
+            logger.warning(f'Медленный запрос {elapsed_ms:.1f} мс: {statement}')
+        elif self.mode == 'sample' and random.random() < self.sample_rate:
+            logger.debug(f'SQL {elapsed_ms:.1f} мс: {statement}')
@@ -0,0 +1,126 @@
+import os
+import random
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from settings import logger
+
+
+class UpdateProfile:
+    """Запросы одного обновления: statement -> [количество, мс, строк]"""
+
+    __slots__ = ('label', 'statements')
+
+    def __init__(self, label: str):
+        self.label = label
+        self.statements: dict[str, list] = {}
+
+
+_profile_ctx: ContextVar[Optional[UpdateProfile]] = ContextVar('sql_profile',
+                                                               default=None)
+
+_whitespace = re.compile(r'\s+')
+
+
+class SqlProfiler:
+    """
+    Профилировщик SQL: задержка и число строк по каждому запросу,
+    число запросов на обновление и поиск N+1 - один и тот же запрос
+    n_plus_one_threshold и более раз за обновление.
+    Профилируется доля sample_rate обновлений, чтобы хук можно было
+    держать включенным в продакшене.
+    """
+
+    def __init__(self):
+        self.sample_rate = float(os.getenv('SQL_PROFILE_SAMPLE', 0.05))
+        self.n_plus_one_threshold = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))
+        self.reset()
+
+    def reset(self) -> None:
+        # statement -> [количество, суммарно мс, максимум мс, строк]
+        self.statements: dict[str, list] = {}
+        # метка обновления -> [обновлений, запросов]
+        self.updates: dict[str, list] = {}
+        self.n_plus_one: deque[dict] = deque(maxlen=100)
+
+    def attach(self, engine) -> None:
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, 'before_cursor_execute', self._before)
+        event.listen(sync_engine, 'after_cursor_execute', self._after)
+
+    def start(self, label: str) -> Optional[UpdateProfile]:
+        """Начало профилирования обновления (если оно попало в выборку)"""
+        if random.random() >= self.sample_rate:
+            return None
+        profile = UpdateProfile(label)
+        _profile_ctx.set(profile)
+        return profile
+
+    def finish(self, profile: Optional[UpdateProfile]) -> None:
+        if profile is None:
+            return
+        _profile_ctx.set(None)
+        total = sum(item[0] for item in profile.statements.values())
+        counters = self.updates.setdefault(profile.label, [0, 0])
+        counters[0] += 1
+        counters[1] += total
+        for statement, (count, elapsed_ms, rows) in profile.statements.items():
+            if count >= self.n_plus_one_threshold:
+                finding = {'label': profile.label,
+                           'statement': statement,
+                           'count': count,
+                           'ms': round(elapsed_ms, 2)}
+                self.n_plus_one.append(finding)
+                logger.warning(f'N+1 в {profile.label}: {count} x {statement}')
+
+    @staticmethod
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _profile_ctx.get() is not None:
+            conn.info['profile_start'] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        profile = _profile_ctx.get()
+        start = conn.info.pop('profile_start', None)
+        if profile is None or start is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        rows = cursor.rowcount
+        if rows is None or rows < 0:  # asyncpg: для SELECT rowcount = -1
+            rows = len(getattr(cursor, '_rows', ()))
+        statement = _whitespace.sub(' ', statement).strip()
+
+        item = profile.statements.setdefault(statement, [0, 0.0, 0])
+        item[0] += 1
+        item[1] += elapsed_ms
+        item[2] += rows
+
+        total = self.statements.setdefault(statement, [0, 0.0, 0.0, 0])
+        total[0] += 1
+        total[1] += elapsed_ms
+        total[2] = max(total[2], elapsed_ms)
+        total[3] += rows
+
+    def report(self, top: int = 20) -> dict:
+        statements = sorted(self.statements.items(),
+                            key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            'sample_rate': self.sample_rate,
+            'statements': [{'statement': statement,
+                            'count': count,
+                            'total_ms': round(total_ms, 2),
+                            'avg_ms': round(total_ms / count, 3),
+                            'max_ms': round(max_ms, 2),
+                            'rows': rows}
+                           for statement, (count, total_ms, max_ms, rows)
+                           in statements],
+            'statements_per_update': {
+                label: round(queries / updates, 2)
+                for label, (updates, queries) in self.updates.items()
+            },
+            'n_plus_one': list(self.n_plus_one),
+        }
@@ -0,0 +1,133 @@
+import glob
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import time
+from typing import IO, Iterator, Optional
+
+from settings import logger
+
+# ключи, значения которых - User или Chat (или их списки)
+_PERSON_KEYS = frozenset({'from', 'chat', 'user', 'sender_chat', 'forward_from',
+                          'forward_from_chat', 'via_bot', 'new_chat_members',
+                          'left_chat_member'})
+# поля User и Chat с персональными данными - удаляются
+_PERSON_FIELDS = frozenset({'first_name', 'last_name', 'username',
+                            'active_usernames', 'title', 'bio', 'photo'})
+# персональные данные в остальных объектах (Contact, Location, Venue,
+# текст сообщений и запросов) - строки заменяются на x той же длины
+_MASKED_FIELDS = frozenset({'text', 'caption', 'query', 'phone_number',
+                            'first_name', 'last_name', 'vcard', 'email',
+                            'address', 'title'})
+_COORDINATES = frozenset({'latitude', 'longitude'})
+
+
+class UpdateRecorder:
+    """
+    Запись входящих обновлений в сегменты - сжатые gzip файлы JSON Lines,
+    только дописывание. Строка сегмента: {"t": время получения (unix),
+    "u": обновление}. Новый сегмент начинается, когда текущий превышает
+    segment_mb (сжатых данных). Раз в flush_interval данные сбрасываются
+    на диск точкой синхронизации gzip: при падении процесса сегмент
+    читается до последнего сброса.
+    Включается переменной UPDATE_RECORD_DIR. С UPDATE_RECORD_ANONYMIZE=1
+    идентификаторы пользователей и чатов заменяются стабильными псевдонимами
+    (хеш с солью UPDATE_RECORD_SALT), имена пользователей и чатов удаляются,
+    текст (кроме команд), телефоны, адреса и прочие поля _MASKED_FIELDS
+    заменяются на x той же длины, координаты - на 0.
+    """
+
+    def __init__(self):
+        self.path = os.getenv('UPDATE_RECORD_DIR', '')
+        self.enabled = bool(self.path)
+        self.segment_bytes = int(float(os.getenv('UPDATE_RECORD_SEGMENT_MB', 64))
+                                 * 1024 * 1024)
+        self.anonymize = os.getenv('UPDATE_RECORD_ANONYMIZE', '0') == '1'
+        # без заданной соли псевдонимы стабильны только в пределах процесса
+        self.salt = os.getenv('UPDATE_RECORD_SALT') or secrets.token_hex(16)
+        self.flush_interval = 1.0
+        self._raw: Optional[IO[bytes]] = None
+        self._file: Optional[gzip.GzipFile] = None
+        self._last_flush = 0.0
+
+    def record(self, update: dict) -> None:
+        if self.anonymize:
+            update = self._anonymize(update)
+        line = json.dumps({'t': round(time.time(), 3), 'u': update},
+                          ensure_ascii=False, separators=(',', ':'))
+        file = self._segment()
+        file.write(line.encode() + b'\n')
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            file.flush()  # Z_SYNC_FLUSH
+            self._raw.flush()
+            self._last_flush = now
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._raw.close()
+            self._file = self._raw = None
+
+    def _segment(self) -> gzip.GzipFile:
+        if self._raw and self._raw.tell() >= self.segment_bytes:
+            self.close()
+        if self._file is None:
+            os.makedirs(self.path, exist_ok=True)
+            name = f'updates-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.jsonl.gz'
+            self._raw = open(os.path.join(self.path, name), 'ab')
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='ab')
+            logger.info(f'Запись обновлений в {name}')
+        return self._file
+
+    def _pseudonym(self, value: int) -> int:
+        digest = hashlib.blake2b(f'{self.salt}:{value}'.encode(),
+                                 digest_size=8).digest()
+        pseudonym = 10 ** 12 + int.from_bytes(digest, 'big') % 10 ** 12
+        return -pseudonym if value < 0 else pseudonym
+
+    def _anonymize(self, value, person: bool = False):
+        """Копия value без персональных данных; person - value это User или Chat"""
+        if isinstance(value, list):
+            return [self._anonymize(item, person) for item in value]
+        if not isinstance(value, dict):
+            return value
+        result = {}
+        for key, item in value.items():
+            if person and key in _PERSON_FIELDS:
+                continue
+            if (person and key == 'id' or key == 'user_id') \
+                    and isinstance(item, int):
+                result[key] = self._pseudonym(item)
+            elif key in _PERSON_KEYS:
+                result[key] = self._anonymize(item, person=True)
+            elif key in _MASKED_FIELDS and isinstance(item, str):
+                # команды нужны для воспроизведения сценариев
+                result[key] = (item if key == 'text' and item.startswith('/')
+                               else 'x' * len(item))
+            elif key in _COORDINATES and isinstance(item, (int, float)):
+                result[key] = 0.0
+            else:
+                result[key] = self._anonymize(item)
+        if person and 'is_bot' in value:
+            result['first_name'] = 'User'  # обязательное поле User
+        return result
+
+
+def read_segments(path: str) -> Iterator[tuple[float, dict]]:
+    """(время, обновление) из всех сегментов каталога path по порядку"""
+    for name in sorted(glob.glob(os.path.join(path, 'updates-*.jsonl.gz'))):
+        with gzip.open(name, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # оборванная строка в конце сегмента
+                    yield item['t'], item['u']
+            except EOFError:
+                pass  # сегмент, не закрытый при остановке процесса
@@ -0,0 +1,73 @@
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from settings import logger
+
+
+class ReplicaSet:
+    """
+    Реплики только для чтения. Выбор реплики - round-robin по здоровым;
+    реплика с ошибкой исключается на retry_after секунд, фоновая проверка
+    (SELECT 1) возвращает ее раньше, если она снова отвечает.
+    """
+
+    def __init__(self,
+                 engines: List[AsyncEngine],
+                 retry_after: float = 10,
+                 check_timeout: float = 2):
+        self.engines = engines
+        self.sessionmakers = [
+            sessionmaker(bind=engine,  # type: ignore
+                         class_=AsyncSession,
+                         autoflush=False,
+                         future=True,
+                         expire_on_commit=False)
+            for engine in engines
+        ]
+        self.retry_after = retry_after
+        self.check_timeout = check_timeout
+        self._down_until = [0.0] * len(engines)
+        self._counter = itertools.count()
+
+    def pick(self) -> Optional[int]:
+        """Индекс следующей здоровой реплики или None, если здоровых нет"""
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            index = next(self._counter) % len(self.engines)
+            if self._down_until[index] <= now:
+                return index
+        return None
+
+    def mark_down(self, index: int) -> None:
+        self._down_until[index] = time.monotonic() + self.retry_after
+
+    @asynccontextmanager
+    async def session(self, index: int) -> AsyncIterator[AsyncSession]:
+        async with self.sessionmakers[index]() as session:
+            yield session
+
+    async def check(self, index: int) -> bool:
+        try:
+            async with self.engines[index].connect() as connection:
+                await asyncio.wait_for(connection.execute(text('SELECT 1')),
+                                       self.check_timeout)
+            self._down_until[index] = 0.0
+            return True
+        except Exception as e:
+            logger.warning(f'Реплика #{index} недоступна: {e}')
+            self.mark_down(index)
+            return False
+
+    async def run_health_checks(self, interval: float = 5) -> None:
+        """Фоновая проверка реплик, запускается как задача в main"""
+        while True:
+            await asyncio.gather(*(self.check(index)
+                                   for index in range(len(self.engines))))
+            await asyncio.sleep(interval)
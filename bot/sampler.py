@@ -0,0 +1,146 @@
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from settings import logger
+
+
+class SampledUpdate:
+    """Стеки, снятые во время обработки одного обновления"""
+
+    __slots__ = ('label', 'handler', 'started', 'stacks')
+
+    def __init__(self, label: str):
+        self.label = label
+        self.handler = ''
+        self.started = time.perf_counter()
+        self.stacks: Counter[str] = Counter()
+
+
+_unsafe = re.compile(r'[^\w.-]+')
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик обновлений. Пока он включен, отдельный поток
+    каждые interval секунд снимает стек потока цикла событий и относит его
+    к обновлению, задача (asyncio.Task) которого сейчас выполняется.
+    Сохраняются профили обновлений дольше threshold секунд и доля sample_rate
+    остальных - в формате collapsed stacks (flamegraph.pl, speedscope),
+    корневой кадр - имя хендлера.
+    Включается и настраивается на лету через /api/debug/sampling/.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.autostart = os.getenv('SAMPLING_PROFILE_ENABLED', '0') == '1'
+        self.interval = float(os.getenv('SAMPLING_PROFILE_INTERVAL', 0.005))
+        self.threshold = float(os.getenv('SAMPLING_PROFILE_THRESHOLD', 1.0))
+        self.sample_rate = float(os.getenv('SAMPLING_PROFILE_SAMPLE', 0.0))
+        self.path = os.getenv('SAMPLING_PROFILE_DIR', 'profiles')
+        self.saved: deque[dict] = deque(maxlen=100)
+        self._active: dict[asyncio.Task, SampledUpdate] = {}
+        self._loop = None
+        self._loop_thread_id = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def configure(self,
+                  enabled: Optional[bool] = None,
+                  threshold: Optional[float] = None,
+                  sample_rate: Optional[float] = None,
+                  interval: Optional[float] = None) -> None:
+        if threshold is not None:
+            self.threshold = threshold
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if interval is not None:
+            self.interval = interval
+        if enabled is True and not self.enabled:
+            self._start()
+        elif enabled is False and self.enabled:
+            self._stop()
+
+    def status(self) -> dict:
+        return {'enabled': self.enabled,
+                'interval': self.interval,
+                'threshold': self.threshold,
+                'sample_rate': self.sample_rate,
+                'active': len(self._active),
+                'saved': list(self.saved)}
+
+    def start(self, label: str) -> Optional[SampledUpdate]:
+        """Регистрация обновления текущей задачи (если профилировщик включен)"""
+        if not self.enabled:
+            return None
+        task = asyncio.current_task()
+        if task is None:
+            return None
+        update = SampledUpdate(label)
+        self._active[task] = update
+        return update
+
+    async def finish(self, update: Optional[SampledUpdate]) -> None:
+        if update is None:
+            return
+        self._active.pop(asyncio.current_task(), None)
+        elapsed = time.perf_counter() - update.started
+        if not update.stacks:
+            return
+        if elapsed < self.threshold and random.random() >= self.sample_rate:
+            return
+        await asyncio.to_thread(self._save, update, elapsed)
+
+    def _start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample_loop,
+                                        name='sampling-profiler', daemon=True)
+        self._thread.start()
+        self.enabled = True
+        logger.info('Сэмплирующий профилировщик включен')
+
+    def _stop(self) -> None:
+        self.enabled = False
+        self._stopped.set()
+        self._active.clear()
+        logger.info('Сэмплирующий профилировщик выключен')
+
+    def _sample_loop(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if not self._active:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            task = asyncio.current_task(self._loop)
+            update = self._active.get(task)
+            if frame is None or update is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}'
+                             f':{code.co_firstlineno})')
+                frame = frame.f_back
+            update.stacks[';'.join(reversed(stack))] += 1
+
+    def _save(self, update: SampledUpdate, elapsed: float) -> None:
+        root = update.handler or update.label
+        name = (f'{time.strftime("%Y%m%d-%H%M%S")}_'
+                f'{_unsafe.sub("_", root)}_{int(elapsed * 1000)}ms.folded')
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, name), 'w', encoding='utf-8') as f:
+            for stack, count in update.stacks.items():
+                f.write(f'{root};{stack} {count}\n')
+        self.saved.append({'file': name,
+                           'handler': root,
+                           'label': update.label,
+                           'ms': round(elapsed * 1000, 1),
+                           'samples': sum(update.stacks.values())})
+        logger.info(f'Профиль {root} ({elapsed:.3f} с) сохранен в {name}')
@@ -0,0 +1,258 @@
+"""
+Генерация синтетических данных продакшен-объема: категории, подкатегории,
+товары, пользователи, корзины и история заказов.
+Строки генерируются потоком и загружаются через COPY (asyncpg
+copy_records_to_table), без ORM и без хранения всего набора в памяти.
+Идентификаторы задаются явно (продолжают текущий максимум), после загрузки
+последовательности id сдвигаются и выполняется ANALYZE.
+
+Запуск из каталога bot (DB_URL как у бота, таблицы созданы миграциями Django):
+    python -m seed --products 1000000 --users 500000 --orders 5000000
+    python -m seed --truncate --categories 5 --products 100   # как seed_db
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from decimal import Decimal
+from typing import AsyncIterator, Iterable, Iterator
+
+from models import OrderStatus, PENDING_PAYMENT
+from settings import db, logger
+
+# порядок загрузки (внешние ключи) и очистки
+TABLES = ('products_category', 'products_subcategory', 'products_product',
+          'users_user', 'users_cart', 'users_cartitem',
+          'orders_order', 'orders_orderitem')
+
+# статусы истории заказов и их доли
+ORDER_STATUSES = ((OrderStatus.COMPLETED, 0.7),
+                  (OrderStatus.PAID, 0.2),
+                  (OrderStatus.NOT_PAID, 0.1))
+CHUNK_SIZE = 10_000
+
+
+async def chunked(records: Iterable[tuple]) -> AsyncIterator[tuple]:
+    """Отдача строк генератора с передачей управления циклу событий"""
+    for index, record in enumerate(records):
+        if index % CHUNK_SIZE == 0:
+            await asyncio.sleep(0)
+        yield record
+
+
+class Seeder:
+    def __init__(self, connection, args: argparse.Namespace):
+        self.connection = connection  # asyncpg.Connection
+        self.args = args
+        self.rng = random.Random(args.seed)
+
+    async def first_id(self, table: str) -> int:
+        return await self.connection.fetchval(
+            f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}'
+        )
+
+    async def copy(self, table: str, columns: tuple, records: Iterable[tuple]) -> int:
+        start = time.perf_counter()
+        status = await self.connection.copy_records_to_table(
+            table, records=chunked(records), columns=columns
+        )
+        rows = int(status.split()[-1])
+        elapsed = time.perf_counter() - start
+        logger.info(f'{table}: {rows} строк за {elapsed:.1f} с '
+                    f'({rows / elapsed if elapsed else rows:.0f} строк/с)')
+        return rows
+
+    async def run(self) -> None:
+        args = self.args
+        if args.truncate:
+            await self.connection.execute(
+                f'TRUNCATE {", ".join(TABLES)} RESTART IDENTITY CASCADE'
+            )
+
+        category0 = await self.first_id('products_category')
+        await self.copy('products_category', ('id', 'name'), (
+            (category0 + i, f'Категория {category0 + i}')
+            for i in range(args.categories)
+        ))
+
+        subcategory0 = await self.first_id('products_subcategory')
+        subcategories = [(subcategory0 + i * args.subcategories + j, category0 + i)
+                         for i in range(args.categories)
+                         for j in range(args.subcategories)]
+        await self.copy('products_subcategory', ('id', 'name', 'category_id'), (
+            (subcategory_id, f'Подкатегория {subcategory_id}', category_id)
+            for subcategory_id, category_id in subcategories
+        ))
+
+        product0 = await self.first_id('products_product')
+        await self.copy('products_product',
+                        ('id', 'category_id', 'subcategory_id', 'name',
+                         'description', 'price', 'image_url'),
+                        self.products(product0, subcategories))
+
+        user0 = await self.first_id('users_user')
+        tg_id0 = await self.connection.fetchval(
+            'SELECT COALESCE(MAX(tg_id), 1000000000) + 1 FROM users_user'
+        )
+        await self.copy('users_user',
+                        ('id', 'tg_id', 'first_name', 'last_name', 'username'),
+                        ((user0 + i, tg_id0 + i, f'Имя {i}', None, f'user_{tg_id0 + i}')
+                         for i in range(args.users)))
+
+        carts = min(args.carts, args.users)
+        cart0 = await self.first_id('users_cart')
+        await self.copy('users_cart', ('id', 'user_id'),
+                        ((cart0 + i, user0 + i) for i in range(carts)))
+
+        product_ids = range(product0, product0 + args.products)
+        cart_item0 = await self.first_id('users_cartitem')
+        await self.copy('users_cartitem',
+                        ('id', 'cart_id', 'product_id', 'quantity'),
+                        self.items(cart_item0, range(cart0, cart0 + carts),
+                                   product_ids, args.cart_items))
+
+        order0 = await self.first_id('orders_order')
+        orders = await self.copy('orders_order',
+                                 ('id', 'user_id', 'delivery', 'payment_id', 'status',
+                                  'total', 'items_count'),
+                                 self.orders(order0, range(user0, user0 + args.users),
+                                             product_ids))
+
+        order_item0 = await self.first_id('orders_orderitem')
+        await self.copy('orders_orderitem',
+                        ('id', 'order_id', 'product_id', 'quantity', 'price'),
+                        self.order_items(order_item0, range(order0, order0 + orders),
+                                         product_ids))
+        # незавершенные платежи - в расписание сверки (orders_payment
+        # очищается TRUNCATE ... CASCADE вместе с orders_order)
+        await self.connection.execute(
+            "INSERT INTO orders_payment (payment_id, order_id, created_at, checks, check_at) "
+            "SELECT payment_id, id, now(), 0, now() FROM orders_order "
+            f"WHERE status = '{OrderStatus.NOT_PAID}' AND {PENDING_PAYMENT} "
+            "ON CONFLICT DO NOTHING"
+        )
+        await self.connection.execute('ANALYZE orders_payment')
+
+        for table in TABLES:
+            await self.connection.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)"
+            )
+            await self.connection.execute(f'ANALYZE {table}')
+
+    def price(self, product_id: int) -> Decimal:
+        """
+        Цена товара от 10.00 до 1000.00 - функция product_id и --seed:
+        суммы заказов считаются без словаря цен всех товаров в памяти.
+        """
+        cents = (product_id * 2_654_435_761 + self.args.seed * 40_503) % 99_001
+        return Decimal(1000 + cents).scaleb(-2)
+
+    def products(self, product0: int, subcategories: list) -> Iterator[tuple]:
+        for i in range(self.args.products):
+            product_id = product0 + i
+            subcategory_id, category_id = subcategories[i % len(subcategories)]
+            yield (product_id, category_id, subcategory_id,
+                   f'Товар {product_id}', f'Описание товара {product_id}',
+                   self.price(product_id), 'https://via.placeholder.com/150')
+
+    def items(self, item0: int, parent_ids: range, product_ids: range,
+              average: int) -> Iterator[tuple]:
+        """Позиции корзин: в среднем average разных товаров на корзину"""
+        rng = self.rng
+        item_id = item0
+        if not product_ids:
+            return
+        for parent_id in parent_ids:
+            count = min(rng.randint(1, 2 * average - 1), len(product_ids))
+            for product_id in rng.sample(product_ids, count):
+                yield item_id, parent_id, product_id, rng.randint(1, 5)
+                item_id += 1
+
+    def order_lines(self, order_id: int, product_ids: range) -> list[tuple[int, int]]:
+        """
+        Товары заказа (product_id, количество). Отдельный генератор на каждый
+        заказ: сумма в orders_order и строки orders_orderitem совпадают
+        без хранения позиций в памяти.
+        """
+        if not product_ids:
+            return []
+        rng = random.Random(self.args.seed * 1_000_003 + order_id)
+        count = min(rng.randint(1, 2 * self.args.order_items - 1), len(product_ids))
+        return [(product_id, rng.randint(1, 5))
+                for product_id in rng.sample(product_ids, count)]
+
+    def order_items(self, item0: int, order_ids: range,
+                    product_ids: range) -> Iterator[tuple]:
+        item_id = item0
+        for order_id in order_ids:
+            for product_id, quantity in self.order_lines(order_id, product_ids):
+                yield item_id, order_id, product_id, quantity, self.price(product_id)
+                item_id += 1
+
+    def orders(self, order0: int, user_ids: range,
+               product_ids: range) -> Iterator[tuple]:
+        rng = self.rng
+        statuses = [status for status, _ in ORDER_STATUSES]
+        weights = [weight for _, weight in ORDER_STATUSES]
+        if not user_ids:
+            return
+        for i in range(self.args.orders):
+            lines = self.order_lines(order0 + i, product_ids)
+            total = sum((self.price(product_id) * quantity
+                         for product_id, quantity in lines), Decimal(0))
+            status = rng.choices(statuses, weights)[0]
+            if status == OrderStatus.NOT_PAID:
+                # часть неоплаченных заказов - с незавершенным платежом
+                payment_id = str(uuid.UUID(int=rng.getrandbits(128))) \
+                    if rng.random() < 0.3 else None
+            else:
+                payment_id = ''  # после оплаты payment_id очищается
+            delivery = 'Самовывоз' if rng.random() < 0.5 \
+                else f'Доставка. Адрес: Город, Улица {i % 1000}, Дом {i % 100}'
+            yield (order0 + i, rng.choice(user_ids), delivery, payment_id, status,
+                   total, sum(quantity for _, quantity in lines))
+
+
+async def seed(args: argparse.Namespace) -> None:
+    """Загрузка данных по параметрам командной строки (см. build_parser)"""
+    async with db.engine.connect() as connection:
+        raw = await connection.get_raw_connection()
+        driver = raw.driver_connection
+        # загрузка идет дольше statement_timeout класса read
+        await driver.execute('SET statement_timeout = 0')
+        start = time.perf_counter()
+        async with driver.transaction():
+            await Seeder(driver, args).run()
+        logger.info(f'Данные сгенерированы за {time.perf_counter() - start:.1f} с')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--subcategories', type=int, default=10,
+                        help='подкатегорий в каждой категории')
+    parser.add_argument('--products', type=int, default=100_000, help='товаров (SKU)')
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--carts', type=int, default=50_000,
+                        help='пользователей с непустой корзиной')
+    parser.add_argument('--cart-items', type=int, default=3,
+                        help='товаров в корзине в среднем')
+    parser.add_argument('--orders', type=int, default=500_000)
+    parser.add_argument('--order-items', type=int, default=3,
+                        help='товаров в заказе в среднем')
+    parser.add_argument('--truncate', action='store_true',
+                        help='очистить таблицы перед загрузкой')
+    parser.add_argument('--seed', type=int, default=0, help='seed генератора')
+    return parser
+
+
+async def main(args: argparse.Namespace) -> None:
+    await seed(args)
+    await db.engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(build_parser().parse_args()))
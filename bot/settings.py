@@ -12,6 +12,14 @@ bot = Bot(token=os.getenv("TG_TOKEN"))
 
 CHANNEL_USERNAME = '@test_some_chanel'  # публичное имя канала или группы
 
+# кеш подписки на канал (секунды); отрицательный результат живет меньше,
+# чтобы только что подписавшийся пользователь не ждал истечения кеша
+SUBSCRIPTION_CACHE_TTL = int(os.getenv('SUBSCRIPTION_CACHE_TTL', 600))
+SUBSCRIPTION_NEGATIVE_TTL = int(os.getenv('SUBSCRIPTION_NEGATIVE_TTL', 30))
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv('SUBSCRIPTION_CACHE_SIZE', 100_000))
+# не более N запросов getChatMember в секунду при промахе кеша
+SUBSCRIPTION_CHECK_RATE = int(os.getenv('SUBSCRIPTION_CHECK_RATE', 20))
+
 logger.remove()
 logger.add(
     sys.stdout,
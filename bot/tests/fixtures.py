@@ -0,0 +1,126 @@
+"""Тестовые данные: каталог и пользователь, удаляемые после теста"""
+import os
+import unittest
+from typing import Optional
+from unittest import mock
+
+from sqlalchemy import delete, select
+
+from bot_worker.payments.handlers import reconciler, worker
+from dto import OrderRow
+from harness.yookassa import FakeYooKassa
+from models import (Cart, CartItem, Category, Order, OrderItem, Payment,
+                    Product, SubCategory, User)
+from settings import db
+
+
+async def create_catalog(name: str, products: int, price: int = 10) -> tuple[int, int, list[int]]:
+    """Категория с одной подкатегорией: (category_id, subcategory_id, [product_id])"""
+    async with db.get_session() as session:
+        category = Category(name=name)
+        session.add(category)
+        await session.flush()
+        subcategory = SubCategory(name=name, category_id=category.id)
+        session.add(subcategory)
+        await session.flush()
+        rows = [Product(name=f'{name} {i}', description='', price=price,
+                        image_url='https://via.placeholder.com/150',
+                        category_id=category.id, subcategory_id=subcategory.id)
+                for i in range(products)]
+        session.add_all(rows)
+        await session.flush()
+        return category.id, subcategory.id, [product.id for product in rows]
+
+
+async def create_user(tg_id: int) -> int:
+    async with db.get_session() as session:
+        user = User(tg_id=tg_id, first_name='test')
+        session.add(user)
+        await session.flush()
+        return user.id
+
+
+async def drop_test_data(tg_id: int, category_id: int) -> None:
+    """
+    Удаление пользователя, его корзины и заказов и каталога.
+    Внешние ключи Django не каскадные на стороне БД, поэтому по порядку.
+    """
+    async with db.get_session() as session:
+        user_ids = select(User.id).where(User.tg_id == tg_id).scalar_subquery()
+        orders = select(Order.id).where(Order.user_id == user_ids)
+        carts = select(Cart.id).where(Cart.user_id == user_ids)
+        products = select(Product.id).where(Product.category_id == category_id)
+        await session.execute(delete(OrderItem).where(OrderItem.order_id.in_(orders)))
+        await session.execute(delete(Payment).where(Payment.order_id.in_(orders)))
+        await session.execute(delete(Order).where(Order.user_id == user_ids))
+        await session.execute(delete(CartItem).where(CartItem.cart_id.in_(carts)))
+        await session.execute(delete(Cart).where(Cart.user_id == user_ids))
+        await session.execute(delete(User).where(User.tg_id == tg_id))
+        await session.execute(delete(Product).where(Product.id.in_(products)))
+        await session.execute(delete(SubCategory)
+                              .where(SubCategory.category_id == category_id))
+        await session.execute(delete(Category).where(Category.id == category_id))
+    db.users.clear()
+
+
+async def create_order(tg_id: int, product_ids: list[int]) -> int:
+    """Неоплаченный заказ по одному каждого товара, как из корзины"""
+    async with db.unit_of_work():
+        await db.save_current_quantity_in_cart(
+            tg_id, [(0, product_id, 1) for product_id in product_ids]
+        )
+    async with db.unit_of_work():
+        return await db.create_order_db(tg_id, 'Самовывоз')
+
+
+@unittest.skipUnless(os.getenv('TEST_DB_URL'), 'нужна БД: TEST_DB_URL')
+class DBTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    Тест с БД: каталог из PRODUCTS товаров по PRICE и пользователь TG_ID
+    (если CREATE_USER), с PORT - локальный API YooKassa для клиента бота.
+    Все строки удаляются после теста, кеши бота очищаются.
+    """
+    TG_ID: int
+    PORT: Optional[int] = None
+    PRODUCTS = 2
+    PRICE = 150
+    CREATE_USER = True
+
+    async def asyncSetUp(self):
+        db.users.path = None
+        db.users.clear()
+        worker.links.clear()
+        worker.terminal_payments.clear()
+        self.category_id, self.subcategory_id, self.product_ids = await create_catalog(
+            f'test-{self.TG_ID}', self.PRODUCTS, self.PRICE
+        )
+        if self.CREATE_USER:
+            await create_user(self.TG_ID)
+        self.yookassa = None
+        if self.PORT is not None:
+            self.yookassa = await FakeYooKassa().install(worker.client, port=self.PORT)
+
+    async def asyncTearDown(self):
+        if self.yookassa:
+            await self.yookassa.uninstall()
+        await drop_test_data(self.TG_ID, self.category_id)
+        worker.reconciler = reconciler
+        await db.engine.dispose()
+
+
+class PaymentTestCase(DBTestCase):
+    """Неоплаченный заказ на все товары каталога, notify_user подменен"""
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.order_id = await create_order(self.TG_ID, self.product_ids)
+        self.notify_patch = mock.patch.object(worker, 'notify_user', mock.AsyncMock())
+        self.notify_user = self.notify_patch.start()
+
+    async def asyncTearDown(self):
+        self.notify_patch.stop()
+        await super().asyncTearDown()
+
+    async def order(self) -> OrderRow:
+        async with db.unit_of_work():
+            return await db.get_order_by_id(self.order_id)
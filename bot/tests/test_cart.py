@@ -0,0 +1,100 @@
+import os
+import tempfile
+import time
+import unittest
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from cache import KnownUserCache
+from fixtures import DBTestCase
+from models import Cart, CartItem, User
+from settings import db
+
+
+class SaveCartTests(DBTestCase):
+    TG_ID = 8_100_000_000_001
+    PRODUCTS = 3
+
+    async def cart(self) -> dict[int, int]:
+        async with db.get_session() as session:
+            rows = await session.execute(
+                select(CartItem.product_id, CartItem.quantity)
+                .join(Cart, Cart.id == CartItem.cart_id)
+                .join(User, User.id == Cart.user_id)
+                .where(User.tg_id == self.TG_ID)
+            )
+            return dict(rows.all())
+
+    async def save(self, items):
+        async with db.unit_of_work():
+            await db.save_current_quantity_in_cart(self.TG_ID, items)
+
+    async def test_upsert(self):
+        a, b, c = self.product_ids
+        await self.save([(1, a, 2), (2, b, 1)])
+        self.assertEqual(await self.cart(), {a: 2, b: 1})
+        # обновление, удаление нулевого количества и новый товар
+        await self.save([(1, a, 5), (2, b, 0), (3, c, 1)])
+        self.assertEqual(await self.cart(), {a: 5, c: 1})
+
+    async def test_last_quantity_wins(self):
+        a = self.product_ids[0]
+        await self.save([(1, a, 1), (1, a, 3)])
+        self.assertEqual(await self.cart(), {a: 3})
+
+    async def stale_user_id(self) -> int:
+        """id пользователя, которого нет в БД (удален после попадания в кеш)"""
+        async with db.get_session() as session:
+            return (await session.execute(select(func.max(User.id)))).scalar() + 1000
+
+    async def test_stale_cached_user_evicted(self):
+        a = self.product_ids[0]
+        db.users.set_ids(self.TG_ID, await self.stale_user_id())
+        with self.assertRaises(IntegrityError):
+            await self.save([(1, a, 1)])
+        self.assertIsNone(db.users.get_ids(self.TG_ID))
+        # следующий вызов читает ids из БД
+        await self.save([(1, a, 1)])
+        self.assertEqual(await self.cart(), {a: 1})
+
+    async def test_stale_cached_user_evicted_on_order(self):
+        await self.save([(1, self.product_ids[0], 1)])
+        _, cart_id = await db.resolve_user(self.TG_ID)
+        db.users.set_ids(self.TG_ID, await self.stale_user_id(), cart_id)
+        with self.assertRaises(IntegrityError):
+            async with db.unit_of_work():
+                await db.create_order_db(self.TG_ID, 'Самовывоз')
+        self.assertIsNone(db.users.get_ids(self.TG_ID))
+
+    async def test_warm_up_checks_saved_cache(self):
+        await self.save([(1, self.product_ids[0], 1)])
+        user_id, cart_id = await db.resolve_user(self.TG_ID)
+        deleted_tg_id = self.TG_ID + 1000
+        with tempfile.TemporaryDirectory() as path:
+            db.users.path = os.path.join(path, 'users.json')
+            db.users.clear()
+            db.users.set_ids(self.TG_ID, user_id, None)  # корзина создана позже
+            db.users.set_ids(deleted_tg_id, user_id + 1000, None)
+            db.users.set(deleted_tg_id + 1, (user_id, cart_id), ttl=-1)  # истекла
+            db.users.dump()
+            db.users.clear()
+            await db.warm_user_cache()
+        self.assertEqual(db.users.get_ids(self.TG_ID), (user_id, cart_id))
+        self.assertIsNone(db.users.get_ids(deleted_tg_id))
+        self.assertIsNone(db.users.get_ids(deleted_tg_id + 1))
+
+
+class KnownUserCacheTests(unittest.TestCase):
+    """Кеш пользователей на диске: записи сохраняют оставшийся срок"""
+
+    def test_load_keeps_remaining_ttl(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = KnownUserCache(ttl=3600, path=os.path.join(path, 'users.json'))
+            cache.set(1, (10, 20), ttl=60)
+            cache.dump()
+            cache.clear()
+            self.assertEqual(cache.load(), 1)
+        expires_at, value = cache._data[1]
+        self.assertEqual(value, (10, 20))
+        self.assertLessEqual(expires_at - time.monotonic(), 60)
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from bot_api import broadcast, debug
+
+
+class DebugApiTests(unittest.TestCase):
+    """Отладочный API: проверка настроек профилировщика, токен и подключение роутера"""
+
+    def setUp(self):
+        app = FastAPI()
+        app.include_router(debug.router)
+        self.client = TestClient(app)
+        self.status = debug.sampling_profiler.status()
+
+    def tearDown(self):
+        debug.sampling_profiler.configure(
+            threshold=self.status['threshold'],
+            sample_rate=self.status['sample_rate'],
+            interval=self.status['interval'],
+        )
+
+    def test_sampling_settings_bounds(self):
+        for settings in ({'interval': 0}, {'interval': -1}, {'threshold': 0},
+                         {'sample_rate': -0.1}, {'sample_rate': 1.5}):
+            with self.subTest(settings):
+                response = self.client.post('/api/debug/sampling/', json=settings)
+                self.assertEqual(response.status_code, 422)
+        self.assertEqual(debug.sampling_profiler.status(), self.status)
+
+    def test_sampling_settings_applied(self):
+        response = self.client.post('/api/debug/sampling/',
+                                    json={'interval': 0.01, 'sample_rate': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['interval'], response.json()['sample_rate']),
+                         (0.01, 0))
+
+    def test_sql_report_requires_token(self):
+        with mock.patch('bot_api.debug.handlers.token', 'secret'):
+            for method, path in (('get', '/api/debug/sql/'),
+                                 ('post', '/api/debug/sql/reset/')):
+                with self.subTest(path):
+                    request = getattr(self.client, method)
+                    self.assertEqual(request(path).status_code, 403)
+                    response = request(path, headers={'X-Debug-Token': 'wrong'})
+                    self.assertEqual(response.status_code, 403)
+                    response = request(path, headers={'X-Debug-Token': 'secret'})
+                    self.assertEqual(response.status_code, 200)
+
+    def test_router_mounted_only_with_flag(self):
+        import main  # noqa: F401 - подключение роутеров к приложению API
+
+        paths = {route.path for route in broadcast.app.routes}
+        self.assertEqual(any(path.startswith('/api/debug') for path in paths),
+                         debug.enabled)
@@ -0,0 +1,25 @@
+import json
+
+from benchmarks.flow_budget import BUDGET_PATH, METRICS, FlowRunner
+from fixtures import DBTestCase
+from harness import shop_flow
+
+
+class FlowBudgetTests(DBTestCase):
+    """Сценарий покупки через настоящие роутеры укладывается в flow_budget.json"""
+    TG_ID = 8_100_000_000_004
+    PORT = 8095
+    PRODUCTS = 12  # две полные страницы подкатегории (по 5 товаров)
+    CREATE_USER = False  # пользователя создает /start
+
+    async def test_flow_within_budget(self):
+        with open(BUDGET_PATH, encoding='utf-8') as f:
+            budget = json.load(f)
+        runner = FlowRunner(self.TG_ID)
+        await shop_flow(runner.step, runner.updates,
+                        self.category_id, self.subcategory_id)
+        self.assertEqual(list(runner.results), list(budget))
+        for step, counts in runner.results.items():
+            for metric in METRICS:
+                with self.subTest(step=step, metric=metric):
+                    self.assertLessEqual(counts[metric], budget[step][metric])
@@ -0,0 +1,126 @@
+from decimal import Decimal
+
+from bot_api.payments.services import PaymentNotification, handle_notification
+from bot_worker.payments.handlers import worker
+from fixtures import PaymentTestCase
+from metrics import PAYMENT_ANOMALIES
+from models import OrderStatus
+from settings import db
+
+
+class PaymentTests(PaymentTestCase):
+    TG_ID = 8_100_000_000_002
+    PORT = 8093
+
+    async def notify(self, payment_id: str) -> str:
+        async with db.unit_of_work():
+            return await handle_notification(
+                PaymentNotification(**self.yookassa.notification(payment_id))
+            )
+
+    async def replaced_payment(self) -> str:
+        """Успешный платеж, который заказ уже заменил новым"""
+        async with db.unit_of_work():
+            payment_id, _ = await worker.payment_link(self.order_id, Decimal('300.00'),
+                                                      None)
+            await db.set_order_payment_id(self.order_id, 'next-payment')
+        self.yookassa.set_status(payment_id, 'succeeded')
+        return payment_id
+
+    async def test_replaced_payment_pays_order(self):
+        payment_id = await self.replaced_payment()
+        self.assertEqual(await self.notify(payment_id), 'paid')
+        self.assertEqual((await self.order()).status, OrderStatus.PAID)
+        self.notify_user.assert_awaited_once_with(self.order_id, self.TG_ID, True)
+        # повторное уведомление ничего не меняет
+        self.assertEqual(await self.notify(payment_id), 'duplicate')
+        self.notify_user.assert_awaited_once()
+
+    async def test_replaced_payment_amount_mismatch(self):
+        payment_id = await self.replaced_payment()
+        self.yookassa.payments[payment_id]['amount']['value'] = '1.00'
+        before = PAYMENT_ANOMALIES._values.get(('mismatch',), 0)
+        self.assertEqual(await self.notify(payment_id), 'mismatch')
+        self.assertEqual((await self.order()).status, OrderStatus.NOT_PAID)
+        self.assertEqual(PAYMENT_ANOMALIES._values[('mismatch',)], before + 1)
+        self.notify_user.assert_not_awaited()
+
+    async def test_second_payment_is_double_charge(self):
+        """Оплаченный заказ оплачен еще раз другим платежом"""
+        first = await self.replaced_payment()
+        self.assertEqual(await self.notify(first), 'paid')
+        yookassa = await worker.create_payment(self.order_id, Decimal('301.00'))
+        self.yookassa.set_status(yookassa.id, 'succeeded')
+        # второй платеж на ту же сумму заказа, но с другим ключом
+        self.yookassa.payments[yookassa.id]['amount']['value'] = '300.00'
+        before = PAYMENT_ANOMALIES._values.get(('double_charge',), 0)
+        self.assertEqual(await self.notify(yookassa.id), 'double_charge')
+        self.assertEqual(PAYMENT_ANOMALIES._values[('double_charge',)], before + 1)
+        self.notify_user.assert_awaited_once()
+
+    async def test_link_for_succeeded_payment(self):
+        """Платеж по ключу заказа уже оплачен: заказ оплачивается, ссылки нет"""
+        yookassa = await worker.create_payment(self.order_id, Decimal('300.00'))
+        self.yookassa.set_status(yookassa.id, 'succeeded')
+        async with db.unit_of_work():
+            link = await worker.payment_link(self.order_id, Decimal('300.00'), None)
+        self.assertIsNone(link)
+        self.assertEqual((await self.order()).status, OrderStatus.PAID)
+        self.notify_user.assert_awaited_once_with(self.order_id, self.TG_ID, True)
+        self.assertEqual(self.yookassa.calls['create'], 2)  # новый платеж не создан
+        self.assertEqual(len(self.yookassa.payments), 1)
+
+    async def test_link_for_canceled_payment(self):
+        """Отмененный платеж по ключу заказа заменяется новым"""
+        yookassa = await worker.create_payment(self.order_id, Decimal('300.00'))
+        self.yookassa.set_status(yookassa.id, 'canceled')
+        async with db.unit_of_work():
+            payment_id, _ = await worker.payment_link(self.order_id,
+                                                      Decimal('300.00'), None)
+        self.assertNotEqual(payment_id, yookassa.id)
+        order = await self.order()
+        self.assertEqual((order.status, order.payment_id),
+                         (OrderStatus.NOT_PAID, payment_id))
+        self.notify_user.assert_not_awaited()
+
+    async def test_link_after_repeated_cancellations(self):
+        """
+        Отмены, еще не записанные сверкой: каждая сдвигает ключ заказа,
+        четвертая попытка не блокируется и не проходит всю цепочку ключей
+        """
+        canceled = []
+        for attempt in range(4):
+            order = await self.order()
+            creates = self.yookassa.calls['create']
+            # промах кеша ссылок: другой процесс или истекший TTL
+            worker.links.clear()
+            async with db.unit_of_work():
+                payment_id, _ = await worker.payment_link(
+                    self.order_id, Decimal('300.00'), order.payment_id,
+                    order.canceled_payment_id
+                )
+            self.assertNotIn(payment_id, canceled)
+            # отмененный платеж по прежнему ключу и новый платеж
+            self.assertLessEqual(self.yookassa.calls['create'] - creates, 2)
+            if attempt < 3:
+                self.yookassa.set_status(payment_id, 'canceled')
+                canceled.append(payment_id)
+        self.assertEqual((await self.order()).canceled_payment_id, canceled[-1])
+
+    async def test_link_after_settled_cancellation(self):
+        """Отмена, записанная уведомлением, дает новый ключ сразу"""
+        async with db.unit_of_work():
+            payment_id, _ = await worker.payment_link(self.order_id,
+                                                      Decimal('300.00'), None)
+        self.yookassa.set_status(payment_id, 'canceled')
+        self.assertEqual(await self.notify(payment_id), 'canceled')
+        order = await self.order()
+        self.assertEqual(order.canceled_payment_id, payment_id)
+        creates = self.yookassa.calls['create']
+        async with db.unit_of_work():
+            next_id, _ = await worker.payment_link(
+                self.order_id, Decimal('300.00'), order.payment_id,
+                order.canceled_payment_id
+            )
+        self.assertNotEqual(next_id, payment_id)
+        self.assertEqual(self.yookassa.calls['create'] - creates, 1)
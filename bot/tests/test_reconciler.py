@@ -0,0 +1,125 @@
+from decimal import Decimal
+
+from sqlalchemy import func, select, update
+
+from bot_worker.payments.handlers import worker
+from bot_worker.payments.reconciler import PaymentReconciler
+from fixtures import PaymentTestCase
+from metrics import PAYMENT_ANOMALIES
+from models import OrderStatus, Payment
+from settings import db
+
+
+class ReconcilerTests(PaymentTestCase):
+    TG_ID = 8_100_000_000_003
+    PORT = 8094
+
+    async def asyncSetUp(self):
+        async with db.get_session() as session:
+            foreign = (await session.execute(
+                select(func.count()).select_from(Payment))).scalar()
+        if foreign:
+            await db.engine.dispose()
+            self.skipTest('orders_payment не пуст: сверка изменила бы чужие '
+                          'платежи, нужна отдельная тестовая БД')
+        await super().asyncSetUp()
+
+    def reconciler(self) -> PaymentReconciler:
+        """Новый экземпляр, как после перезапуска: состояние только в БД"""
+        instance = PaymentReconciler(db, worker)
+        instance.min_delay = 10
+        return instance
+
+    async def new_payment(self, value: str, check_after: float = 0) -> str:
+        yookassa = await worker.create_payment(self.order_id, Decimal(value))
+        async with db.unit_of_work():
+            await db.set_order_payment_id(self.order_id, yookassa.id, check_after)
+        return yookassa.id
+
+    async def payments(self) -> dict[str, int]:
+        async with db.get_session() as session:
+            rows = await session.execute(
+                select(Payment.payment_id, Payment.checks)
+                .where(Payment.order_id == self.order_id)
+            )
+            return dict(rows.all())
+
+    async def test_replaced_payment_paid(self):
+        first = await self.new_payment('300.00')
+        second = await self.new_payment('301.00')
+        self.yookassa.set_status(first, 'succeeded')
+        result = await self.reconciler().reconcile()
+        self.assertEqual(result['paid'], 1)
+        self.assertEqual((await self.order()).status, OrderStatus.PAID)
+        self.notify_user.assert_awaited_once_with(self.order_id, self.TG_ID, True)
+        self.assertEqual(await self.payments(), {second: 1})
+
+    async def test_not_found_is_terminal(self):
+        async with db.unit_of_work():
+            await db.set_order_payment_id(self.order_id, 'unknown-payment')
+        result = await self.reconciler().reconcile()
+        self.assertEqual(result['missing'], 1)
+        self.assertEqual((await self.order()).payment_id, '')
+        self.assertEqual(await self.payments(), {})
+
+    async def test_expire_from_created_at(self):
+        payment_id = await self.new_payment('300.00')
+        async with db.get_session() as session:
+            await session.execute(
+                update(Payment).where(Payment.payment_id == payment_id)
+                .values(created_at=func.now() - func.make_interval(0, 0, 0, 2))
+            )
+        result = await self.reconciler().reconcile()
+        self.assertEqual(result['expired'], 1)
+        self.assertEqual((await self.order()).payment_id, '')
+        self.notify_user.assert_not_awaited()
+
+    async def test_only_due_payments(self):
+        payment_id = await self.new_payment('300.00', check_after=3600)
+        result = await self.reconciler().reconcile()
+        self.assertEqual(result['checked'], 0)
+        self.assertEqual(self.yookassa.calls['find'], 0)
+        self.assertEqual(await self.payments(), {payment_id: 0})
+
+    async def test_fresh_payments_first(self):
+        old = await self.new_payment('300.00')
+        fresh = await self.new_payment('301.00')
+        async with db.get_session() as session:
+            await session.execute(
+                update(Payment).where(Payment.payment_id == old).values(checks=5)
+            )
+        instance = self.reconciler()
+        instance.rate, instance.interval = 1, 1  # одна проверка за проход
+        result = await instance.reconcile()
+        self.assertEqual(result['checked'], 1)
+        self.assertEqual(await self.payments(), {old: 5, fresh: 1})
+
+    async def test_amount_mismatch_not_paid(self):
+        payment_id = await self.new_payment('300.00')
+        self.yookassa.set_status(payment_id, 'succeeded')
+        self.yookassa.payments[payment_id]['amount']['value'] = '1.00'
+        before = PAYMENT_ANOMALIES._values.get(('mismatch',), 0)
+        result = await self.reconciler().reconcile()
+        self.assertEqual(result['paid'], 0)
+        self.assertEqual((await self.order()).status, OrderStatus.NOT_PAID)
+        self.assertEqual(PAYMENT_ANOMALIES._values[('mismatch',)], before + 1)
+        self.assertEqual(await self.payments(), {})
+        self.notify_user.assert_not_awaited()
+
+    async def test_double_charge(self):
+        first = await self.new_payment('300.00')
+        second = await self.new_payment('301.00')
+        async with db.unit_of_work():
+            await db.set_order_payment_id(self.order_id, second)
+        self.yookassa.set_status(first, 'succeeded')
+        self.yookassa.set_status(second, 'succeeded')
+        # второй платеж на ту же сумму заказа, но с другим ключом
+        self.yookassa.payments[second]['amount']['value'] = '300.00'
+        before = PAYMENT_ANOMALIES._values.get(('double_charge',), 0)
+        result = await self.reconciler().reconcile()
+        self.assertEqual(result['paid'], 1)
+        order = await self.order()
+        self.assertEqual(order.status, OrderStatus.PAID)
+        self.assertEqual(PAYMENT_ANOMALIES._values[('double_charge',)], before + 1)
+        self.assertEqual(await self.payments(), {})
+        self.notify_user.assert_awaited_once()
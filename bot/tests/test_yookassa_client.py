@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from aiohttp import ClientTimeout, web
+from aiohttp.test_utils import TestServer
+from yookassa.domain.exceptions import (ApiError, BadRequestError, NotFoundError,
+                                        TooManyRequestsError, UnauthorizedError)
+
+from bot_worker.payments.client import YooKassaClient
+
+PAYMENT = {'id': 'payment-1', 'status': 'pending', 'paid': False,
+           'amount': {'value': '300.00', 'currency': 'RUB'}}
+
+
+class YooKassaClientTests(unittest.IsolatedAsyncioTestCase):
+    """YooKassaClient против локального aiohttp-сервера с заданными ответами"""
+
+    async def asyncSetUp(self):
+        # ответы сервера по порядку: (статус, тело) или секунды задержки
+        self.responses: list = []
+        self.requests: list[web.Request] = []
+        app = web.Application()
+        app.router.add_route('*', '/v3/{tail:.*}', self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.client = YooKassaClient()
+        self.client.base_url = str(self.server.make_url('/v3'))
+        self.client.timeout = ClientTimeout(total=0.5)
+        self.client.retries = 2
+        # без пауз между повторами
+        self.jitter = mock.patch('random.uniform', return_value=0)
+        self.jitter.start()
+
+    async def asyncTearDown(self):
+        self.jitter.stop()
+        await self.client.close()
+        await self.server.close()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests.append(request)
+        response = self.responses.pop(0) if self.responses else (200, PAYMENT)
+        if isinstance(response, float):
+            await asyncio.sleep(response)
+            response = (200, PAYMENT)
+        status, body = response
+        if isinstance(body, str):
+            return web.Response(status=status, text=body)
+        return web.json_response(body, status=status)
+
+    def keys(self) -> list:
+        return [request.headers.get('Idempotence-Key') for request in self.requests]
+
+    async def test_retry_on_5xx_reuses_idempotence_key(self):
+        self.responses = [(500, {'code': 'internal_server_error'}),
+                          (503, '<html>Service Unavailable</html>')]
+        payment = await self.client.create_payment({'amount': PAYMENT['amount']},
+                                                   'order:1')
+        self.assertEqual(payment.id, 'payment-1')
+        self.assertEqual(self.keys(), ['order:1'] * 3)
+
+    async def test_retry_on_timeout_reuses_idempotence_key(self):
+        self.responses = [2.0]  # дольше таймаута клиента
+        payment = await self.client.create_payment({'amount': PAYMENT['amount']})
+        self.assertEqual(payment.id, 'payment-1')
+        keys = self.keys()
+        self.assertEqual(len(keys), 2)
+        self.assertIsNotNone(keys[0])
+        self.assertEqual(keys[0], keys[1])
+
+    async def test_retry_after_processing(self):
+        self.responses = [(202, {'type': 'processing', 'retry_after': 10})]
+        payment = await self.client.find_payment('payment-1')
+        self.assertEqual(payment.status, 'pending')
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_retries_exhausted(self):
+        self.responses = [(500, {})] * 3
+        with self.assertRaises(ApiError):
+            await self.client.find_payment('payment-1')
+        self.assertEqual(len(self.requests), 3)
+
+    async def test_timeouts_exhausted(self):
+        self.responses = [2.0] * 3
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.client.find_payment('payment-1')
+        self.assertEqual(len(self.requests), 3)
+
+    async def test_error_mapping(self):
+        cases = [(400, BadRequestError), (401, UnauthorizedError),
+                 (404, NotFoundError), (409, ApiError)]
+        for status, error in cases:
+            with self.subTest(status=status):
+                self.requests.clear()
+                self.responses = [(status, {'type': 'error', 'code': 'error'})]
+                with self.assertRaises(error) as raised:
+                    await self.client.find_payment('payment-1')
+                self.assertIs(type(raised.exception), error)
+                self.assertEqual(len(self.requests), 1)  # без повтора
+
+    async def test_too_many_requests_after_retries(self):
+        self.responses = [(429, {'code': 'too_many_requests'})] * 3
+        with self.assertRaises(TooManyRequestsError):
+            await self.client.cancel_payment('payment-1', 'cancel:1')
+        self.assertEqual(self.keys(), ['cancel:1'] * 3)
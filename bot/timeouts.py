@@ -0,0 +1,69 @@
+import os
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True, slots=True)
+class QueryClass:
+    """
+    Класс запросов с бюджетом времени: statement_timeout и lock_timeout
+    Postgres (мс) на транзакцию и общий дедлайн вызова в asyncio (с).
+    """
+    name: str
+    statement_ms: int
+    lock_ms: int
+    deadline: float
+
+
+class DBTimeout(Exception):
+    """Вызов БД не уложился в бюджет своего класса запросов"""
+
+    def __init__(self, query_class: str):
+        super().__init__(f'DB timeout: {query_class}')
+        self.query_class = query_class
+
+
+# query_canceled (statement_timeout) и lock_not_available (lock_timeout)
+TIMEOUT_SQLSTATES = ('57014', '55P03')
+
+# значения по умолчанию: statement_ms, lock_ms, deadline
+DEFAULT_CLASSES = {
+    'read': (2000, 1000, 3),       # чтение данных пользователя
+    'catalog': (1000, 1000, 2),    # каталог - при таймауте отдается кеш
+    'write': (3000, 1000, 5),      # корзина, заказы
+    'bulk': (60000, 1000, 90),     # рассылка, прогрев кеша
+}
+# класс, чьи таймауты заданы на соединении (server_settings):
+# для него SET LOCAL не нужен
+BASELINE = 'read'
+
+
+def load_query_classes() -> dict[str, QueryClass]:
+    """Классы запросов; переопределение: DB_TIMEOUT_WRITE=3000,1000,5"""
+    classes = {}
+    for name, default in DEFAULT_CLASSES.items():
+        value = os.getenv(f'DB_TIMEOUT_{name.upper()}')
+        statement_ms, lock_ms, deadline = (
+            value.split(',') if value else default
+        )
+        classes[name] = QueryClass(name, int(statement_ms), int(lock_ms),
+                                   float(deadline))
+    return classes
+
+
+QUERY_CLASSES = load_query_classes()
+
+query_class_ctx: ContextVar[Optional[QueryClass]] = ContextVar('query_class',
+                                                                default=None)
+
+
+def current_query_class() -> Optional[QueryClass]:
+    return query_class_ctx.get()
+
+
+def server_settings() -> dict:
+    """Таймауты по умолчанию для новых соединений (класс BASELINE)"""
+    baseline = QUERY_CLASSES[BASELINE]
+    return {'statement_timeout': str(baseline.statement_ms),
+            'lock_timeout': str(baseline.lock_ms)}
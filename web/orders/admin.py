@@ -19,7 +19,8 @@ def export_paid_orders(modeladmin, request, queryset):
     и у модели Order есть related_name 'items' для OrderItem.
     """
     # Фильтрация оплаченных заказов
-    paid_orders = queryset.filter(status='Оплачен')
+    paid_orders = queryset.filter(status='Оплачен') \
+        .select_related('user').prefetch_related('items__product')
     if not paid_orders.exists():
         modeladmin.message_user(request, "Нет оплаченных заказов для экспорта.")
         return
@@ -42,7 +43,7 @@ def export_paid_orders(modeladmin, request, queryset):
                order.delivery,
                order.status,
                "\n".join(str(item) for item in order.items.all()),
-               order.get_total_for_order()]
+               order.total]
         ws.append(row)
 
     output = BytesIO()  # объект для временного сохранения данных в байтах
@@ -72,5 +73,12 @@ class OrderItemInline(admin.TabularInline):  # или StackedInline
 class OrderAdmin(admin.ModelAdmin):
     """Регистрация ордера и задание инлайн модели для вывода"""
     inlines = [OrderItemInline]
-    exclude = ('payment_id',)
+    exclude = ('payment_id', 'canceled_payment_id')
+    list_display = ('id', 'user', 'status', 'items_count', 'total')
+    readonly_fields = ('items_count', 'total')
     actions = [export_paid_orders]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # позиции сохранены, сумма заказа пересчитывается по ним
+        form.instance.update_totals()
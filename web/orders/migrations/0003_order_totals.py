@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12,
+                                      verbose_name='Сумма'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Товаров'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, default=0,
+                                      max_digits=10, verbose_name='Цена'),
+            preserve_default=False,
+        ),
+        # существующие заказы: цены позиций берутся из текущего каталога
+        migrations.RunSQL(
+            sql="""
+                UPDATE orders_orderitem oi SET price = p.price
+                FROM products_product p WHERE p.id = oi.product_id;
+                UPDATE orders_order o SET total = s.total, items_count = s.items_count
+                FROM (SELECT order_id, SUM(price * quantity) AS total,
+                             SUM(quantity) AS items_count
+                      FROM orders_orderitem GROUP BY order_id) s
+                WHERE o.id = s.order_id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
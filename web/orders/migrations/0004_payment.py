@@ -0,0 +1,41 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('payment_id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('checks', models.PositiveIntegerField(default=0)),
+                ('check_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='orders.order')),
+            ],
+            options={
+                'verbose_name': 'Платеж',
+                'verbose_name_plural': 'Платежи',
+                'db_table': 'orders_payment',
+                'indexes': [models.Index(fields=['checks', 'check_at'], name='payment_due_idx')],
+            },
+        ),
+        # незавершенные платежи существующих заказов проверяются сразу
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO orders_payment (payment_id, order_id, created_at,
+                                            checks, check_at)
+                SELECT payment_id, id, now(), 0, now() FROM orders_order
+                WHERE status = 'Не оплачен'
+                  AND payment_id IS NOT NULL AND payment_id <> ''
+                ON CONFLICT DO NOTHING;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
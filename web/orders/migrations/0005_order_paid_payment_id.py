@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_payment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='paid_payment_id',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='Оплачен платежом'),
+        ),
+    ]
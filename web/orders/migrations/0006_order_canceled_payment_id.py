@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_paid_payment_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='canceled_payment_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -2,6 +2,7 @@ from decimal import Decimal, ROUND_HALF_UP
 from typing import cast
 
 from django.db import models
+from django.utils import timezone
 from users.models import User
 from products.models import Product
 
@@ -13,6 +14,11 @@ class Order(models.Model):
                              null=False)
     delivery = models.TextField(default='Самовывоз', null=False)
     payment_id = models.CharField(max_length=255, null=True)
+    # платеж, которым оплачен заказ: другой успешный платеж - двойная оплата
+    paid_payment_id = models.CharField(max_length=255, null=True, blank=True,
+                                       verbose_name='Оплачен платежом')
+    # последний отмененный платеж: из него выводится ключ следующего платежа
+    canceled_payment_id = models.CharField(max_length=255, null=True, blank=True)
     ORDER_STATUS_CHOICES = [('Не оплачен', 'Не оплачен'),
                             ('Оплачен', 'Оплачен'),
                             ('Выполнен', 'Выполнен'), ]
@@ -20,6 +26,11 @@ class Order(models.Model):
                               choices=ORDER_STATUS_CHOICES,
                               default='Не оплачен',
                               null=False)
+    # снимок на момент оформления: изменение цен в каталоге их не меняет
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0,
+                                null=False, verbose_name='Сумма')
+    items_count = models.PositiveIntegerField(default=0, null=False,
+                                              verbose_name='Товаров')
 
     def __str__(self):
         return f"Order #{self.id} - User {self.user.tg_id}"  # type: ignore
@@ -28,11 +39,27 @@ class Order(models.Model):
         db_table = 'orders_order'
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        indexes = [
+            # заказы пользователя с фильтром по статусу
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            # заказы с незавершенным платежом (после оплаты payment_id пустой)
+            models.Index(fields=['payment_id'], name='order_payment_id_idx',
+                         condition=models.Q(payment_id__isnull=False)
+                         & ~models.Q(payment_id='')),
+        ]
 
     def get_total_for_order(self):
-        total = sum(item.get_total_for_orderitem() for item in self.items.all())  # type: ignore
-        total_dec = Decimal(total)
-        return total_dec.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        return self.total
+
+    def update_totals(self):
+        """Пересчет суммы и числа товаров по позициям (после правки в админке)"""
+        total, items_count = Decimal(0), 0
+        for item in self.items.all():  # type: ignore
+            total += item.get_total_for_orderitem()
+            items_count += item.quantity
+        self.total = total.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        self.items_count = items_count
+        self.save(update_fields=['total', 'items_count'])
 
 
 class OrderItem(models.Model):
@@ -42,20 +69,56 @@ class OrderItem(models.Model):
                               null=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=False)
     quantity = models.PositiveIntegerField(default=1, null=False)
+    # цена за единицу на момент оформления заказа
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=False,
+                                blank=True, verbose_name='Цена')
+
+    def save(self, *args, **kwargs):
+        if self.price is None:
+            prod = cast(Product, self.product)
+            self.price = prod.price
+        super().save(*args, **kwargs)
 
     def get_total_for_orderitem(self):
         quantity_val = int(getattr(self, 'quantity'))  # иначе интерпретатор ругается
-        prod = cast(Product, self.product)
-        total_dec = Decimal(quantity_val * prod.price)
+        total_dec = Decimal(quantity_val * self.price)
         return total_dec.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
     def __str__(self):
-        prod = cast(Product, self.product)
         total = self.get_total_for_orderitem()
         return (f"{self.product.name}: "
                 f"количество - {self.quantity}, "
-                f"цена - {prod.price}, "
+                f"цена - {self.price}, "
                 f"сумма - {total}")
 
     class Meta:
         db_table = 'orders_orderitem'
+
+
+class Payment(models.Model):
+    """
+    Платеж YooKassa, итог которого еще не известен. Бот проверяет такие
+    платежи фоновой сверкой (check_at - время следующей проверки) и удаляет
+    строку, когда платеж оплачен, отменен или просрочен. Платеж остается
+    здесь, даже если заказ уже получил новый payment_id.
+    """
+    payment_id = models.CharField(max_length=255, primary_key=True)
+    order = models.ForeignKey(Order,
+                              on_delete=models.CASCADE,
+                              related_name='payments',
+                              null=False)
+    created_at = models.DateTimeField(default=timezone.now, null=False)
+    checks = models.PositiveIntegerField(default=0, null=False)
+    check_at = models.DateTimeField(default=timezone.now, null=False)
+
+    def __str__(self):
+        return f"Payment {self.payment_id} - Order #{self.order_id}"  # type: ignore
+
+    class Meta:
+        db_table = 'orders_payment'
+        verbose_name = "Платеж"
+        verbose_name_plural = "Платежи"
+        indexes = [
+            # выборка сверки: сначала платежи с меньшим числом проверок
+            models.Index(fields=['checks', 'check_at'], name='payment_due_idx'),
+        ]
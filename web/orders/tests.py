@@ -1,3 +1,152 @@
+import json
+
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from orders.models import Order, OrderItem
+from products.models import Category, Product, SubCategory
+from users.models import Cart, CartItem, User
+
+# форма запросов бота (bot/db.py, bot/fast_reads.py) в виде SQL: тест проверяет,
+# что миграции создают индексы для этих условий, а не сами запросы бота -
+# выполняемые ботом запросы перехватывает и проверяет python -m benchmarks.explain
+BOT_QUERIES = {
+    'user_by_tg_id': """
+        SELECT u.id, c.id FROM users_user u
+        LEFT JOIN users_cart c ON c.user_id = u.id
+        WHERE u.tg_id = %(tg_id)s
+    """,
+    'subcategories': """
+        SELECT id, name FROM products_subcategory WHERE category_id = %(category_id)s
+    """,
+    'products_page': """
+        SELECT p.id, p.name, p.price, COALESCE(ci.quantity, 0)
+        FROM products_product p
+        LEFT JOIN users_cartitem ci
+               ON ci.product_id = p.id AND ci.cart_id = %(cart_id)s
+        WHERE p.subcategory_id = %(subcategory_id)s
+        ORDER BY p.id
+    """,
+    'cart_items': """
+        SELECT p.id, p.name, p.price, ci.quantity
+        FROM users_cartitem ci
+        JOIN products_product p ON p.id = ci.product_id
+        WHERE ci.cart_id = %(cart_id)s
+    """,
+    'cart_item': """
+        SELECT id, quantity FROM users_cartitem
+        WHERE cart_id = %(cart_id)s AND product_id = %(product_id)s
+    """,
+    'orders_by_user': """
+        SELECT id, status, payment_id, total, items_count
+        FROM orders_order WHERE user_id = %(user_id)s
+    """,
+    'orders_by_user_status': """
+        SELECT id FROM orders_order
+        WHERE user_id = %(user_id)s AND status = 'Не оплачен'
+    """,
+    'order_by_id': """
+        SELECT id, status, payment_id, total, items_count
+        FROM orders_order WHERE id = %(order_id)s
+    """,
+    'settle_payments': """
+        SELECT id FROM orders_order
+        WHERE payment_id IN ('p1', 'p2') AND status = 'Не оплачен'
+    """,
+    'due_payments': """
+        SELECT payment_id, order_id, checks FROM orders_payment
+        WHERE check_at <= now() ORDER BY checks, check_at LIMIT 25
+    """,
+}
+
+
+def seq_scans(plan: dict) -> list[str]:
+    """Таблицы, которые план читает последовательным сканированием"""
+    tables = []
+    if plan['Node Type'] == 'Seq Scan':
+        tables.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        tables.extend(seq_scans(child))
+    return tables
+
+
+class BotQueryPlanTests(TestCase):
+    """
+    Для условий, по которым читает бот (BOT_QUERIES), в миграциях есть индексы.
+    Последовательное сканирование запрещено (enable_seqscan = off): если
+    подходящего индекса нет, Seq Scan все равно останется в плане и тест упадет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Категория')
+        subcategories = SubCategory.objects.bulk_create(
+            SubCategory(name=f'Подкатегория {i}', category=category) for i in range(20)
+        )
+        products = Product.objects.bulk_create(
+            Product(category=category, subcategory=subcategories[i % 20],
+                    name=f'Товар {i}', price=i + 1) for i in range(2000)
+        )
+        users = User.objects.bulk_create(
+            User(tg_id=1_000_000 + i, first_name=f'Имя {i}') for i in range(500)
+        )
+        carts = Cart.objects.bulk_create(Cart(user=user) for user in users)
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=products[(i * 7 + j) % 2000], quantity=1)
+            for i, cart in enumerate(carts) for j in range(3)
+        )
+        orders = Order.objects.bulk_create(
+            Order(user=users[i % 500], status='Выполнен', payment_id='',
+                  total=2 * (i + 1), items_count=2)
+            for i in range(2000)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=products[i % 2000], quantity=2,
+                      price=products[i % 2000].price)
+            for i, order in enumerate(orders)
+        )
+        with connection.cursor() as cursor:
+            for table in ('products_subcategory', 'products_product', 'users_user',
+                          'users_cart', 'users_cartitem', 'orders_order',
+                          'orders_orderitem'):
+                cursor.execute(f'ANALYZE {table}')
+        cls.params = {'tg_id': users[0].tg_id,
+                      'category_id': category.id,
+                      'subcategory_id': subcategories[0].id,
+                      'cart_id': carts[0].id,
+                      'product_id': products[0].id,
+                      'user_id': users[0].id,
+                      'order_id': orders[0].id}
+
+    def test_no_seq_scans(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, sql in BOT_QUERIES.items():
+                with self.subTest(query=name):
+                    cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', self.params)
+                    plan = cursor.fetchone()[0]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    self.assertEqual(seq_scans(plan[0]['Plan']), [])
+
+
+class OrderTotalsTests(TestCase):
+    """Сумма заказа - снимок цен на момент оформления"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Категория')
+        subcategory = SubCategory.objects.create(name='Подкатегория', category=category)
+        self.product = Product.objects.create(category=category, subcategory=subcategory,
+                                              name='Товар', price='100.00')
+        self.order = Order.objects.create(user=User.objects.create(tg_id=1, first_name='Имя'))
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=3)
+        self.order.update_totals()
+
+    def test_price_snapshot(self):
+        self.product.price = '250.00'
+        self.product.save()
+        self.order.refresh_from_db()
+        item = self.order.items.get()
+        self.assertEqual(str(item.price), '100.00')
+        self.assertEqual(str(self.order.total), '300.00')
+        self.assertEqual(self.order.items_count, 3)
@@ -53,3 +53,7 @@ class Product(models.Model):
         db_table = 'products_product'
         verbose_name = "Продукт"
         verbose_name_plural = "Продукты"
+        indexes = [
+            # страницы товаров подкатегории по порядку id
+            models.Index(fields=['subcategory', 'id'], name='product_subcat_id_idx'),
+        ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        # дубли (cart, product) сливаются в одну строку с суммарным количеством
+        migrations.RunSQL(
+            sql="""
+                UPDATE users_cartitem AS keep
+                SET quantity = dup.quantity
+                FROM (SELECT MAX(id) AS id, SUM(quantity) AS quantity
+                      FROM users_cartitem
+                      GROUP BY cart_id, product_id
+                      HAVING COUNT(*) > 1) AS dup
+                WHERE keep.id = dup.id;
+                DELETE FROM users_cartitem AS a
+                USING users_cartitem AS b
+                WHERE a.cart_id = b.cart_id
+                  AND a.product_id = b.product_id
+                  AND a.id < b.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'),
+                                               name='cartitem_cart_product_uniq'),
+        ),
+    ]
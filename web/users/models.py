@@ -49,6 +49,11 @@ class CartItem(models.Model):
 
     class Meta:
         db_table = 'users_cartitem'
+        # один товар - одна строка корзины (выборка и upsert по паре)
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'],
+                                    name='cartitem_cart_product_uniq'),
+        ]
 
 
 class Broadcast(models.Model):
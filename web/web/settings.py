@@ -60,12 +60,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'web.sql_profiler.SqlProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'web.urls'
 
 BOT_BROADCAST_URL = "http://bot:8001/api/broadcast/"
 
+# Профилирование SQL: доля профилируемых запросов и порог N+1 (web/sql_profiler.py)
+SQL_PROFILE_SAMPLE = float(os.getenv('SQL_PROFILE_SAMPLE', 0.05))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -0,0 +1,113 @@
+"""
+Профилировщик SQL для веб-админки: задержка и число строк по каждому запросу,
+число запросов на HTTP-запрос и поиск N+1 (один и тот же запрос
+SQL_N_PLUS_ONE_THRESHOLD и более раз за HTTP-запрос).
+Профилируется доля SQL_PROFILE_SAMPLE запросов.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connection
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+_whitespace = re.compile(r'\s+')
+_lock = threading.Lock()
+
+# statement -> [количество, суммарно мс, максимум мс, строк]
+statements: dict[str, list] = {}
+# view -> [HTTP-запросов, SQL-запросов]
+requests_stats: dict[str, list] = {}
+n_plus_one: deque = deque(maxlen=100)
+
+
+class QueryRecorder:
+    """Обертка connection.execute_wrapper, собирающая запросы одного HTTP-запроса"""
+
+    def __init__(self):
+        self.statements: dict[str, list] = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            rows = max(context['cursor'].rowcount, 0)
+            item = self.statements.setdefault(_whitespace.sub(' ', sql).strip(),
+                                              [0, 0.0, 0.0, 0])
+            item[0] += 1
+            item[1] += elapsed_ms
+            item[2] = max(item[2], elapsed_ms)
+            item[3] += rows
+
+
+def _collect(label: str, recorder: QueryRecorder) -> None:
+    threshold = settings.SQL_N_PLUS_ONE_THRESHOLD
+    with _lock:
+        counters = requests_stats.setdefault(label, [0, 0])
+        counters[0] += 1
+        counters[1] += sum(item[0] for item in recorder.statements.values())
+        for sql, (count, total_ms, max_ms, rows) in recorder.statements.items():
+            total = statements.setdefault(sql, [0, 0.0, 0.0, 0])
+            total[0] += count
+            total[1] += total_ms
+            total[2] = max(total[2], max_ms)
+            total[3] += rows
+            if count >= threshold:
+                n_plus_one.append({'label': label, 'statement': sql,
+                                   'count': count, 'ms': round(total_ms, 2)})
+                logger.warning('N+1 в %s: %s x %s', label, count, sql)
+
+
+class SqlProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SQL_PROFILE_SAMPLE:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        match = request.resolver_match
+        _collect(match.view_name if match else request.path, recorder)
+        return response
+
+
+@staff_member_required
+def sql_report(request):
+    """Отчет профилировщика (?top=N), ?reset=1 - сброс статистики"""
+    top = int(request.GET.get('top', 20))
+    with _lock:
+        report = {
+            'sample_rate': settings.SQL_PROFILE_SAMPLE,
+            'statements': [
+                {'statement': sql,
+                 'count': count,
+                 'total_ms': round(total_ms, 2),
+                 'avg_ms': round(total_ms / count, 3),
+                 'max_ms': round(max_ms, 2),
+                 'rows': rows}
+                for sql, (count, total_ms, max_ms, rows)
+                in sorted(statements.items(), key=lambda item: item[1][1],
+                          reverse=True)[:top]
+            ],
+            'statements_per_request': {
+                label: round(queries / count, 2)
+                for label, (count, queries) in requests_stats.items()
+            },
+            'n_plus_one': list(n_plus_one),
+        }
+        if request.GET.get('reset'):
+            statements.clear()
+            requests_stats.clear()
+            n_plus_one.clear()
+    return JsonResponse(report, json_dumps_params={'ensure_ascii': False})
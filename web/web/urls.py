@@ -17,6 +17,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from web.sql_profiler import sql_report
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('debug/sql/', sql_report, name='sql_report'),
 ]